@@ -2,18 +2,118 @@ import streamlit as st
 import os
 import tempfile
 import shutil
+import time
 import pysrt
-from subtitle_processor import extract_subtitles, translate_subtitles, merge_subtitles
+from subtitle_processor import find_platform_subtitles
 from subtitle_processor import read_text_file, save_text_file, translate_text_content, create_subtitles_from_text
-from video_processor import process_video, download_video_from_url, auto_generate_subtitles
-from video_processor import extract_audio, generate_text_from_audio
+from video_processor import process_video, download_video_from_url, download_audio_from_url, prefetch_video_from_url
+from video_processor import extract_audio, generate_text_from_audio, soft_subtitle_output_path, render_style_preview
+from video_processor import progressive_preview_path, estimate_render_time, transcribe_url_streaming, save_segments_as_text
+from pipeline import translate_video, process_playlist
+from toolchain import get_toolchain_capabilities, is_whisper_available
+from asr_processor import get_default_asr_engine
+from fonts import warm_up_fonts, list_font_families
+from render_profiles import RENDER_PROFILES, DEFAULT_RENDER_PROFILE, get_profile_fps, calibrate_render_profiles
+from job_stats import blend_eta, daily_throughput
+from process_runner import job_context, cancel_sessions_except, reset_session
+from workspace import session_workspace, job_workspace, workspace_in_use, start_workspace_janitor
+from cache_utils import hash_key
+from contextlib import contextmanager
 import subprocess
 import traceback
 import json
 
+def get_session_id():
+    """获取当前Streamlit会话ID，不在Streamlit中运行时返回None"""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+        return ctx.session_id if ctx else None
+    except Exception:
+        return None
+
+def get_active_session_ids():
+    """
+    获取仍在连接的Streamlit会话ID列表，无法获取时返回None
+    使用的是 Streamlit 的内部接口（_session_mgr），升级 Streamlit 后可能不再存在；
+    返回None时清理线程只按使用时间判断（运行中的任务会定期刷新，见 workspace_in_use），也不终止任何进程
+    """
+    try:
+        from streamlit import runtime
+        return [info.session.id for info in runtime.get_instance()._session_mgr.list_active_sessions()]
+    except Exception:
+        return None
+
+def reap_abandoned_jobs():
+    """终止已关闭会话遗留的FFmpeg/yt-dlp/Whisper进程"""
+    active_ids = get_active_session_ids()
+    if active_ids is None:
+        return
+    for session_id in cancel_sessions_except(active_ids):
+        print(f"已终止会话 {session_id} 遗留的进程")
+
+# 渐进渲染开始多少秒后显示已写入部分的预览
+PROGRESSIVE_PREVIEW_DELAY = 5
+
+@contextmanager
+def tracked_job(text, preview_path=None):
+    """
+    显示进度条，并将期间启动的外部进程登记到当前会话（会话结束时自动终止）
+    提供 preview_path 时，渲染开始几秒后显示该分片文件已写入部分的预览
+    """
+    progress_bar = st.progress(0.0, text=text)
+    preview_slot = st.empty()
+    preview_shown = []
+    # 渲染前的耗时估算（见 show_render_estimate），用于修正刚开始渲染时不稳定的剩余时间
+    job = {'estimate': None, 'estimate_started': None}
+    
+    def on_progress(event):
+        message = event.get('label') or text
+        eta = event.get('eta')
+        if job['estimate'] is not None:
+            eta = blend_eta(job['estimate'], time.monotonic() - job['estimate_started'], event.get('percent'), eta)
+        if eta is not None:
+            message += f"，预计剩余 {format_seconds(eta)}"
+        if event.get('percent') is not None:
+            progress_bar.progress(min(event['percent'], 100.0) / 100.0, text=message)
+        if (preview_path and not preview_shown and event.get('elapsed', 0) >= PROGRESSIVE_PREVIEW_DELAY
+                and os.path.exists(preview_path) and os.path.getsize(preview_path) > 0):
+            preview_shown.append(True)
+            with preview_slot.container():
+                st.caption("渲染中，以下为已完成部分的预览")
+                st.video(preview_path)
+    
+    session_id = get_session_id()
+    reset_session(session_id)
+    try:
+        # 任务运行期间保持会话工作区为使用中，清理线程不会淘汰其中的文件
+        with workspace_in_use(session_workspace(session_id)), \
+                job_context(session_id=session_id, on_progress=on_progress):
+            yield job
+    finally:
+        progress_bar.empty()
+        preview_slot.empty()
+
+def format_seconds(seconds):
+    """将秒数格式化为“X 分 Y 秒”"""
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    return f"{minutes} 分 {seconds} 秒" if minutes else f"{seconds} 秒"
+
+def show_render_estimate(job, estimate):
+    """显示渲染前的耗时估算，并交给 tracked_job 作为剩余时间的参考"""
+    if estimate is None:
+        st.caption("本机暂无渲染记录，完成一次渲染后即可预估耗时")
+        return
+    job['estimate'] = estimate
+    job['estimate_started'] = time.monotonic()
+    st.info(f"预计渲染耗时约 {format_seconds(estimate)}")
+
 def main():
     st.set_page_config(page_title="视频字幕翻译工具", layout="wide")
     
+    # 清理已关闭会话遗留的进程
+    reap_abandoned_jobs()
+    
     # 添加自定义CSS，全面优化界面设计
     st.markdown("""
     <style>
@@ -365,6 +465,13 @@ font = "sans serif"
     
     st.title("视频字幕翻译工具")
     
+    # 探测ffmpeg、yt-dlp、whisper等工具链能力（每个进程只探测一次，结果缓存在磁盘上）
+    get_toolchain_capabilities()
+    # 后台预热 fontconfig 缓存和字体索引，首次渲染不再等待扫描系统字体
+    font_warm_up = warm_up_fonts()
+    # 后台定期清理过期的会话工作区，总大小超过配额时淘汰空闲会话中的音频和视频文件
+    start_workspace_janitor(get_active_session_ids)
+    
     # 初始化会话状态变量
     if 'audio_path' not in st.session_state:
         st.session_state.audio_path = None
@@ -378,43 +485,16 @@ font = "sans serif"
         st.session_state.translated_content = ""
     if 'video_path' not in st.session_state:
         st.session_state.video_path = None
-    if 'temp_dir' not in st.session_state:
-        # 创建固定临时目录
-        temp_dir = r'C:\Temp\video'
-        os.makedirs(temp_dir, exist_ok=True)
-        st.session_state.temp_dir = temp_dir
-    
-    # 用于存储API密钥的文件路径
-    api_keys_file = os.path.join(st.session_state.temp_dir, "api_keys.json")
+    # 每个会话使用独立的工作区，并发会话的中间文件互不覆盖（每次运行都会刷新使用时间）
+    st.session_state.temp_dir = session_workspace(get_session_id())
     
-    # 初始化API密钥存储
+    # API密钥只保存在当前会话的状态中（不写入磁盘，也不会预填到其他会话）；刷新页面后需要重新输入
     if 'api_keys' not in st.session_state:
-        # 尝试从文件加载保存的API密钥
-        if os.path.exists(api_keys_file):
-            try:
-                with open(api_keys_file, 'r', encoding='utf-8') as f:
-                    st.session_state.api_keys = json.load(f)
-            except Exception as e:
-                st.session_state.api_keys = {
-                    "baidu_appid": "",
-                    "baidu_secret_key": "",
-                    "openai_api_key": ""
-                }
-                print(f"加载API密钥文件失败: {e}")
-        else:
-            st.session_state.api_keys = {
-                "baidu_appid": "",
-                "baidu_secret_key": "",
-                "openai_api_key": ""
-            }
-    
-    # 保存API密钥到文件的函数
-    def save_api_keys():
-        try:
-            with open(api_keys_file, 'w', encoding='utf-8') as f:
-                json.dump(st.session_state.api_keys, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"保存API密钥失败: {e}")
+        st.session_state.api_keys = {
+            "baidu_appid": "",
+            "baidu_secret_key": "",
+            "openai_api_key": ""
+        }
     
     # 侧边栏-参数设置
     with st.sidebar:
@@ -435,12 +515,63 @@ font = "sans serif"
             "西班牙语": "es"
         }
         
+        # 同时生成的其他语言版本（共享一次解码）
+        extra_language_names = st.multiselect(
+            "同时生成其他语言版本",
+            options=[name for name in language_code if name != target_language],
+            default=[],
+            help="所有语言版本在一次解码中同时渲染；软字幕模式下作为多条字幕轨道封装到同一文件"
+        )
+        extra_languages = [language_code[name] for name in extra_language_names]
+        
         subtitle_position = st.radio(
             "字幕位置",
             options=["原字幕下方", "单独轨道"],
             index=0
         )
         
+        subtitle_mode_options = {
+            "烧录到画面": "burn",
+            "并行烧录（多核加速）": "parallel",
+            "智能烧录（仅重编码有字幕的片段）": "smart",
+            "软字幕轨道（不重新编码）": "soft"
+        }
+        subtitle_mode_display = st.radio(
+            "字幕嵌入方式",
+            options=list(subtitle_mode_options.keys()),
+            index=0,
+            help="并行烧录将长视频按关键帧分段后同时编码；软字幕直接复制视频和音频，只需几秒即可完成，但字幕样式由播放器决定"
+        )
+        subtitle_mode = subtitle_mode_options[subtitle_mode_display]
+        
+        # 渲染配置：编码速度与画质的取舍，显示本机实测的编码速度
+        profile_names = [name for name in RENDER_PROFILES if name != 'preview']
+        
+        def format_profile(name):
+            fps = get_profile_fps(name)
+            speed = f"，本机约 {fps:.0f} 帧/秒" if fps else ""
+            return f"{RENDER_PROFILES[name]['label']}{speed}"
+        
+        render_profile = st.selectbox(
+            "渲染配置",
+            options=profile_names,
+            index=profile_names.index(DEFAULT_RENDER_PROFILE),
+            format_func=format_profile,
+            help="草稿：720p、速度最快；标准：原分辨率；存档：画质最高、速度最慢（仅烧录模式有效）"
+        )
+        if st.button("测量本机编码速度"):
+            with st.spinner("正在编码测试视频..."):
+                calibrate_render_profiles(profile_names)
+            st.rerun()
+        
+        # 历史渲染吞吐量（百万像素帧/秒），便于发现性能退化
+        with st.expander("本机渲染统计", expanded=False):
+            throughput_rows = daily_throughput()
+            if throughput_rows:
+                st.dataframe(throughput_rows, hide_index=True)
+            else:
+                st.caption("暂无渲染记录")
+        
         api_choice = st.radio(
             "选择翻译API",
             options=["百度翻译 (免费)", "ChatGPT (需自备API密钥)"],
@@ -448,17 +579,17 @@ font = "sans serif"
         )
         
         if api_choice == "百度翻译 (免费)":
-            # 显示已保存的百度API密钥（如果有）
+            # 显示本次会话已记住的百度API密钥（如果有）
             saved_baidu_appid = st.session_state.api_keys.get("baidu_appid", "")
             saved_baidu_secret = st.session_state.api_keys.get("baidu_secret_key", "")
             
             # 显示保存状态
             if saved_baidu_appid and saved_baidu_secret:
-                st.success("已保存百度翻译API密钥")
-                show_saved = st.checkbox("使用已保存的密钥", value=True)
+                st.success("本次会话已记住百度翻译API密钥")
+                show_saved = st.checkbox("使用已记住的密钥", value=True)
                 
                 if show_saved:
-                    # 使用已保存的密钥
+                    # 使用已记住的密钥
                     baidu_appid = saved_baidu_appid
                     baidu_secret_key = saved_baidu_secret
                     
@@ -470,25 +601,23 @@ font = "sans serif"
                     baidu_appid = st.text_input("百度翻译APP ID", type="password", help="如需使用百度翻译API，请输入APP ID")
                     baidu_secret_key = st.text_input("百度翻译密钥", type="password", help="请输入百度翻译密钥")
                     
-                    # 保存新输入的密钥
+                    # 记住新输入的密钥
                     if baidu_appid and baidu_secret_key and (baidu_appid != saved_baidu_appid or baidu_secret_key != saved_baidu_secret):
                         st.session_state.api_keys["baidu_appid"] = baidu_appid
                         st.session_state.api_keys["baidu_secret_key"] = baidu_secret_key
-                        save_api_keys()
-                        st.success("API密钥已保存")
+                        st.success("已在本次会话中记住API密钥")
             else:
                 # 首次输入密钥
                 baidu_appid = st.text_input("百度翻译APP ID", type="password", help="如需使用百度翻译API，请输入APP ID")
                 baidu_secret_key = st.text_input("百度翻译密钥", type="password", help="请输入百度翻译密钥")
                 
-                # 保存新输入的密钥
+                # 记住新输入的密钥
                 if baidu_appid and baidu_secret_key:
-                    save_key = st.checkbox("保存密钥供下次使用", value=True)
+                    save_key = st.checkbox("在本次会话中记住密钥（不保存到服务器）", value=True)
                     if save_key:
                         st.session_state.api_keys["baidu_appid"] = baidu_appid
                         st.session_state.api_keys["baidu_secret_key"] = baidu_secret_key
-                        save_api_keys()
-                        st.success("API密钥已保存")
+                        st.success("已在本次会话中记住API密钥")
             
             openai_api_key = None
             
@@ -496,16 +625,16 @@ font = "sans serif"
                 st.warning("请填写百度翻译APP ID和密钥")
                 st.info("您可以在百度翻译开放平台获取API密钥，并确保将您的IP添加到白名单中")
         elif api_choice == "ChatGPT (需自备API密钥)":
-            # 显示已保存的OpenAI API密钥（如果有）
+            # 显示本次会话已记住的OpenAI API密钥（如果有）
             saved_openai_key = st.session_state.api_keys.get("openai_api_key", "")
             
             # 显示保存状态
             if saved_openai_key:
-                st.success("已保存OpenAI API密钥")
-                show_saved = st.checkbox("使用已保存的密钥", value=True)
+                st.success("本次会话已记住OpenAI API密钥")
+                show_saved = st.checkbox("使用已记住的密钥", value=True)
                 
                 if show_saved:
-                    # 使用已保存的密钥
+                    # 使用已记住的密钥
                     openai_api_key = saved_openai_key
                     
                     # 显示重新输入选项
@@ -515,22 +644,20 @@ font = "sans serif"
                     # 重新输入密钥
                     openai_api_key = st.text_input("OpenAI API密钥", type="password")
                     
-                    # 保存新输入的密钥
+                    # 记住新输入的密钥
                     if openai_api_key and openai_api_key != saved_openai_key:
                         st.session_state.api_keys["openai_api_key"] = openai_api_key
-                        save_api_keys()
-                        st.success("API密钥已保存")
+                        st.success("已在本次会话中记住API密钥")
             else:
                 # 首次输入密钥
                 openai_api_key = st.text_input("OpenAI API密钥", type="password")
                 
-                # 保存新输入的密钥
+                # 记住新输入的密钥
                 if openai_api_key:
-                    save_key = st.checkbox("保存密钥供下次使用", value=True)
+                    save_key = st.checkbox("在本次会话中记住密钥（不保存到服务器）", value=True)
                     if save_key:
                         st.session_state.api_keys["openai_api_key"] = openai_api_key
-                        save_api_keys()
-                        st.success("API密钥已保存")
+                        st.success("已在本次会话中记住API密钥")
             
             baidu_appid = None
             baidu_secret_key = None
@@ -539,6 +666,9 @@ font = "sans serif"
         with st.expander("字幕样式设置", expanded=False):
             # 字体选择
             font_options = ["Arial", "SimHei", "Microsoft YaHei", "SimSun", "KaiTi", "FangSong", "Times New Roman"]
+            # 项目字体目录中的字体（预热完成后才列出，避免阻塞页面）
+            if not font_warm_up.is_alive():
+                font_options += [f for f in list_font_families(managed_only=True) if f not in font_options]
             font = st.selectbox("字体", options=font_options, index=0)
             
             # 字体大小
@@ -612,7 +742,15 @@ font = "sans serif"
         
         auto_subtitle = st.checkbox("如无字幕，自动生成（需安装Whisper）", value=True)
         
-        output_path = st.text_input("输出视频保存路径", value=r"C:\Temp\video\output")
+        # 语音识别完成时限，设置后根据本机实测速度自动选择模型
+        asr_deadline_minutes = st.number_input(
+            "语音识别完成时限（分钟）",
+            min_value=0, max_value=240, value=0, step=1,
+            help="设置后将自动选择能在时限内完成的最准确模型，0表示使用默认模型"
+        )
+        asr_deadline = asr_deadline_minutes * 60 if asr_deadline_minutes else None
+        
+        output_path = st.text_input("输出视频保存路径", value=os.path.join(st.session_state.temp_dir, "output"))
         if not os.path.exists(output_path):
             try:
                 os.makedirs(output_path)
@@ -653,7 +791,11 @@ font = "sans serif"
                     baidu_secret_key if api_choice == "百度翻译 (免费)" else None,  # 传递secret_key
                     subtitle_position == "原字幕下方",
                     auto_subtitle,
-                    subtitle_style  # 传递字幕样式
+                    subtitle_style,  # 传递字幕样式
+                    asr_deadline=asr_deadline,
+                    subtitle_mode=subtitle_mode,
+                    extra_languages=extra_languages,
+                    render_profile=render_profile
                 )
             
             if st.button("开始提取音频"):
@@ -673,17 +815,42 @@ font = "sans serif"
             st.session_state.url_video_downloaded = False
         if 'last_video_url' not in st.session_state:
             st.session_state.last_video_url = ""
+        if 'last_url_audio_only' not in st.session_state:
+            st.session_state.last_url_audio_only = False
+        
+        # 只需要文本或翻译字幕时只下载音频，生成视频时再在后台下载完整视频
+        audio_only = st.checkbox("仅下载音频（只需要文本或字幕时更快，生成视频时再下载完整视频）", key="url_audio_only")
+        # 边下载边识别需要可用的识别引擎，未安装时不提供该选项
+        stream_asr = (audio_only and get_default_asr_engine() is not None
+                      and st.checkbox("边下载边识别（下载过程中即开始生成文本）", key="url_stream_asr"))
         
         # 检查是否已经下载过视频，避免重复下载
-        if video_url and video_url != st.session_state.last_video_url:
+        if video_url and (video_url != st.session_state.last_video_url or audio_only != st.session_state.last_url_audio_only):
             st.session_state.url_video_downloaded = False
         
-        download_button = st.button("从URL下载视频")
+        download_button = st.button("从URL下载音频" if audio_only else "从URL下载视频")
         
         # 如果点击下载按钮或已经下载过视频
         if (video_url and download_button) or (video_url and st.session_state.url_video_downloaded and video_url == st.session_state.last_video_url):
-            if not st.session_state.url_video_downloaded:
-                with st.spinner("下载并处理URL视频中..."):
+            if not st.session_state.url_video_downloaded and audio_only:
+                with st.spinner("下载URL音频中..."), tracked_job("下载音频"):
+                    audio_path = None
+                    if stream_asr:
+                        audio_path = stream_url_transcript(video_url, st.session_state.temp_dir)
+                    if not audio_path:
+                        audio_path = download_audio_from_url(video_url, st.session_state.temp_dir)
+                    
+                    if audio_path:
+                        st.session_state.audio_path = audio_path
+                        st.session_state.video_path = None
+                        st.session_state.url_video_downloaded = True
+                        st.session_state.last_video_url = video_url
+                        st.session_state.last_url_audio_only = True
+                        st.success("音频下载成功!")
+                    else:
+                        st.error("音频下载失败，请检查URL或尝试其他视频")
+            elif not st.session_state.url_video_downloaded:
+                with st.spinner("下载并处理URL视频中..."), tracked_job("下载视频"):
                     # 下载视频
                     video_path = download_video_from_url(video_url, st.session_state.temp_dir)
                     
@@ -691,14 +858,49 @@ font = "sans serif"
                         st.session_state.video_path = video_path
                         st.session_state.url_video_downloaded = True
                         st.session_state.last_video_url = video_url
+                        st.session_state.last_url_audio_only = False
                         st.success("视频下载成功!")
                     else:
                         st.error("视频下载失败，请检查URL或尝试其他视频")
             
+            # 只下载了音频：可以直接进入音频处理；生成视频时在识别和翻译的同时下载完整视频
+            if st.session_state.url_video_downloaded and audio_only and st.session_state.audio_path:
+                st.audio(st.session_state.audio_path)
+                
+                platform_subtitles = find_platform_subtitles(st.session_state.audio_path)
+                if platform_subtitles:
+                    best = platform_subtitles[0]
+                    st.info(f"检测到平台字幕（{best['language']}，{'自动生成' if best['automatic'] else '人工'}，"
+                            f"{best['cue_count']} 条），生成视频和文本时将直接使用，无需语音识别")
+                
+                if st.button("一键生成视频", key="process_url_audio"):
+                    process_uploaded_video(
+                        st.session_state.audio_path,
+                        st.session_state.temp_dir,
+                        language_code[target_language],
+                        api_choice,
+                        baidu_appid if api_choice == "百度翻译 (免费)" else openai_api_key,
+                        baidu_secret_key if api_choice == "百度翻译 (免费)" else None,
+                        subtitle_position == "原字幕下方",
+                        auto_subtitle,
+                        subtitle_style,
+                        asr_deadline=asr_deadline,
+                        subtitle_mode=subtitle_mode,
+                        extra_languages=extra_languages,
+                        render_profile=render_profile,
+                        video_url=video_url
+                    )
+            
             # 如果视频已下载成功，显示视频
-            if st.session_state.url_video_downloaded and st.session_state.video_path:
+            if st.session_state.url_video_downloaded and not audio_only and st.session_state.video_path:
                 st.video(st.session_state.video_path)
                 
+                platform_subtitles = find_platform_subtitles(st.session_state.video_path)
+                if platform_subtitles:
+                    best = platform_subtitles[0]
+                    st.info(f"检测到平台字幕（{best['language']}，{'自动生成' if best['automatic'] else '人工'}，"
+                            f"{best['cue_count']} 条），生成视频和文本时将直接使用，无需语音识别")
+                
                 # 添加处理视频按钮
                 if st.button("一键生成视频", key="process_url_video"):
                     # 调用process_uploaded_video函数，传递字幕样式参数
@@ -711,7 +913,11 @@ font = "sans serif"
                         baidu_secret_key if api_choice == "百度翻译 (免费)" else None,  # 传递secret_key
                         subtitle_position == "原字幕下方",
                         auto_subtitle,
-                        subtitle_style  # 传递字幕样式
+                        subtitle_style,  # 传递字幕样式
+                        asr_deadline=asr_deadline,
+                        subtitle_mode=subtitle_mode,
+                        extra_languages=extra_languages,
+                        render_profile=render_profile
                     )
                 
                 # 添加提取音频按钮
@@ -731,21 +937,36 @@ font = "sans serif"
                     st.success("音频已提取")
                     st.audio(st.session_state.audio_path)
     
+        # 播放列表或频道：后面的视频继续下载的同时处理已下载的视频
+        with st.expander("处理整个播放列表或频道"):
+            st.caption("每个视频下载完成后立即开始识别、翻译和渲染，下载和处理在不同视频之间同时进行")
+            playlist_limit = st.number_input("最多处理的视频数（0 表示全部）", min_value=0, value=0, step=1)
+            if st.button("处理播放列表", key="process_playlist", disabled=not video_url):
+                process_playlist_url(
+                    video_url,
+                    st.session_state.temp_dir,
+                    language_code[target_language],
+                    api_choice,
+                    baidu_appid if api_choice == "百度翻译 (免费)" else openai_api_key,
+                    baidu_secret_key if api_choice == "百度翻译 (免费)" else None,
+                    subtitle_position == "原字幕下方",
+                    auto_subtitle,
+                    subtitle_style,
+                    asr_deadline=asr_deadline,
+                    subtitle_mode=subtitle_mode,
+                    extra_languages=extra_languages,
+                    render_profile=render_profile,
+                    limit=playlist_limit
+                )
+    
     with tabs[2]:  # 音频处理
         st.subheader("音频处理")
         
         if st.session_state.audio_path and os.path.exists(st.session_state.audio_path):
             st.audio(st.session_state.audio_path)
             
-            # 检查whisper是否已安装
-            whisper_installed = False
-            try:
-                # 尝试导入whisper模块
-                import importlib.util
-                if importlib.util.find_spec('whisper') is not None:
-                    whisper_installed = True
-            except ImportError:
-                pass
+            # 检查whisper是否已安装（使用启动时的工具链探测结果）
+            whisper_installed = is_whisper_available()
             
             if not whisper_installed:
                 st.warning("未检测到Whisper语音识别库，将使用备用方法处理音频。为获得更好的结果，建议安装Whisper：")
@@ -769,9 +990,24 @@ font = "sans serif"
                     安装后重新运行程序，即可使用Whisper自动生成高质量文本。
                     """)
             
+            # URL下载的视频如果带有平台字幕，直接使用字幕文本，跳过语音识别
+            # 仅下载音频时平台字幕位于音频文件旁
+            platform_subtitles = find_platform_subtitles(st.session_state.video_path or st.session_state.audio_path)
+            
             if st.button("从音频生成文本"):
                 with st.spinner("正在生成文本，这可能需要一些时间..."):
-                    st.session_state.text_path = generate_text_from_audio(st.session_state.audio_path, st.session_state.temp_dir)
+                    if platform_subtitles:
+                        platform_text = '\n'.join(
+                            sub.text.replace('\n', ' ') for sub in pysrt.open(platform_subtitles[0]['path'], encoding='utf-8')
+                        )
+                        st.session_state.text_path = os.path.join(st.session_state.temp_dir, "platform_subtitles.txt")
+                        save_text_file(st.session_state.text_path, platform_text)
+                    else:
+                        st.session_state.text_path = generate_text_from_audio(
+                            st.session_state.audio_path,
+                            st.session_state.temp_dir,
+                            deadline_seconds=asr_deadline
+                        )
                     if st.session_state.text_path and os.path.exists(st.session_state.text_path):
                         st.session_state.text_content = read_text_file(st.session_state.text_path)
                         st.session_state.edited_content = st.session_state.text_content
@@ -879,6 +1115,38 @@ font = "sans serif"
             
             st.markdown(preview_style, unsafe_allow_html=True)
             
+            # 使用 libass 实际渲染的预览，与最终视频的效果一致
+            preview_col1, preview_col2 = st.columns(2)
+            with preview_col1:
+                preview_frame = st.button("渲染预览帧")
+            with preview_col2:
+                preview_clip = st.button("渲染预览片段（约6秒）")
+            
+            if preview_frame or preview_clip:
+                try:
+                    preview_srt_path = create_subtitles_from_text(
+                        st.session_state.translated_content,
+                        st.session_state.temp_dir,
+                        duration_per_char=0.2
+                    )[0]
+                    preview_path = os.path.join(
+                        st.session_state.temp_dir,
+                        "style_preview.png" if preview_frame else "style_preview.mp4"
+                    )
+                    with st.spinner("正在渲染预览..."):
+                        render_style_preview(
+                            st.session_state.video_path,
+                            preview_srt_path,
+                            preview_path,
+                            subtitle_style
+                        )
+                    if preview_frame:
+                        st.image(preview_path)
+                    else:
+                        st.video(preview_path)
+                except Exception as e:
+                    st.error(f"预览渲染失败: {str(e)[:200]}")
+            
             if st.button("生成字幕视频"):
                 try:
                     # 创建输出目录（确保路径存在）
@@ -902,14 +1170,24 @@ font = "sans serif"
                     # 生成带字幕的视频
                     video_filename = os.path.basename(st.session_state.video_path)
                     output_video_path = os.path.join(output_path, f"translated_{video_filename}")
+                    if subtitle_mode == "soft":
+                        output_video_path = soft_subtitle_output_path(output_video_path)
                     
                     # 执行视频处理，传递字幕样式
-                    success = process_video(
-                        st.session_state.video_path, 
-                        output_video_path, 
-                        translated_srt_path,
-                        subtitle_style  # 传递字幕样式参数
-                    )
+                    with tracked_job("生成字幕视频", progressive_preview_path(output_video_path)) as job:
+                        show_render_estimate(job, estimate_render_time(
+                            st.session_state.video_path, translated_srt_path, subtitle_mode, render_profile
+                        ))
+                        success = process_video(
+                            st.session_state.video_path, 
+                            output_video_path, 
+                            translated_srt_path,
+                            subtitle_style,  # 传递字幕样式参数
+                            mode=subtitle_mode,
+                            subtitle_language=language_code[target_language],
+                            progressive=True,
+                            render_profile=render_profile
+                        )
                     
                     if success:
                         st.success(f"视频处理成功! 保存在 {output_video_path}")
@@ -933,61 +1211,142 @@ font = "sans serif"
                 
             st.info(f"请先完成以下步骤: {', '.join(missing)}")
     
-def process_uploaded_video(video_path, temp_dir, target_lang, api_choice, api_key, secret_key=None, merge_below=True, auto_subtitle=True, subtitle_style=None):
-    """处理上传的视频"""
-    with st.spinner("处理中，请稍候..."):
-        # 提取字幕
-        subtitles = extract_subtitles(video_path)
-        
-        if not subtitles and auto_subtitle:
-            st.info("正在自动生成字幕，这可能需要一些时间...")
-            subtitle_path = auto_generate_subtitles(video_path, temp_dir)
-            if subtitle_path and os.path.exists(subtitle_path):
-                subtitles = pysrt.open(subtitle_path)
-                
-        if not subtitles:
-            st.error("未能从视频中提取到字幕，请确保视频包含嵌入式字幕或上传带有同名SRT文件")
-            return
-        
-        # 翻译字幕
-        with st.status("正在翻译字幕..."):
-            translated_subs = translate_subtitles(
-                subtitles, 
-                target_lang=target_lang,
-                api_choice=api_choice,
-                api_key=api_key,
-                secret_key=secret_key
-            )
-        
-        # 合并字幕并处理视频
-        output_filename = f"translated_{os.path.basename(video_path)}"
-        output_path = os.path.join(temp_dir, output_filename)
-        
-        with st.status("正在合并字幕..."):
-            merged_srt_path = merge_subtitles(
-                subtitles, 
-                translated_subs, 
-                temp_dir,
-                merge_below
+# 各流水线阶段在页面上显示的状态文字
+STAGE_LABELS = {
+    'subtitles': "正在提取字幕...",
+    'translate': "正在翻译字幕...",
+    'download': "正在等待视频下载完成...",
+    'merge': "正在合并字幕...",
+    'render': "正在处理最终视频...",
+}
+
+def stream_url_transcript(video_url, temp_dir):
+    """
+    边下载边识别，识别出的文本随下载进度显示；完成后直接填入文本编辑页
+    
+    Returns:
+        下载的音频路径，失败时返回None
+    """
+    transcript_slot = st.empty()
+    lines = []
+    
+    def on_segments(segments, audio_seconds):
+        lines.extend(seg['text'] for seg in segments)
+        transcript_slot.text(f"已识别 {format_seconds(audio_seconds)} 的音频：\n" + '\n'.join(lines))
+    
+    audio_path, segments = transcribe_url_streaming(video_url, temp_dir, on_segments=on_segments)
+    transcript_slot.empty()
+    if not audio_path:
+        st.warning("边下载边识别失败，改为先下载音频")
+        return None
+    
+    st.session_state.text_path = save_segments_as_text(segments, os.path.join(os.path.dirname(audio_path), "audio_text.txt"))
+    st.session_state.text_content = read_text_file(st.session_state.text_path)
+    st.session_state.edited_content = st.session_state.text_content
+    st.success("文本已生成，可在文本编辑页查看和修改")
+    return audio_path
+
+def streamlit_stage(job):
+    """将流水线阶段显示为页面状态框，并在渲染前显示耗时估算"""
+    @contextmanager
+    def stage(name, **info):
+        label = STAGE_LABELS[name]
+        if name == 'subtitles' and info.get('auto_subtitle'):
+            label = "正在提取字幕（没有字幕时自动生成，这可能需要一些时间）..."
+        if name == 'render' and info.get('mode') == 'soft':
+            label = "正在封装字幕轨道..."
+        with st.status(label):
+            if name == 'render' and info.get('mode') != 'soft':
+                show_render_estimate(job, info.get('estimate'))
+            yield
+    return stage
+
+def show_video_results(outputs, key_prefix="download"):
+    """显示输出视频并提供下载按钮，outputs 为 [(路径, 下载文件名), ...]"""
+    st.video(outputs[0][0])
+    for i, (result_path, result_filename) in enumerate(outputs):
+        with open(result_path, "rb") as file:
+            st.download_button(
+                label="下载翻译后的视频" if i == 0 else f"下载 {result_filename}",
+                data=file,
+                file_name=result_filename,
+                mime="video/x-matroska" if result_filename.lower().endswith(".mkv") else "video/mp4",
+                key=f"{key_prefix}_{result_filename}"
             )
-        
-        with st.status("正在处理最终视频..."):
-            success = process_video(video_path, output_path, merged_srt_path, subtitle_style)
-        
-        if success:
-            # 显示结果并提供下载链接
-            st.success("视频处理完成!")
-            st.video(output_path)
-            
-            with open(output_path, "rb") as file:
-                st.download_button(
-                    label="下载翻译后的视频",
-                    data=file,
-                    file_name=output_filename,
-                    mime="video/mp4"
-                )
-        else:
-            st.error("视频处理失败，请检查日志或尝试其他视频")
+
+def job_name(source, prefix="video"):
+    """任务目录名：同一视频或链接重新处理时使用同一目录，以便复用已完成的阶段"""
+    return f"{prefix}_{hash_key(source)[:12]}"
+
+def process_uploaded_video(video_path, temp_dir, target_lang, api_choice, api_key, secret_key=None, merge_below=True, auto_subtitle=True, subtitle_style=None, asr_deadline=None, subtitle_mode="burn", extra_languages=None, render_profile=None, video_url=None):
+    """
+    处理上传的视频，extra_languages 中的语言会与目标语言一起生成
+    提供 video_url 时 video_path 为仅音频的下载文件：识别和翻译使用音频，同时在后台下载完整视频用于渲染
+    """
+    with st.spinner("处理中，请稍候..."), tracked_job("处理视频") as job:
+        video_future = prefetch_video_from_url(video_url, temp_dir) if video_url else None
+        job_dir = job_workspace(temp_dir, job_name(video_url or video_path))
+        result = translate_video(
+            video_path, job_dir, target_lang, api_choice, api_key, secret_key,
+            merge_below=merge_below,
+            auto_subtitle=auto_subtitle,
+            subtitle_style=subtitle_style,
+            asr_deadline=asr_deadline,
+            subtitle_mode=subtitle_mode,
+            extra_languages=extra_languages,
+            render_profile=render_profile,
+            video_future=video_future,
+            stage=streamlit_stage(job)
+        )
+    
+    if result['success']:
+        # 显示结果并提供下载链接
+        st.success("视频处理完成!")
+        show_video_results(result['outputs'])
+    else:
+        st.error(result['error'])
+
+def process_playlist_url(url, temp_dir, target_lang, api_choice, api_key, secret_key=None, merge_below=True, auto_subtitle=True, subtitle_style=None, asr_deadline=None, subtitle_mode="burn", extra_languages=None, render_profile=None, limit=None):
+    """处理播放列表或频道中的所有视频，每个视频完成后立即显示结果"""
+    status_text = st.empty()
+    results_area = st.container()
+    finished = []
+    
+    def on_item(result):
+        finished.append(result)
+        status_text.caption(f"已完成 {len(finished)} 个视频")
+        with results_area:
+            if result['success']:
+                st.success(f"{result['index'] + 1}. {result['title']} 处理完成")
+                show_video_results(result['outputs'], key_prefix=f"playlist_{result['index']}")
+            else:
+                st.error(f"{result['index'] + 1}. {result['title']}: {result['error']}")
+    
+    with st.spinner("正在处理播放列表，请稍候..."), tracked_job("处理播放列表"):
+        results = process_playlist(
+            url,
+            job_workspace(temp_dir, job_name(url, "playlist")),
+            limit=limit or None,
+            on_item=on_item,
+            target_lang=target_lang,
+            api_choice=api_choice,
+            api_key=api_key,
+            secret_key=secret_key,
+            merge_below=merge_below,
+            auto_subtitle=auto_subtitle,
+            subtitle_style=subtitle_style,
+            asr_deadline=asr_deadline,
+            subtitle_mode=subtitle_mode,
+            extra_languages=extra_languages,
+            render_profile=render_profile
+        )
+    
+    if not results:
+        st.error("未能读取播放列表，请检查URL")
+        return
+    succeeded = sum(1 for result in results if result and result['success'])
+    status_text.empty()
+    st.info(f"播放列表处理完成：成功 {succeeded} 个，失败 {len(results) - succeeded} 个")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,371 @@
+import os
+import time
+import platform
+import threading
+from cache_utils import get_cache_dir, hash_key, atomic_write_json, read_json, touch, evict_lru
+
+# 缓存格式版本，格式变化时递增以使旧缓存失效
+ASR_CACHE_VERSION = 1
+# 识别结果缓存的磁盘配额（字节）
+ASR_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+def asr_cache_key(fingerprint, model_name, language=None, options=None):
+    """
+    生成识别结果缓存键
+
+    Args:
+        fingerprint: 音视频内容指纹（见 cache_utils.file_fingerprint）
+        model_name: 模型名称
+        language: 识别语言，None表示自动检测
+        options: 其他影响识别结果的解码参数
+
+    Returns:
+        缓存键字符串
+    """
+    return hash_key(ASR_CACHE_VERSION, fingerprint, model_name, language, options or {})
+
+def _cache_path(key, cache_dir=None):
+    return os.path.join(cache_dir or get_cache_dir('asr'), f"{key}.json")
+
+def load_cached_segments(key, cache_dir=None):
+    """
+    读取缓存的识别结果
+
+    Returns:
+        字幕片段列表，未命中时返回None
+    """
+    path = _cache_path(key, cache_dir)
+    entry = read_json(path)
+    if not entry or entry.get('version') != ASR_CACHE_VERSION:
+        return None
+
+    touch(path)
+    return entry.get('segments')
+
+def save_cached_segments(key, segments, metadata=None, cache_dir=None, max_bytes=ASR_CACHE_MAX_BYTES):
+    """
+    保存识别结果并按配额淘汰最久未使用的缓存
+
+    Args:
+        key: 缓存键
+        segments: 字幕片段列表
+        metadata: 附加信息（模型、语言等）
+        cache_dir: 缓存目录
+        max_bytes: 磁盘配额
+    """
+    cache_dir = cache_dir or get_cache_dir('asr')
+    try:
+        atomic_write_json(_cache_path(key, cache_dir), {
+            'version': ASR_CACHE_VERSION,
+            'created_at': time.time(),
+            'metadata': metadata or {},
+            'segments': segments
+        })
+        evict_lru(cache_dir, max_bytes)
+    except OSError as e:
+        print(f"保存识别结果缓存失败: {e}")
+
+# ---------------------------------------------------------------------------
+# 语音识别引擎注册表
+#
+# 所有引擎遵循统一约定：transcribe(pcm, options) -> segments
+#   pcm: 16kHz 单声道 s16le 数据（bytes 或 int16 数组）
+#   options: {'model', 'language', 'threads', 'word_timestamps', 'sample_rate', 'prompt', ...}
+#     prompt 为上一块结尾的已识别文本，引擎可将其作为解码提示
+#   segments: [{'start': 秒, 'end': 秒, 'text': 文本, 'words': [...] 可选}]
+# ---------------------------------------------------------------------------
+
+ASR_ENGINES = {}
+
+def register_asr_engine(name, transcribe, capabilities=None, is_available=None, load=None):
+    """
+    注册语音识别引擎
+
+    Args:
+        name: 引擎名称
+        transcribe: 识别函数，签名为 transcribe(pcm, options) -> segments
+        capabilities: 能力标记，如 {'word_timestamps': True}；不支持的选项在识别前被忽略
+        is_available: 返回引擎依赖是否已安装的函数，None表示始终可用
+        load: 预先加载模型的函数，签名为 load(options)，None表示无需加载
+    """
+    ASR_ENGINES[name] = {
+        'name': name,
+        'transcribe': transcribe,
+        'capabilities': dict(capabilities or {}),
+        'is_available': is_available or (lambda: True),
+        'load': load or (lambda options: None)
+    }
+
+def get_asr_engine(name):
+    """按名称获取引擎，不存在或依赖未安装时抛出 ValueError"""
+    engine = ASR_ENGINES.get(name)
+    if engine is None:
+        raise ValueError(f"未知的语音识别引擎: {name}")
+    if not engine['is_available']():
+        raise ValueError(f"语音识别引擎 {name} 的依赖未安装")
+    return engine
+
+def list_asr_engines(available_only=True):
+    """列出已注册的引擎名称"""
+    return [name for name, engine in ASR_ENGINES.items() if not available_only or engine['is_available']()]
+
+def get_default_asr_engine():
+    """
+    选择默认引擎：环境变量 VIDEO_TRANSLATE_ASR_ENGINE 优先，
+    否则按 DEFAULT_ASR_ENGINE_ORDER 选择第一个可用引擎
+
+    Returns:
+        引擎名称，没有可用的真实引擎时返回None
+    """
+    preferred = os.environ.get('VIDEO_TRANSLATE_ASR_ENGINE')
+    if preferred and preferred in ASR_ENGINES and ASR_ENGINES[preferred]['is_available']():
+        return preferred
+    for name in DEFAULT_ASR_ENGINE_ORDER:
+        if name in ASR_ENGINES and ASR_ENGINES[name]['is_available']():
+            return name
+    return None
+
+def resolve_asr_engine(engine=None):
+    """
+    确定实际使用的引擎：调用方指定的引擎（包括用于测试的 'stub'），否则为默认的真实引擎
+
+    Raises:
+        ValueError: 没有指定引擎且没有已安装的真实引擎
+    """
+    engine = engine or get_default_asr_engine()
+    if not engine:
+        raise ValueError("没有可用的语音识别引擎，请安装 openai-whisper 或 faster-whisper")
+    return engine
+
+def pcm_to_float32(pcm):
+    """将 s16le PCM（bytes 或 int16 数组）转换为 Whisper 需要的 float32 数组"""
+    import numpy as np
+
+    samples = np.frombuffer(pcm, dtype=np.int16) if isinstance(pcm, (bytes, bytearray, memoryview)) else pcm
+    return samples.astype(np.float32) / 32768.0
+
+def _module_available(module_name):
+    import importlib.util
+    return importlib.util.find_spec(module_name) is not None
+
+# 已加载的模型，避免每次识别都重新加载；键为 (引擎, 模型, 其他加载参数)
+_LOADED_MODELS = {}
+_MODEL_LOCK = threading.Lock()
+
+def _load_model(cache_key, load):
+    with _MODEL_LOCK:
+        if cache_key not in _LOADED_MODELS:
+            _LOADED_MODELS[cache_key] = load()
+        return _LOADED_MODELS[cache_key]
+
+# ---- openai-whisper（PyTorch）----
+
+def _whisper_load(options):
+    import whisper
+
+    model_name = options.get('model', 'base')
+    return _load_model(('whisper', model_name), lambda: whisper.load_model(model_name))
+
+def _whisper_transcribe(pcm, options):
+    # 不支持 threads：torch.set_num_threads 是进程级设置，会影响同一进程中的其他会话
+    model = _whisper_load(options)
+
+    kwargs = {'fp16': False}
+    if options.get('language'):
+        kwargs['language'] = options['language']
+    if options.get('word_timestamps'):
+        kwargs['word_timestamps'] = True
+    if options.get('prompt'):
+        kwargs['initial_prompt'] = options['prompt']
+
+    result = model.transcribe(pcm_to_float32(pcm), **kwargs)
+    segments = []
+    for seg in result.get('segments', []):
+        item = {'start': float(seg['start']), 'end': float(seg['end']), 'text': seg.get('text', '').strip()}
+        if seg.get('words'):
+            item['words'] = [
+                {'start': float(w['start']), 'end': float(w['end']), 'word': w['word']}
+                for w in seg['words']
+            ]
+        segments.append(item)
+    return segments
+
+register_asr_engine(
+    'whisper',
+    _whisper_transcribe,
+    capabilities={'word_timestamps': True},
+    is_available=lambda: _module_available('whisper'),
+    load=_whisper_load
+)
+
+# ---- faster-whisper（CTranslate2，CPU 上使用 int8 量化）----
+
+def _faster_whisper_load(options):
+    from faster_whisper import WhisperModel
+
+    model_name = options.get('model', 'base')
+    compute_type = options.get('compute_type', 'int8')
+    threads = int(options.get('threads') or 0)
+    return _load_model(
+        ('faster-whisper', model_name, compute_type, threads),
+        lambda: WhisperModel(model_name, device='cpu', compute_type=compute_type, cpu_threads=threads)
+    )
+
+def _faster_whisper_transcribe(pcm, options):
+    model = _faster_whisper_load(options)
+
+    raw_segments, _ = model.transcribe(
+        pcm_to_float32(pcm),
+        language=options.get('language'),
+        word_timestamps=bool(options.get('word_timestamps')),
+        beam_size=int(options.get('beam_size', 1)),
+        initial_prompt=options.get('prompt')
+    )
+    segments = []
+    for seg in raw_segments:
+        item = {'start': float(seg.start), 'end': float(seg.end), 'text': seg.text.strip()}
+        if seg.words:
+            item['words'] = [{'start': float(w.start), 'end': float(w.end), 'word': w.word} for w in seg.words]
+        segments.append(item)
+    return segments
+
+register_asr_engine(
+    'faster-whisper',
+    _faster_whisper_transcribe,
+    capabilities={'word_timestamps': True},
+    is_available=lambda: _module_available('faster_whisper'),
+    load=_faster_whisper_load
+)
+
+# ---- 确定性桩引擎：用于离线测试和流水线基准 ----
+
+def _stub_transcribe(pcm, options):
+    sample_rate = options.get('sample_rate', 16000)
+    sample_count = len(pcm) // 2 if isinstance(pcm, (bytes, bytearray, memoryview)) else len(pcm)
+    duration = sample_count / float(sample_rate)
+
+    # 可选：模拟识别耗时（实时率），便于对流水线做基准测试
+    rtf = float(options.get('stub_rtf', 0))
+    if rtf > 0:
+        time.sleep(duration * rtf)
+
+    segment_seconds = float(options.get('stub_segment_seconds', 5))
+    segments = []
+    start = 0.0
+    index = 1
+    while start < duration:
+        end = min(duration, start + segment_seconds)
+        segments.append({'start': start, 'end': end, 'text': f"[stub] 片段 {index}"})
+        start = end
+        index += 1
+    return segments
+
+register_asr_engine(
+    'stub',
+    _stub_transcribe,
+    capabilities={'word_timestamps': False}
+)
+
+# 默认引擎优先级（桩引擎不参与自动选择，只有调用方明确指定时才会使用）
+DEFAULT_ASR_ENGINE_ORDER = ['whisper', 'faster-whisper']
+
+# ---------------------------------------------------------------------------
+# 按完成时限自动选择模型
+# ---------------------------------------------------------------------------
+
+# 按准确度从低到高排列
+ASR_MODEL_ACCURACY_ORDER = ['tiny', 'base', 'small', 'medium', 'large']
+# 本机还没有实测数据时使用的 CPU 实时率估计（识别耗时 / 音频时长）
+DEFAULT_ASR_RTF = {'tiny': 0.1, 'base': 0.2, 'small': 0.6, 'medium': 1.8, 'large': 4.0}
+# 新测量值在滑动平均中的权重
+ASR_RTF_SMOOTHING = 0.3
+
+# 同一进程中的多个会话可能同时记录实时率
+_RTF_LOCK = threading.Lock()
+
+def _rtf_stats_path():
+    return os.path.join(get_cache_dir('asr_stats'), 'rtf.json')
+
+def load_asr_rtf_stats():
+    """读取本机各引擎/模型的实测实时率，格式为 {引擎: {模型: {'rtf': 值, 'samples': 次数}}}"""
+    stats = read_json(_rtf_stats_path()) or {}
+    return stats.get(platform.node(), {})
+
+def record_asr_rtf(engine, model_name, audio_seconds, wall_seconds):
+    """
+    记录一次识别的实时率，供之后的模型选择使用
+
+    Args:
+        engine: 引擎名称
+        model_name: 模型名称
+        audio_seconds: 音频时长（秒）
+        wall_seconds: 实际耗时（秒），不应包含模型下载和加载时间
+    """
+    if audio_seconds <= 0:
+        return
+
+    path = _rtf_stats_path()
+    rtf = wall_seconds / audio_seconds
+    with _RTF_LOCK:
+        all_stats = read_json(path) or {}
+        host_stats = all_stats.setdefault(platform.node(), {})
+        entry = host_stats.setdefault(engine, {}).get(model_name)
+
+        if entry:
+            entry = {
+                'rtf': entry['rtf'] * (1 - ASR_RTF_SMOOTHING) + rtf * ASR_RTF_SMOOTHING,
+                'samples': entry.get('samples', 0) + 1
+            }
+        else:
+            entry = {'rtf': rtf, 'samples': 1}
+        host_stats[engine][model_name] = entry
+
+        try:
+            atomic_write_json(path, all_stats)
+        except OSError as e:
+            print(f"保存识别速度统计失败: {e}")
+
+def estimate_asr_seconds(engine, model_name, audio_seconds, stats=None):
+    """
+    根据本机实测实时率估算识别耗时（秒）
+    没有实测数据的模型使用默认实时率，并按已实测模型比默认值慢的最大倍数放大
+    """
+    stats = load_asr_rtf_stats() if stats is None else stats
+    engine_stats = stats.get(engine, {})
+    entry = engine_stats.get(model_name)
+    if entry:
+        return entry['rtf'] * audio_seconds
+
+    rtf = DEFAULT_ASR_RTF.get(model_name, 1.0)
+    ratios = [e['rtf'] / DEFAULT_ASR_RTF[name] for name, e in engine_stats.items() if name in DEFAULT_ASR_RTF]
+    if ratios:
+        rtf *= max(1.0, max(ratios))
+    return rtf * audio_seconds
+
+def select_asr_model(audio_seconds, deadline_seconds, engine, candidates=None, safety_factor=1.2):
+    """
+    选择能在完成时限内完成识别的最准确模型
+
+    Args:
+        audio_seconds: 音频时长（秒）
+        deadline_seconds: 完成时限（秒）
+        engine: 引擎名称
+        candidates: 候选模型，按准确度从低到高排列，默认 ASR_MODEL_ACCURACY_ORDER
+        safety_factor: 估算耗时的放大系数，为波动预留余量
+
+    Returns:
+        模型名称；所有模型都无法按时完成时返回最快的模型
+    """
+    candidates = candidates or ASR_MODEL_ACCURACY_ORDER
+    stats = load_asr_rtf_stats()
+    measured = stats.get(engine, {})
+
+    chosen = candidates[0]
+    for i, model_name in enumerate(candidates):
+        # 优先使用实测过的模型：未实测的模型只有在比它快一级的模型已实测时才考虑，
+        # 每次最多比已知速度的模型高一级，不会凭默认估计直接选中很慢的大模型
+        if model_name not in measured and i > 0 and candidates[i - 1] not in measured:
+            continue
+        if estimate_asr_seconds(engine, model_name, audio_seconds, stats) * safety_factor <= deadline_seconds:
+            chosen = model_name
+    return chosen
@@ -0,0 +1,207 @@
+import os
+import re
+import tempfile
+from cache_utils import get_cache_dir, file_fingerprint, hash_key, touch, evict_lru
+
+# 与 ffmpeg 将 SRT 转换为 ASS 时使用的画布一致，字号等数值的含义与 force_style 时相同
+ASS_PLAY_RES = (384, 288)
+# 转换后的 ASS 缓存的磁盘配额（字节）
+ASS_CACHE_MAX_BYTES = 50 * 1024 * 1024
+# 未指定水平边距时 libass 使用的默认值
+ASS_DEFAULT_MARGIN = 10
+
+ASS_STYLE_FORMAT = (
+    "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+    "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, "
+    "Alignment, MarginL, MarginR, MarginV, Encoding"
+)
+ASS_EVENT_FORMAT = "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text"
+
+def _style_colour(color):
+    """&HBBGGRR& -> 样式行使用的 &HAABBGGRR（不透明）"""
+    match = re.match(r'^&H([0-9A-Fa-f]{6,8})&?$', color or '')
+    if not match:
+        return '&H00FFFFFF'
+    return f"&H{match.group(1).upper().zfill(8)}"
+
+def _style_line(name, style):
+    """根据已合并的样式（见 video_processor.resolve_subtitle_style）生成一行 Style"""
+    alignment = int(style['alignment'])
+    # 顶部显示使用小键盘布局的上一行（7/8/9）
+    if style.get('position') == 'top' and alignment <= 3:
+        alignment += 6
+    margin_l = style['margin_h'] if alignment % 3 == 1 else ASS_DEFAULT_MARGIN
+    margin_r = style['margin_h'] if alignment % 3 == 0 else ASS_DEFAULT_MARGIN
+    fields = [
+        name,
+        style['font'],
+        style['fontsize'],
+        _style_colour(style['primary_color']),
+        '&H000000FF',
+        _style_colour(style['outline_color']),
+        '&H80000000',
+        -1 if style['bold'] else 0,
+        -1 if style['italic'] else 0,
+        0, 0, 100, 100, 0, 0,
+        1,  # 1=边框+阴影
+        style['outline_width'],
+        0,
+        alignment,
+        margin_l,
+        margin_r,
+        style['margin_v'],
+        1
+    ]
+    return "Style: " + ','.join(str(field) for field in fields)
+
+def compile_ass_header(styles):
+    """
+    将样式编译为 ASS 文件头（Script Info、样式表和事件格式行）
+    同一任务只需编译一次，之后每个字幕文件直接复用
+
+    Args:
+        styles: {样式名: 已合并的样式字典}，第一个样式作为默认样式
+
+    Returns:
+        ASS 文件头字符串
+    """
+    lines = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {ASS_PLAY_RES[0]}",
+        f"PlayResY: {ASS_PLAY_RES[1]}",
+        "WrapStyle: 0",
+        "ScaledBorderAndShadow: yes",
+        "YCbCr Matrix: None",
+        "",
+        "[V4+ Styles]",
+        ASS_STYLE_FORMAT,
+    ]
+    lines += [_style_line(name, style) for name, style in styles.items()]
+    lines += ["", "[Events]", ASS_EVENT_FORMAT, ""]
+    return '\n'.join(lines)
+
+def format_ass_time(seconds):
+    """秒 -> H:MM:SS.cc"""
+    centis = max(0, int(round(seconds * 100)))
+    hours, centis = divmod(centis, 360000)
+    minutes, centis = divmod(centis, 6000)
+    secs, centis = divmod(centis, 100)
+    return f"{hours}:{minutes:02d}:{secs:02d}.{centis:02d}"
+
+def parse_ass_time(value):
+    """H:MM:SS.cc -> 秒"""
+    hours, minutes, seconds = value.strip().split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+_SRT_TAGS = {
+    'i': ('{\\i1}', '{\\i0}'),
+    'b': ('{\\b1}', '{\\b0}'),
+    'u': ('{\\u1}', '{\\u0}'),
+    's': ('{\\s1}', '{\\s0}'),
+}
+
+def srt_text_to_ass(text):
+    """将 SRT 字幕文本转换为 ASS 事件文本：换行转为 \\N，常用 HTML 标签转为覆盖标签，其余标签去除"""
+    def replace_tag(match):
+        closing, name = match.group(1), match.group(2).lower()
+        if name in _SRT_TAGS:
+            return _SRT_TAGS[name][1 if closing else 0]
+        return ''
+
+    text = re.sub(r'<(/?)\s*([A-Za-z]+)[^>]*>', replace_tag, text)
+    return text.replace('\r\n', '\n').strip('\n').replace('\n', '\\N')
+
+def dialogue_line(start, end, style_name, text):
+    """生成一行 Dialogue 事件，text 为已转换的 ASS 文本"""
+    return f"Dialogue: 0,{format_ass_time(start)},{format_ass_time(end)},{style_name},,0,0,0,,{text}"
+
+def write_ass(output_path, header, events):
+    """
+    写入 ASS 文件（先写临时文件再原子替换）
+
+    Args:
+        output_path: 输出路径
+        header: compile_ass_header 生成的文件头
+        events: [(start, end, 样式名, ASS文本), ...]
+    """
+    # Streamlit 的各会话是同一进程中的线程，每次写入使用独立的临时文件
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(output_path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(header)
+            for start, end, style_name, text in events:
+                f.write(dialogue_line(start, end, style_name, text) + '\n')
+        os.replace(tmp_path, output_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return output_path
+
+def read_ass(ass_path):
+    """
+    读取 ASS 文件
+
+    Returns:
+        (文件头, [(start, end, 样式名, ASS文本), ...])
+    """
+    header_lines = []
+    events = []
+    with open(ass_path, 'r', encoding='utf-8-sig') as f:
+        for line in f:
+            if not line.startswith('Dialogue:'):
+                if not events:
+                    header_lines.append(line.rstrip('\n'))
+                continue
+            fields = line[len('Dialogue:'):].strip().split(',', 9)
+            if len(fields) < 10:
+                continue
+            events.append((parse_ass_time(fields[1]), parse_ass_time(fields[2]), fields[3], fields[9].rstrip('\n')))
+    return '\n'.join(header_lines) + '\n', events
+
+def write_segment_ass(ass_path, output_path, start, end):
+    """
+    截取 [start, end) 区间内的事件并将时间轴平移到从0开始
+
+    Returns:
+        写入的事件条数
+    """
+    header, events = read_ass(ass_path)
+    segment_events = [
+        (max(event_start, start) - start, min(event_end, end) - start, style_name, text)
+        for event_start, event_end, style_name, text in events
+        if event_end > start and event_start < end
+    ]
+    write_ass(output_path, header, segment_events)
+    return len(segment_events)
+
+def srt_to_ass(subtitle_path, header, style_name='Default', cache_dir=None):
+    """
+    将 SRT 转换为 ASS，结果按字幕内容和样式缓存，相同输入不会重复转换
+
+    Args:
+        subtitle_path: SRT 路径
+        header: compile_ass_header 生成的文件头
+        style_name: 事件使用的样式名
+        cache_dir: 缓存目录
+
+    Returns:
+        ASS 文件路径
+    """
+    import pysrt
+
+    cache_dir = cache_dir or get_cache_dir('ass')
+    key = hash_key(file_fingerprint(subtitle_path), header, style_name)
+    ass_path = os.path.join(cache_dir, f"{key}.ass")
+    if os.path.exists(ass_path):
+        touch(ass_path)
+        return ass_path
+
+    events = [
+        (sub.start.ordinal / 1000.0, sub.end.ordinal / 1000.0, style_name, srt_text_to_ass(sub.text))
+        for sub in pysrt.open(subtitle_path, encoding='utf-8')
+    ]
+    write_ass(ass_path, header, events)
+    evict_lru(cache_dir, ASS_CACHE_MAX_BYTES)
+    return ass_path
@@ -0,0 +1,242 @@
+"""
+命令行批量处理：不启动 Streamlit，按与页面相同的流程（提取或自动生成字幕 → 翻译 → 合并 → 渲染）处理一批视频
+
+示例:
+    python batch_cli.py videos/ --output-dir out --target-lang zh
+    python batch_cli.py manifest.json --output-dir out --workers 4 --summary out/summary.json
+
+输入可以是视频文件、目录（处理其中的视频文件）、视频URL，或清单文件：
+    .txt  每行一个视频路径或URL（# 开头的行为注释）
+    .json 列表，每项为路径/URL 字符串，或 {"source": 路径或URL, ...} 对象，
+          对象中的 target_lang、extra_languages、subtitle_mode、render_profile 等字段覆盖命令行参数
+
+有任何视频处理失败时以非零状态码退出，便于在批处理节点上调度。
+API 密钥从环境变量读取：BAIDU_APPID、BAIDU_SECRET_KEY、OPENAI_API_KEY
+"""
+import os
+import re
+import sys
+import json
+import time
+import signal
+import argparse
+from pipeline import run_jobs, is_url, PIPELINE_STAGES, DOWNLOAD_WORKERS, PROCESS_WORKERS, ASR_WORKERS
+from render_profiles import RENDER_PROFILES, DEFAULT_RENDER_PROFILE
+from process_runner import job_context, cancel_session
+
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.mov', '.avi', '.flv', '.webm', '.m4v', '.ts')
+# 翻译接口：命令行名称 -> translate_subtitles 使用的名称
+API_CHOICES = {
+    'baidu': '百度翻译 (免费)',
+    'openai': 'ChatGPT (需自备API密钥)',
+}
+SUBTITLE_MODES = ['burn', 'parallel', 'smart', 'soft']
+# 清单中可以按视频覆盖的参数
+MANIFEST_OPTIONS = (
+    'target_lang', 'extra_languages', 'merge_below', 'auto_subtitle', 'subtitle_style',
+    'asr_deadline', 'subtitle_mode', 'render_profile'
+)
+# 取消任务时使用的会话ID
+BATCH_SESSION_ID = 'batch-cli'
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="批量翻译视频字幕（无界面）")
+    parser.add_argument('inputs', nargs='+', help="视频文件、目录、视频URL或清单文件（.txt/.json）")
+    parser.add_argument('--output-dir', required=True, help="输出目录，每个视频使用其中的独立子目录")
+    parser.add_argument('--target-lang', default='zh', help="目标语言代码（默认 zh）")
+    parser.add_argument('--extra-lang', action='append', default=[], help="同时生成的其他语言，可重复指定")
+    parser.add_argument('--api', choices=sorted(API_CHOICES), default='baidu', help="翻译接口（默认 baidu）")
+    parser.add_argument('--mode', choices=SUBTITLE_MODES, default='burn', help="字幕嵌入方式（默认 burn）")
+    parser.add_argument('--profile', choices=[name for name in RENDER_PROFILES], default=DEFAULT_RENDER_PROFILE,
+                        help=f"渲染配置（默认 {DEFAULT_RENDER_PROFILE}）")
+    parser.add_argument('--separate-track', action='store_true', help="译文作为单独轨道，而不是显示在原字幕下方")
+    parser.add_argument('--no-auto-subtitle', action='store_true', help="视频没有字幕时不进行语音识别")
+    parser.add_argument('--asr-deadline', type=float, help="语音识别完成时限（秒），自动选择能按时完成的最准确模型")
+    parser.add_argument('--style', help="字幕样式：JSON 字符串或 JSON 文件路径")
+    parser.add_argument('--workers', type=int, default=PROCESS_WORKERS, help=f"同时处理的视频数（默认 {PROCESS_WORKERS}）")
+    parser.add_argument('--download-workers', type=int, default=DOWNLOAD_WORKERS,
+                        help=f"同时下载的视频数（默认 {DOWNLOAD_WORKERS}）")
+    parser.add_argument('--asr-workers', type=int, default=ASR_WORKERS, help=f"同时进行语音识别的视频数（默认 {ASR_WORKERS}）")
+    parser.add_argument('--timeout', type=float, help="每个外部进程的超时时间（秒）")
+    parser.add_argument('--summary', help="耗时汇总 JSON 的输出路径（默认 <output-dir>/batch_summary.json，- 表示标准输出）")
+    return parser.parse_args(argv)
+
+def load_json_option(value):
+    """读取 JSON 字符串或 JSON 文件"""
+    if os.path.isfile(value):
+        with open(value, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return json.loads(value)
+
+def _list_videos(directory):
+    return sorted(
+        os.path.join(dirpath, name)
+        for dirpath, _, filenames in os.walk(directory)
+        for name in filenames
+        if name.lower().endswith(VIDEO_EXTENSIONS)
+    )
+
+def _read_manifest(path):
+    """读取清单文件，返回 [{'source': ..., 其他覆盖参数}, ...]"""
+    base_dir = os.path.dirname(os.path.abspath(path))
+    if path.lower().endswith('.json'):
+        with open(path, 'r', encoding='utf-8') as f:
+            items = json.load(f)
+        entries = []
+        for item in items if isinstance(items, list) else [items]:
+            entry = item if isinstance(item, dict) else {'source': item}
+            if not isinstance(entry.get('source'), str) or not entry['source'].strip():
+                # 缺少 source 的条目无法处理，报告后跳过，不影响清单中的其他视频
+                print(f"清单 {path} 中的条目缺少有效的 source，已跳过: {json.dumps(item, ensure_ascii=False)}",
+                      file=sys.stderr)
+                continue
+            entries.append(entry)
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            entries = [{'source': line.strip()} for line in f if line.strip() and not line.strip().startswith('#')]
+    # 清单中的相对路径相对于清单文件
+    for entry in entries:
+        if not is_url(entry['source']) and not os.path.isabs(entry['source']):
+            entry['source'] = os.path.join(base_dir, entry['source'])
+    return entries
+
+def collect_inputs(inputs):
+    """
+    展开命令行输入
+
+    Returns:
+        [{'source': 路径或URL, 其他覆盖参数}, ...]
+    """
+    entries = []
+    for value in inputs:
+        if is_url(value):
+            entries.append({'source': value})
+        elif os.path.isdir(value):
+            entries.extend({'source': path} for path in _list_videos(value))
+        elif value.lower().endswith(('.json', '.txt')):
+            for entry in _read_manifest(value):
+                if not is_url(entry['source']) and os.path.isdir(entry['source']):
+                    entries.extend(dict(entry, source=path) for path in _list_videos(entry['source']))
+                else:
+                    entries.append(entry)
+        else:
+            entries.append({'source': value})
+    return entries
+
+def _job_dir_name(index, source):
+    stem = os.path.splitext(os.path.basename(source.rstrip('/')))[0] if not is_url(source) else 'url'
+    safe_stem = re.sub(r'[^\w.-]+', '_', stem)[:60]
+    return f"{index + 1:03d}_{safe_stem}"
+
+def build_jobs(entries, args):
+    """根据输入和命令行参数生成 run_jobs 的任务列表"""
+    api_choice = API_CHOICES[args.api]
+    if args.api == 'baidu':
+        api_key, secret_key = os.environ.get('BAIDU_APPID'), os.environ.get('BAIDU_SECRET_KEY')
+    else:
+        api_key, secret_key = os.environ.get('OPENAI_API_KEY'), None
+    defaults = {
+        'target_lang': args.target_lang,
+        'api_choice': api_choice,
+        'api_key': api_key,
+        'secret_key': secret_key,
+        'merge_below': not args.separate_track,
+        'auto_subtitle': not args.no_auto_subtitle,
+        'subtitle_style': load_json_option(args.style) if args.style else None,
+        'asr_deadline': args.asr_deadline,
+        'subtitle_mode': args.mode,
+        'extra_languages': args.extra_lang,
+        'render_profile': args.profile,
+    }
+    jobs = []
+    for index, entry in enumerate(entries):
+        options = dict(defaults)
+        options.update({key: entry[key] for key in MANIFEST_OPTIONS if key in entry})
+        jobs.append({
+            'source': entry['source'],
+            'title': entry.get('title') or entry['source'],
+            'output_dir': os.path.join(args.output_dir, _job_dir_name(index, entry['source'])),
+            'options': options
+        })
+    return jobs
+
+def build_summary(results, wall_seconds):
+    """汇总每个视频和各阶段的耗时"""
+    stage_totals = {}
+    jobs = []
+    for result in results:
+        for name, seconds in result['timings'].items():
+            stage_totals[name] = stage_totals.get(name, 0.0) + seconds
+        jobs.append({
+            'source': result['source'],
+            'title': result['title'],
+            'success': result['success'],
+            'error': result['error'],
+            'outputs': [path for path, _ in result['outputs']],
+            'timings': {name: round(seconds, 3) for name, seconds in result['timings'].items()},
+            'finished_after': round(result['wall_seconds'], 3)
+        })
+    succeeded = sum(1 for result in results if result['success'])
+    return {
+        'wall_seconds': round(wall_seconds, 3),
+        'total': len(results),
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'stage_totals': {
+            name: round(stage_totals[name], 3)
+            for name in PIPELINE_STAGES if name in stage_totals
+        },
+        'jobs': jobs
+    }
+
+def write_summary(summary, path):
+    text = json.dumps(summary, ensure_ascii=False, indent=2)
+    if path == '-':
+        print(text)
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    print(f"耗时汇总已保存到 {path}")
+
+def main(argv=None):
+    """
+    命令行入口
+
+    Returns:
+        退出状态码：0 全部成功，1 有视频处理失败，2 没有可处理的视频，130 被中断
+    """
+    args = parse_args(argv)
+    entries = collect_inputs(args.inputs)
+    if not entries:
+        print("没有找到可处理的视频", file=sys.stderr)
+        return 2
+    jobs = build_jobs(entries, args)
+    os.makedirs(args.output_dir, exist_ok=True)
+    print(f"共 {len(jobs)} 个视频，同时处理 {args.workers} 个，同时下载 {args.download_workers} 个")
+
+    def on_item(result):
+        status = "完成" if result['success'] else f"失败: {result['error']}"
+        print(f"[{result['index'] + 1}/{len(jobs)}] {result['title']} {status}（{result['wall_seconds']:.1f} 秒）")
+
+    def on_interrupt(signum, frame):
+        # 先终止所有仍在运行的 FFmpeg/yt-dlp 进程，工作线程才能尽快结束
+        cancel_session(BATCH_SESSION_ID)
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGINT, on_interrupt)
+    started = time.monotonic()
+    try:
+        with job_context(session_id=BATCH_SESSION_ID, timeout=args.timeout):
+            results = run_jobs(jobs, args.download_workers, args.workers, args.asr_workers, on_item=on_item)
+    except KeyboardInterrupt:
+        print("已中断", file=sys.stderr)
+        return 130
+
+    summary = build_summary(results, time.monotonic() - started)
+    write_summary(summary, args.summary or os.path.join(args.output_dir, 'batch_summary.json'))
+    print(f"成功 {summary['succeeded']} 个，失败 {summary['failed']} 个，总耗时 {summary['wall_seconds']:.1f} 秒")
+    return 1 if summary['failed'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
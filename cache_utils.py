@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+# 所有本地缓存的根目录，可通过环境变量覆盖
+CACHE_ROOT = os.environ.get('VIDEO_TRANSLATE_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'video_translate_cache')
+
+def get_cache_dir(name, root=None):
+    """获取（并创建）指定名称的缓存子目录"""
+    path = os.path.join(root or CACHE_ROOT, name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+# 进程内最多缓存的文件指纹数
+FINGERPRINT_MEMORY_ENTRIES = 256
+# 读取文件计算指纹时每次读取的字节数
+FINGERPRINT_BLOCK_SIZE = 1 << 20
+
+# 已计算的指纹（按最近使用排序），键为 (设备, inode, 大小, 修改时间)
+_FINGERPRINTS = OrderedDict()
+_FINGERPRINT_LOCK = threading.Lock()
+
+def file_fingerprint(path):
+    """
+    计算文件内容指纹（完整内容的 SHA-256），与文件名无关
+    用作识别缓存、阶段清单和关键帧索引的键，因此必须覆盖全部内容：只抽样部分数据时，
+    大小相同、只有未抽样部分不同的两个文件（例如只替换了一段音频的重新导出）会得到相同的指纹。
+    按 (设备, inode, 大小, 修改时间) 在进程内缓存，同一文件（包括硬链接）不会重复读取
+
+    Args:
+        path: 文件路径
+
+    Returns:
+        十六进制的 SHA-256 指纹
+    """
+    stat = os.stat(path)
+    identity = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    with _FINGERPRINT_LOCK:
+        fingerprint = _FINGERPRINTS.get(identity)
+        if fingerprint is not None:
+            _FINGERPRINTS.move_to_end(identity)
+            return fingerprint
+
+    digest = hashlib.sha256()
+    digest.update(str(stat.st_size).encode())
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(FINGERPRINT_BLOCK_SIZE), b''):
+            digest.update(block)
+    fingerprint = digest.hexdigest()
+
+    with _FINGERPRINT_LOCK:
+        _FINGERPRINTS[identity] = fingerprint
+        while len(_FINGERPRINTS) > FINGERPRINT_MEMORY_ENTRIES:
+            _FINGERPRINTS.popitem(last=False)
+    return fingerprint
+
+def hash_key(*parts):
+    """将任意可 JSON 序列化的参数组合成稳定的缓存键"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def atomic_write_json(path, data):
+    """先写入同目录下的临时文件再原子替换，避免并发会话读到写了一半的文件"""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def read_json(path):
+    """读取 JSON 文件，不存在或已损坏时返回None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def touch(path):
+    """更新文件修改时间，用于 LRU 淘汰"""
+    try:
+        now = time.time()
+        os.utime(path, (now, now))
+    except OSError:
+        pass
+
+def evict_lru(cache_dir, max_bytes):
+    """
+    按最近使用时间淘汰缓存文件，直到目录总大小不超过配额
+
+    Args:
+        cache_dir: 缓存目录
+        max_bytes: 允许的最大总字节数
+
+    Returns:
+        被删除的文件数量
+    """
+    entries = []
+    total = 0
+    for dirpath, _, filenames in os.walk(cache_dir):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            removed += 1
+        except OSError:
+            # 其他会话可能已删除或正在使用
+            continue
+
+    return removed
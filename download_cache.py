@@ -0,0 +1,256 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import socket
+import tempfile
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from cache_utils import get_cache_dir, hash_key, atomic_write_json, read_json, touch
+from process_runner import raise_if_cancelled
+
+# 下载缓存的磁盘配额（字节），可通过环境变量覆盖
+DOWNLOAD_CACHE_MAX_BYTES = int(os.environ.get('VIDEO_TRANSLATE_DOWNLOAD_CACHE_BYTES') or 5 * 1024 * 1024 * 1024)
+# 下载期间更新锁文件修改时间的间隔（秒）
+DOWNLOAD_LOCK_HEARTBEAT_SECONDS = 15
+# 其他会话正在下载同一视频时，锁文件超过该时间未更新视为已失效（秒）
+DOWNLOAD_LOCK_STALE_SECONDS = 4 * DOWNLOAD_LOCK_HEARTBEAT_SECONDS
+# 缓存条目中的文件名前缀，链接到任务目录时替换为 job_prefix
+CACHE_FILE_PREFIX = 'video'
+# 不影响内容的跟踪参数，规范化 URL 时去除
+TRACKING_PARAMS = ('utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content',
+                   'si', 'feature', 'spm_id_from', 'vd_source', 'share_source', 'share_medium')
+
+def normalize_url(url):
+    """规范化 URL：去除首尾空白、片段和跟踪参数，协议和域名小写，查询参数排序"""
+    parts = urlsplit(url.strip())
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in TRACKING_PARAMS)
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, urlencode(query), ''))
+
+def _variant_parts(variant):
+    # 完整视频不附加变体名，保持与早期缓存键一致
+    return () if variant == 'video' else (variant,)
+
+def url_cache_key(url, variant='video'):
+    """按规范化 URL 生成的缓存键，variant 区分完整视频和仅音频等不同下载内容"""
+    return hash_key('url', normalize_url(url), *_variant_parts(variant))
+
+def video_cache_key(video_id, variant='video'):
+    """按站点和视频ID（如 'Youtube:abc123'）生成的缓存键，不同链接形式指向同一视频时共享缓存"""
+    return hash_key('video', video_id, *_variant_parts(variant))
+
+def _downloads_dir():
+    return get_cache_dir('downloads')
+
+def _entry_dir(key):
+    return os.path.join(_downloads_dir(), key)
+
+def _alias_path(url, variant='video'):
+    return os.path.join(get_cache_dir(os.path.join('downloads', 'aliases')), f"{url_cache_key(url, variant)}.json")
+
+def lookup_download(key):
+    """
+    查找已完成的缓存条目
+
+    Returns:
+        条目的完成目录，未命中时返回None
+    """
+    complete_dir = os.path.join(_entry_dir(key), 'complete')
+    entry_path = os.path.join(complete_dir, 'entry.json')
+    if not os.path.exists(entry_path):
+        return None
+    touch(entry_path)
+    return complete_dir
+
+def lookup_download_by_url(url, variant='video'):
+    """按 URL 查找缓存（不访问网络），用于重复提交同一链接时立即返回"""
+    alias = read_json(_alias_path(url, variant))
+    return lookup_download(alias['key']) if alias else None
+
+def register_url(url, key, variant='video'):
+    """记录 URL 对应的缓存条目"""
+    try:
+        atomic_write_json(_alias_path(url, variant), {'url': normalize_url(url), 'key': key})
+    except OSError as e:
+        print(f"保存下载缓存索引失败: {e}")
+
+def _pid_alive(pid):
+    if os.name == 'nt':
+        # Windows 上 os.kill 会终止进程，无法用于探测，只依赖心跳判断
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+def _lock_is_stale(lock_path):
+    """锁文件长时间未更新（持有者停止了心跳），或持有者是本机上已退出的进程时视为失效"""
+    if time.time() - os.path.getmtime(lock_path) > DOWNLOAD_LOCK_STALE_SECONDS:
+        return True
+    owner = read_json(lock_path)
+    if not isinstance(owner, dict) or owner.get('host') != socket.gethostname():
+        return False
+    return isinstance(owner.get('pid'), int) and not _pid_alive(owner['pid'])
+
+def _acquire_lock(entry_dir):
+    """
+    获取条目的下载锁；其他会话正在下载时等待（期间响应任务取消）
+    锁文件记录持有者的主机、进程和令牌，持有期间由 _lock_heartbeat 定期更新修改时间
+
+    Returns:
+        (锁文件路径, 令牌)；等待期间其他会话已完成下载时返回 (None, None)
+    """
+    lock_path = os.path.join(entry_dir, 'lock')
+    token = uuid.uuid4().hex
+    owner = json.dumps({'host': socket.gethostname(), 'pid': os.getpid(), 'token': token})
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.write(fd, owner.encode())
+            os.close(fd)
+            return lock_path, token
+        except FileExistsError:
+            try:
+                if _lock_is_stale(lock_path):
+                    print(f"下载锁已失效，重新获取: {lock_path}")
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                continue
+            if os.path.exists(os.path.join(entry_dir, 'complete', 'entry.json')):
+                return None, None
+            raise_if_cancelled()
+            time.sleep(1)
+
+def _release_lock(lock_path, token):
+    """只删除自己持有的锁，锁已被判定失效并由其他会话重新获取时保留"""
+    owner = read_json(lock_path)
+    if isinstance(owner, dict) and owner.get('token') == token:
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+
+@contextmanager
+def _lock_heartbeat(lock_path):
+    """持有下载锁期间在后台线程中定期更新锁文件的修改时间，表明下载仍在进行"""
+    stopped = threading.Event()
+
+    def beat():
+        while not stopped.wait(DOWNLOAD_LOCK_HEARTBEAT_SECONDS):
+            touch(lock_path)
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+def download_to_cache(key, download, metadata=None):
+    """
+    下载到缓存条目：写入 partial 目录（保留未完成的文件以便续传），完成后原子重命名为 complete
+
+    Args:
+        key: 缓存键（见 url_cache_key / video_cache_key）
+        download: 下载函数 download(partial_dir, file_prefix)，失败时抛出异常
+        metadata: 保存到 entry.json 的附加信息
+
+    Returns:
+        条目的完成目录
+    """
+    entry_dir = _entry_dir(key)
+    os.makedirs(entry_dir, exist_ok=True)
+    complete_dir = lookup_download(key)
+    if complete_dir:
+        return complete_dir
+
+    lock_path, token = _acquire_lock(entry_dir)
+    if lock_path is None:
+        # 等待期间其他会话已完成下载
+        return lookup_download(key)
+    try:
+        complete_dir = lookup_download(key)
+        if complete_dir:
+            return complete_dir
+
+        partial_dir = os.path.join(entry_dir, 'partial')
+        os.makedirs(partial_dir, exist_ok=True)
+        with _lock_heartbeat(lock_path):
+            download(partial_dir, CACHE_FILE_PREFIX)
+
+        atomic_write_json(os.path.join(partial_dir, 'entry.json'), dict(metadata or {}, completed_at=time.time()))
+        complete_dir = os.path.join(entry_dir, 'complete')
+        os.replace(partial_dir, complete_dir)
+    finally:
+        _release_lock(lock_path, token)
+
+    evict_downloads(DOWNLOAD_CACHE_MAX_BYTES, keep=key)
+    return complete_dir
+
+def link_into_job(complete_dir, output_dir, job_prefix='downloaded_video'):
+    """
+    将缓存条目中的文件放入新建的任务专属目录（优先使用硬链接，不占额外空间，
+    缓存被淘汰后任务文件仍然有效；跨文件系统时复制）
+
+    Returns:
+        任务目录
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    job_dir = tempfile.mkdtemp(prefix='download_', dir=output_dir)
+    for name in os.listdir(complete_dir):
+        if name == 'entry.json' or not name.startswith(CACHE_FILE_PREFIX + '.'):
+            continue
+        source = os.path.join(complete_dir, name)
+        target = os.path.join(job_dir, job_prefix + name[len(CACHE_FILE_PREFIX):])
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+    return job_dir
+
+def _dir_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                continue
+    return total
+
+def evict_downloads(max_bytes=DOWNLOAD_CACHE_MAX_BYTES, keep=None):
+    """
+    按最近使用时间淘汰已完成的下载条目，直到总大小不超过配额
+    正在下载的条目（只有 partial 目录）计入总大小但不会被删除
+
+    Returns:
+        被删除的条目数量
+    """
+    downloads_dir = _downloads_dir()
+    entries = []
+    total = 0
+    for key in os.listdir(downloads_dir):
+        entry_dir = os.path.join(downloads_dir, key)
+        if key == 'aliases' or not os.path.isdir(entry_dir):
+            continue
+        size = _dir_size(entry_dir)
+        total += size
+        entry_path = os.path.join(entry_dir, 'complete', 'entry.json')
+        if key != keep and os.path.exists(entry_path) and not os.path.exists(os.path.join(entry_dir, 'lock')):
+            entries.append((os.path.getmtime(entry_path), size, entry_dir))
+
+    removed = 0
+    for _, size, entry_dir in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        total -= size
+        removed += 1
+    return removed
@@ -0,0 +1,259 @@
+import os
+import time
+import shutil
+import struct
+import threading
+import subprocess
+from cache_utils import get_cache_dir, atomic_write_json, read_json
+
+# 随项目提供的字体目录，可通过环境变量改为其他目录；渲染时作为 fontsdir 传给 libass
+FONTS_DIR = os.environ.get('VIDEO_TRANSLATE_FONTS_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts')
+FONT_EXTENSIONS = ('.ttf', '.otf', '.ttc', '.otc')
+# 请求的字体不存在时按顺序尝试的后备字体（优先覆盖中日韩文字的字体）
+FALLBACK_FONTS = [
+    'Noto Sans CJK SC', 'Source Han Sans SC', 'WenQuanYi Micro Hei', 'Microsoft YaHei',
+    'SimHei', 'PingFang SC', 'Arial', 'DejaVu Sans', 'Liberation Sans'
+]
+# 系统字体目录，目录修改时间变化时重新建立索引
+SYSTEM_FONT_DIRS = [
+    '/usr/share/fonts', '/usr/local/share/fonts',
+    os.path.expanduser('~/.fonts'), os.path.expanduser('~/.local/share/fonts'),
+    '/Library/Fonts', '/System/Library/Fonts',
+    os.path.join(os.environ.get('WINDIR', 'C:\\Windows'), 'Fonts')
+]
+# 索引格式版本，格式变化时递增
+FONT_INDEX_VERSION = 1
+# 进程内的索引每隔多久检查一次字体文件和系统字体目录是否变化（秒）
+FONT_INDEX_CHECK_SECONDS = 60
+
+# 当前进程内的字体索引；建立索引时持有 _FONT_LOCK
+_FONT_INDEX = None
+_FONT_INDEX_SIGNATURE = None
+_FONT_INDEX_CHECKED = 0.0
+# 索引每次重新建立时递增，依赖字体解析结果的缓存以此判断是否失效
+_FONT_INDEX_GENERATION = 0
+_FONT_LOCK = threading.Lock()
+# 预热线程的句柄只在 _WARM_UP_LOCK 下创建；预热（可能长达数分钟的 fc-cache）结束后置位 _WARM_UP_DONE
+_WARM_UP_LOCK = threading.Lock()
+_WARM_UP_DONE = threading.Event()
+_WARM_UP_THREAD = None
+
+def _read_name_table(f, offset):
+    """读取 sfnt 字体中的字体族名（nameID 1 和 16，所有语言）"""
+    f.seek(offset)
+    _, num_tables = struct.unpack('>IH', f.read(6))
+    f.seek(offset + 12)
+    name_offset = None
+    for _ in range(num_tables):
+        tag, _, table_offset, _ = struct.unpack('>4sIII', f.read(16))
+        if tag == b'name':
+            name_offset = table_offset
+            break
+    if name_offset is None:
+        return set()
+
+    f.seek(name_offset)
+    _, count, string_offset = struct.unpack('>HHH', f.read(6))
+    records = [struct.unpack('>6H', f.read(12)) for _ in range(count)]
+
+    families = set()
+    for platform_id, encoding_id, _, name_id, length, str_offset in records:
+        if name_id not in (1, 16):
+            continue
+        f.seek(name_offset + string_offset + str_offset)
+        raw = f.read(length)
+        if platform_id in (0, 3):
+            name = raw.decode('utf-16-be', errors='ignore')
+        elif platform_id == 1 and encoding_id == 0:
+            name = raw.decode('mac_roman', errors='ignore')
+        else:
+            continue
+        if name.strip():
+            families.add(name.strip())
+    return families
+
+def read_font_families(font_path):
+    """读取字体文件（含 TTC 字体集合）中的所有字体族名，无法解析时返回空集合"""
+    try:
+        with open(font_path, 'rb') as f:
+            tag = f.read(4)
+            if tag == b'ttcf':
+                _, num_fonts = struct.unpack('>II', f.read(8))
+                offsets = struct.unpack(f'>{num_fonts}I', f.read(4 * num_fonts))
+            else:
+                offsets = (0,)
+            families = set()
+            for offset in offsets:
+                families |= _read_name_table(f, offset)
+            return families
+    except (OSError, struct.error):
+        return set()
+
+def _managed_font_files(fonts_dir=None):
+    fonts_dir = fonts_dir or FONTS_DIR
+    if not os.path.isdir(fonts_dir):
+        return []
+    font_files = []
+    for dirpath, _, filenames in os.walk(fonts_dir):
+        for name in filenames:
+            if name.lower().endswith(FONT_EXTENSIONS):
+                font_files.append(os.path.join(dirpath, name))
+    return sorted(font_files)
+
+def has_managed_fonts(fonts_dir=None):
+    """字体目录中是否有字体文件"""
+    return bool(_managed_font_files(fonts_dir))
+
+def _index_signature(font_files):
+    """字体文件和系统字体目录的修改时间，用于判断磁盘上的索引是否失效"""
+    signature = {'fc-list': shutil.which('fc-list'), 'files': {}, 'dirs': {}}
+    for path in font_files:
+        try:
+            stat = os.stat(path)
+            signature['files'][path] = [stat.st_size, stat.st_mtime]
+        except OSError:
+            continue
+    for directory in SYSTEM_FONT_DIRS:
+        try:
+            signature['dirs'][directory] = os.path.getmtime(directory)
+        except OSError:
+            continue
+    return signature
+
+def _system_families():
+    """通过 fc-list 获取系统已安装的字体族名（fontconfig 不可用时返回空列表）"""
+    fc_list = shutil.which('fc-list')
+    if not fc_list:
+        return []
+    try:
+        result = subprocess.run([fc_list, ':', 'family'], capture_output=True, text=True, encoding='utf-8', errors='replace', timeout=120)
+    except (subprocess.SubprocessError, OSError):
+        return []
+    families = set()
+    for line in result.stdout.splitlines():
+        families.update(name.strip().replace('\\-', '-') for name in line.split(',') if name.strip())
+    return sorted(families)
+
+def _build_font_index(refresh=False):
+    """建立字体索引，返回 (索引, 建立时的签名)"""
+    font_files = _managed_font_files()
+    signature = _index_signature(font_files)
+    cache_path = os.path.join(get_cache_dir('fonts'), 'index.json')
+    cached = None if refresh else read_json(cache_path)
+    if cached and cached.get('version') == FONT_INDEX_VERSION and cached.get('signature') == signature:
+        return cached['index'], signature
+
+    # 键为小写族名：{'family': 族名, 'files': 项目字体文件列表, 'system': 是否系统已安装}
+    index = {}
+    for path in font_files:
+        for family in read_font_families(path):
+            entry = index.setdefault(family.lower(), {'family': family, 'files': [], 'system': False})
+            entry['files'].append(path)
+    for family in _system_families():
+        index.setdefault(family.lower(), {'family': family, 'files': [], 'system': True})['system'] = True
+
+    try:
+        atomic_write_json(cache_path, {'version': FONT_INDEX_VERSION, 'signature': signature, 'index': index})
+    except OSError as e:
+        print(f"保存字体索引失败: {e}")
+    return index, signature
+
+def get_font_index(refresh=False):
+    """
+    获取可用字体族索引（项目字体目录 + 系统字体）
+    结果缓存在进程内和磁盘上；每隔 FONT_INDEX_CHECK_SECONDS 检查一次，字体文件或系统字体目录变化时重新建立
+
+    Returns:
+        {小写族名: {'family': 族名, 'files': [...], 'system': bool}}
+    """
+    global _FONT_INDEX, _FONT_INDEX_SIGNATURE, _FONT_INDEX_CHECKED, _FONT_INDEX_GENERATION
+    _wait_for_warm_up()
+    with _FONT_LOCK:
+        now = time.monotonic()
+        if _FONT_INDEX is not None and not refresh and now - _FONT_INDEX_CHECKED >= FONT_INDEX_CHECK_SECONDS:
+            _FONT_INDEX_CHECKED = now
+            refresh = _index_signature(_managed_font_files()) != _FONT_INDEX_SIGNATURE
+        if _FONT_INDEX is None or refresh:
+            _FONT_INDEX, _FONT_INDEX_SIGNATURE = _build_font_index(refresh)
+            _FONT_INDEX_CHECKED = now
+            _FONT_INDEX_GENERATION += 1
+        return _FONT_INDEX
+
+def font_index_generation():
+    """当前字体索引的版本号，字体变化导致索引重新建立后递增"""
+    get_font_index()
+    return _FONT_INDEX_GENERATION
+
+def list_font_families(managed_only=False):
+    """列出可用字体族名，managed_only=True 时只列出项目字体目录中的字体"""
+    return sorted(
+        entry['family'] for entry in get_font_index().values()
+        if entry['files'] or not managed_only
+    )
+
+def resolve_font(font):
+    """
+    检查请求的字体是否可用，不可用时返回确定的后备字体，避免 libass 随意回退
+
+    Args:
+        font: 样式中的字体名
+
+    Returns:
+        实际使用的字体族名；无法获取字体列表时（例如没有 fontconfig）原样返回
+    """
+    index = get_font_index()
+    if not index:
+        return font
+    entry = index.get((font or '').lower())
+    if entry:
+        return entry['family']
+
+    for fallback in FALLBACK_FONTS:
+        if fallback.lower() in index:
+            print(f"字体 {font} 不可用，使用 {index[fallback.lower()]['family']}")
+            return index[fallback.lower()]['family']
+    managed = list_font_families(managed_only=True)
+    if managed:
+        print(f"字体 {font} 不可用，使用 {managed[0]}")
+        return managed[0]
+    return font
+
+def _wait_for_warm_up():
+    # 预热已开始时，其他线程等待 fontconfig 缓存建立完成再使用字体（预热线程自己不等待）
+    thread = _WARM_UP_THREAD
+    if thread is not None and thread is not threading.current_thread():
+        _WARM_UP_DONE.wait()
+
+def _warm_up():
+    try:
+        # 预先建立 fontconfig 缓存（只更新过期的部分），首次渲染不再扫描全部字体；
+        # 运行期间不持有任何锁，页面重新运行时调用 warm_up_fonts 不会被阻塞
+        fc_cache = shutil.which('fc-cache')
+        if fc_cache:
+            cmd = [fc_cache]
+            if os.path.isdir(FONTS_DIR):
+                cmd.append(FONTS_DIR)
+            try:
+                subprocess.run(cmd, capture_output=True, timeout=600)
+            except (subprocess.SubprocessError, OSError) as e:
+                print(f"预热字体缓存失败: {e}")
+        get_font_index()
+    finally:
+        _WARM_UP_DONE.set()
+
+def warm_up_fonts(background=True):
+    """
+    启动时预热字体：建立 fontconfig 缓存和字体索引，每个进程只执行一次，重复调用立即返回
+    预热期间调用 get_font_index/resolve_font 的线程会等待预热完成
+
+    Args:
+        background: 是否在后台线程中执行
+    """
+    global _WARM_UP_THREAD
+    with _WARM_UP_LOCK:
+        if _WARM_UP_THREAD is None:
+            _WARM_UP_THREAD = threading.Thread(target=_warm_up, daemon=True)
+            _WARM_UP_THREAD.start()
+    if not background:
+        _WARM_UP_DONE.wait()
+    return _WARM_UP_THREAD
@@ -0,0 +1,231 @@
+import os
+import time
+import sqlite3
+import platform
+from contextlib import closing
+from cache_utils import get_cache_dir
+
+# 参与拟合的最近任务数
+MODEL_SAMPLE_LIMIT = 20
+# 进度达到该百分比之前，剩余时间主要参考历史估算（FFmpeg 的速度此时还不稳定）
+ETA_WARMUP_PERCENT = 10.0
+
+JOB_COLUMNS = [
+    'created_at', 'host', 'mode', 'profile', 'encoder', 'codec', 'width', 'height', 'fps',
+    'duration', 'cue_count', 'output_count', 'work', 'wall_seconds', 'success', 'error'
+]
+
+def _db_path():
+    return os.path.join(get_cache_dir('render_stats'), 'jobs.sqlite3')
+
+def _connect():
+    conn = sqlite3.connect(_db_path(), timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at REAL NOT NULL,
+            host TEXT NOT NULL,
+            mode TEXT,
+            profile TEXT,
+            encoder TEXT,
+            codec TEXT,
+            width INTEGER,
+            height INTEGER,
+            fps REAL,
+            duration REAL,
+            cue_count INTEGER,
+            output_count INTEGER,
+            work REAL,
+            wall_seconds REAL,
+            success INTEGER,
+            error TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS jobs_model ON jobs (host, mode, profile, encoder, created_at)")
+    return conn
+
+def render_work(duration, fps, width, height, output_count=1):
+    """
+    渲染工作量：输出的百万像素帧数（时长 × 帧率 × 输出分辨率 × 输出个数）
+    不同分辨率和时长的任务换算为同一单位后才能用同一个吞吐量模型估算
+    """
+    if not duration or not fps or not width or not height:
+        return None
+    return duration * fps * width * height / 1000000.0 * max(1, output_count)
+
+def record_job(**fields):
+    """
+    记录一次渲染任务的统计信息
+
+    Args:
+        fields: JOB_COLUMNS 中的字段；host 和 created_at 未提供时自动填写
+    """
+    fields.setdefault('created_at', time.time())
+    fields.setdefault('host', platform.node())
+    if fields.get('work') is None:
+        fields['work'] = render_work(
+            fields.get('duration'), fields.get('fps'), fields.get('width'), fields.get('height'),
+            fields.get('output_count') or 1
+        )
+    columns = [c for c in JOB_COLUMNS if c in fields]
+    try:
+        with closing(_connect()) as conn, conn:
+            conn.execute(
+                f"INSERT INTO jobs ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                [fields[c] for c in columns]
+            )
+    except sqlite3.Error as e:
+        print(f"保存渲染统计失败: {e}")
+
+def query_jobs(host=None, mode=None, profile=None, since=None, success_only=False, limit=100):
+    """
+    查询历史任务（最新的在前）
+
+    Args:
+        host: 主机名，默认本机；传入 '*' 查询所有主机
+        mode: 渲染方式
+        profile: 渲染配置
+        since: 只返回该时间戳之后的任务
+        success_only: 只返回成功的任务
+        limit: 最多返回条数
+
+    Returns:
+        任务字典列表，额外包含 throughput（百万像素帧/秒）
+    """
+    conditions = []
+    params = []
+    host = platform.node() if host is None else host
+    if host != '*':
+        conditions.append("host = ?")
+        params.append(host)
+    for column, value in (('mode', mode), ('profile', profile)):
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            params.append(value)
+    if since is not None:
+        conditions.append("created_at >= ?")
+        params.append(since)
+    if success_only:
+        conditions.append("success = 1")
+
+    sql = "SELECT *, work / wall_seconds AS throughput FROM jobs"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY created_at DESC LIMIT ?"
+    params.append(limit)
+    try:
+        with closing(_connect()) as conn:
+            return [dict(row) for row in conn.execute(sql, params)]
+    except sqlite3.Error as e:
+        print(f"读取渲染统计失败: {e}")
+        return []
+
+def daily_throughput(host=None, days=30):
+    """
+    按天汇总本机各渲染方式/配置的平均吞吐量，用于发现性能退化
+
+    Returns:
+        [{'day', 'mode', 'profile', 'encoder', 'jobs', 'throughput'}, ...]，按日期升序
+    """
+    sql = """
+        SELECT date(created_at, 'unixepoch') AS day, mode, profile, encoder,
+               COUNT(*) AS jobs, AVG(work / wall_seconds) AS throughput
+        FROM jobs
+        WHERE host = ? AND success = 1 AND work > 0 AND wall_seconds > 0 AND created_at >= ?
+        GROUP BY day, mode, profile, encoder
+        ORDER BY day
+    """
+    try:
+        with closing(_connect()) as conn:
+            rows = conn.execute(sql, [host or platform.node(), time.time() - days * 86400])
+            return [dict(row) for row in rows]
+    except sqlite3.Error as e:
+        print(f"读取渲染统计失败: {e}")
+        return []
+
+def fit_throughput_model(mode, profile, encoder, host=None):
+    """
+    根据最近的成功任务拟合 wall_seconds = overhead + work * seconds_per_work
+
+    Returns:
+        {'overhead': 秒, 'seconds_per_work': 秒/百万像素帧, 'samples': 样本数}，没有样本时返回None
+    """
+    sql = """
+        SELECT work, wall_seconds FROM jobs
+        WHERE host = ? AND mode = ? AND profile = ? AND encoder = ?
+          AND success = 1 AND work > 0 AND wall_seconds > 0
+        ORDER BY created_at DESC LIMIT ?
+    """
+    try:
+        with closing(_connect()) as conn:
+            samples = [(row['work'], row['wall_seconds']) for row in conn.execute(
+                sql, [host or platform.node(), mode, profile, encoder, MODEL_SAMPLE_LIMIT]
+            )]
+    except sqlite3.Error as e:
+        print(f"读取渲染统计失败: {e}")
+        return None
+    if not samples:
+        return None
+
+    # 样本足够且工作量有差异时做最小二乘拟合，否则使用比值的中位数
+    if len(samples) >= 3:
+        n = float(len(samples))
+        mean_work = sum(w for w, _ in samples) / n
+        mean_wall = sum(t for _, t in samples) / n
+        variance = sum((w - mean_work) ** 2 for w, _ in samples)
+        if variance > 0:
+            slope = sum((w - mean_work) * (t - mean_wall) for w, t in samples) / variance
+            overhead = mean_wall - slope * mean_work
+            if slope > 0 and overhead >= 0:
+                return {'overhead': overhead, 'seconds_per_work': slope, 'samples': len(samples)}
+
+    ratios = sorted(t / w for w, t in samples)
+    return {'overhead': 0.0, 'seconds_per_work': ratios[len(ratios) // 2], 'samples': len(samples)}
+
+def estimate_seconds(work, mode, profile, encoder, calibrated_fps=None):
+    """
+    估算渲染耗时
+
+    Args:
+        work: 工作量（见 render_work）
+        mode: 渲染方式
+        profile: 渲染配置
+        encoder: 视频编码器
+        calibrated_fps: 没有历史任务时使用的校准速度（1080p 帧/秒，见 render_profiles.get_profile_fps）
+
+    Returns:
+        预计秒数，无法估算时返回None
+    """
+    if not work:
+        return None
+    model = fit_throughput_model(mode, profile, encoder)
+    if model is None and mode != 'burn':
+        # 该渲染方式还没有数据时参考普通烧录
+        model = fit_throughput_model('burn', profile, encoder)
+    if model:
+        return model['overhead'] + work * model['seconds_per_work']
+    if calibrated_fps:
+        return work / (calibrated_fps * 1920 * 1080 / 1000000.0)
+    return None
+
+def blend_eta(estimated_total, elapsed, percent=None, progress_eta=None):
+    """
+    渲染过程中的剩余时间：开始阶段以历史估算为主，随进度逐渐过渡到 FFmpeg 实测速度
+
+    Args:
+        estimated_total: 渲染前估算的总耗时（秒），可为None
+        elapsed: 已用时间（秒）
+        percent: 当前进度百分比
+        progress_eta: 根据 FFmpeg 进度计算的剩余时间
+
+    Returns:
+        剩余秒数，无法估算时返回None
+    """
+    estimate_eta = max(0.0, estimated_total - elapsed) if estimated_total else None
+    if progress_eta is None or percent is None:
+        return estimate_eta
+    if estimate_eta is None:
+        return progress_eta
+    weight = min(1.0, percent / ETA_WARMUP_PERCENT)
+    return weight * progress_eta + (1 - weight) * estimate_eta
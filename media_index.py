@@ -0,0 +1,221 @@
+import os
+import re
+import sys
+import zlib
+import array
+import bisect
+import struct
+import tempfile
+import threading
+import subprocess
+from collections import OrderedDict
+from cache_utils import get_cache_dir, file_fingerprint, touch
+from process_runner import run_process
+
+# 索引文件格式：魔数 + (关键帧数, 场景切换数) + zlib 压缩的差分 int64 微秒时间戳
+INDEX_MAGIC = b'KFI1'
+INDEX_HEADER = struct.Struct('<4sII')
+# 场景切换检测阈值（0~1，越大越不敏感）
+SCENE_THRESHOLD = 0.4
+
+# 当前进程内最多保留的索引数
+INDEX_MEMORY_ENTRIES = 64
+
+# 当前进程内已加载的索引（按最近使用排序），键为 (文件指纹, 是否包含场景)
+_INDEX_MEMORY = OrderedDict()
+_INDEX_LOCK = threading.Lock()
+
+def _probe_start_time(video_path):
+    cmd = ['ffprobe', '-v', 'error', '-show_entries', 'format=start_time', '-of', 'csv=p=0', video_path]
+    try:
+        return float(run_process(cmd, heavy=False).stdout.strip() or 0)
+    except (subprocess.SubprocessError, OSError, ValueError):
+        return 0.0
+
+def _scan_keyframes(video_path):
+    """只读取数据包标记获取关键帧，不解码视频帧；ffprobe 失败时抛出 subprocess.CalledProcessError"""
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags',
+        '-of', 'csv=p=0',
+        video_path
+    ]
+    # 只读取数据包，不占用重负载名额；同样响应任务取消和超时
+    result = run_process(cmd, heavy=False)
+
+    keyframes = []
+    for line in result.stdout.splitlines():
+        fields = line.strip().split(',')
+        if len(fields) >= 2 and 'K' in fields[1]:
+            try:
+                keyframes.append(float(fields[0]))
+            except ValueError:
+                continue
+    return keyframes, []
+
+def _scan_keyframes_and_scenes(video_path, threshold):
+    """一次解码同时得到关键帧和场景切换点；FFmpeg 失败时抛出 subprocess.CalledProcessError"""
+    cmd = [
+        'ffmpeg', '-hide_banner', '-nostats',
+        '-i', video_path,
+        '-map', '0:v:0',
+        '-vf', f"select='eq(key\\,1)+gt(scene\\,{threshold})',showinfo",
+        '-f', 'null', '-'
+    ]
+    result = run_process(cmd)
+
+    keyframes = []
+    scenes = []
+    for line in result.stderr.splitlines():
+        if 'Parsed_showinfo' not in line:
+            continue
+        match = re.search(r'pts_time:\s*(-?[\d.]+)', line)
+        if not match:
+            continue
+        timestamp = float(match.group(1))
+        if re.search(r'iskey:\s*1', line):
+            keyframes.append(timestamp)
+        else:
+            scenes.append(timestamp)
+    return keyframes, scenes
+
+def _encode_times(times):
+    """时间戳（秒）-> 差分后的 int64 微秒数组"""
+    values = array.array('q')
+    previous = 0
+    for t in times:
+        micros = int(round(t * 1000000))
+        values.append(micros - previous)
+        previous = micros
+    return values
+
+def _decode_times(values):
+    times = []
+    current = 0
+    for delta in values:
+        current += delta
+        times.append(current / 1000000.0)
+    return times
+
+def save_index(path, keyframes, scenes):
+    """以紧凑的二进制格式保存索引（先写临时文件再原子替换）"""
+    key_deltas = _encode_times(keyframes)
+    scene_deltas = _encode_times(scenes)
+    if sys.byteorder == 'big':
+        key_deltas.byteswap()
+        scene_deltas.byteswap()
+
+    # 同一进程中的多个会话可能同时保存同一索引，每次写入使用独立的临时文件
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, len(key_deltas), len(scene_deltas)))
+            f.write(zlib.compress(key_deltas.tobytes() + scene_deltas.tobytes()))
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def load_index(path):
+    """读取索引文件，不存在或格式不符时返回None"""
+    try:
+        with open(path, 'rb') as f:
+            magic, key_count, scene_count = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+            payload = zlib.decompress(f.read())
+    except (OSError, struct.error, zlib.error):
+        return None
+    if magic != INDEX_MAGIC:
+        return None
+
+    values = array.array('q')
+    values.frombytes(payload)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    if len(values) != key_count + scene_count:
+        return None
+    return {
+        'keyframes': _decode_times(values[:key_count]),
+        'scenes': _decode_times(values[key_count:])
+    }
+
+def get_keyframe_index(video_path, with_scenes=False, scene_threshold=SCENE_THRESHOLD):
+    """
+    获取视频的关键帧（以及可选的场景切换）索引
+    同一内容的视频只扫描一次，结果按文件指纹缓存在内存和磁盘上
+
+    Args:
+        video_path: 视频路径
+        with_scenes: 是否同时检测场景切换（需要解码视频，较慢）
+        scene_threshold: 场景切换阈值
+
+    Returns:
+        {'keyframes': [...], 'scenes': [...]}，时间戳为相对视频开始的秒数，升序；
+        扫描失败时返回空列表（不缓存，下次重新扫描）
+
+    Raises:
+        ProcessCancelled / subprocess.TimeoutExpired: 扫描被取消或超时
+    """
+    fingerprint = file_fingerprint(video_path)
+    memory_key = (fingerprint, with_scenes)
+    with _INDEX_LOCK:
+        if memory_key in _INDEX_MEMORY:
+            _INDEX_MEMORY.move_to_end(memory_key)
+            return _INDEX_MEMORY[memory_key]
+
+    suffix = f"_scene{scene_threshold}" if with_scenes else ''
+    cache_path = os.path.join(get_cache_dir('keyframes'), f"{fingerprint}{suffix}.kfi")
+    index = load_index(cache_path)
+    if index is not None:
+        touch(cache_path)
+    else:
+        try:
+            if with_scenes:
+                keyframes, scenes = _scan_keyframes_and_scenes(video_path, scene_threshold)
+            else:
+                keyframes, scenes = _scan_keyframes(video_path)
+        except (subprocess.CalledProcessError, OSError) as e:
+            print(f"扫描关键帧失败: {e}")
+            return {'keyframes': [], 'scenes': []}
+        if not keyframes:
+            # 正常的视频至少有一个关键帧，空结果多半是读取出错，不缓存
+            print(f"未扫描到关键帧: {video_path}")
+            return {'keyframes': [], 'scenes': scenes}
+
+        start_time = _probe_start_time(video_path)
+        index = {
+            'keyframes': sorted(set(max(0.0, t - start_time) for t in keyframes)),
+            'scenes': sorted(set(max(0.0, t - start_time) for t in scenes))
+        }
+        try:
+            save_index(cache_path, index['keyframes'], index['scenes'])
+        except OSError as e:
+            print(f"保存关键帧索引失败: {e}")
+
+    with _INDEX_LOCK:
+        _INDEX_MEMORY[memory_key] = index
+        _INDEX_MEMORY.move_to_end(memory_key)
+        while len(_INDEX_MEMORY) > INDEX_MEMORY_ENTRIES:
+            _INDEX_MEMORY.popitem(last=False)
+    return index
+
+def keyframe_at_or_before(keyframes, t):
+    """不晚于 t 的最后一个关键帧，没有时返回None"""
+    i = bisect.bisect_right(keyframes, t)
+    return keyframes[i - 1] if i > 0 else None
+
+def keyframe_at_or_after(keyframes, t):
+    """不早于 t 的第一个关键帧，没有时返回None"""
+    i = bisect.bisect_left(keyframes, t)
+    return keyframes[i] if i < len(keyframes) else None
+
+def nearest_keyframe(keyframes, t):
+    """距离 t 最近的关键帧，没有关键帧时返回None"""
+    candidates = [k for k in (keyframe_at_or_before(keyframes, t), keyframe_at_or_after(keyframes, t)) if k is not None]
+    return min(candidates, key=lambda k: abs(k - t)) if candidates else None
+
+def keyframes_between(keyframes, start, end):
+    """[start, end) 区间内的关键帧"""
+    return keyframes[bisect.bisect_left(keyframes, start):bisect.bisect_left(keyframes, end)]
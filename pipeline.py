@@ -0,0 +1,384 @@
+import os
+import time
+import threading
+import traceback
+import subprocess
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import pysrt
+from subtitle_processor import extract_subtitles, translate_subtitles, merge_subtitles, find_platform_subtitles
+from subtitle_processor import has_translation_credentials
+from video_processor import process_video, render_multi_output, auto_generate_subtitles, compile_subtitle_styles
+from video_processor import estimate_render_time, soft_subtitle_output_path, download_video_from_url, list_playlist_entries
+from video_processor import resolve_subtitle_asr_engine, SUBTITLE_ASR_MODEL
+from process_runner import bind_job_context, cancel_background, is_cancelled
+from stage_manifest import load_manifest, run_stage, forget_stage
+
+# 批量处理（播放列表、命令行）时同时下载的视频数（网络）
+DOWNLOAD_WORKERS = 3
+# 同时处理（识别、翻译、渲染）的视频数；渲染进程另受 process_runner 的重负载进程数限制
+PROCESS_WORKERS = 2
+# 同时进行语音识别的视频数：识别在进程内共享模型且占满 CPU，并行只会相互拖慢
+ASR_WORKERS = 1
+
+# 流水线阶段：subtitles（提取或识别字幕）、translate、download（等待后台下载的视频）、merge、render
+PIPELINE_STAGES = ['subtitles', 'translate', 'download', 'merge', 'render']
+
+@contextmanager
+def _no_stage(name, **info):
+    yield
+
+@contextmanager
+def _acquire(slots):
+    if slots is None:
+        yield
+        return
+    with slots:
+        yield
+
+def _subtitle_inputs(video_path):
+    """字幕阶段的输入：视频本身，以及 extract_subtitles 会读取的同名SRT和平台字幕"""
+    inputs = [video_path]
+    srt_path = os.path.splitext(video_path)[0] + '.srt'
+    if os.path.exists(srt_path):
+        inputs.append(srt_path)
+    inputs += [item['path'] for item in find_platform_subtitles(video_path)]
+    return inputs
+
+def translate_video(video_path, output_dir, target_lang, api_choice, api_key, secret_key=None, merge_below=True,
+                    auto_subtitle=True, subtitle_style=None, asr_deadline=None, subtitle_mode="burn",
+                    extra_languages=None, render_profile=None, video_future=None, stage=None, asr_slots=None):
+    """
+    翻译一个视频：提取或自动生成字幕 → 翻译 → 合并字幕 → 渲染
+    各阶段的输出记录在任务目录的阶段清单中（见 stage_manifest）：重新运行时只执行输入内容或参数变化的阶段，
+    例如只修改字幕样式时不会重新识别和翻译
+
+    Args:
+        video_path: 视频路径；提供 video_future 时为仅音频的文件，只用于提取和识别字幕
+        output_dir: 中间文件和输出视频的目录
+        target_lang: 目标语言，extra_languages 中的语言会一起生成
+        video_future: 后台下载完整视频的 Future（见 prefetch_video_from_url），渲染前等待其完成
+        stage: 阶段钩子 stage(名称, **信息)，返回上下文管理器，用于显示进度或记录耗时；
+               render 阶段的信息包含 mode 和 estimate（预计渲染秒数，可能为None）
+        asr_slots: 限制同时识别数的信号量（批量处理时使用）
+        其余参数与 app.process_uploaded_video 相同
+
+    Returns:
+        {'success': bool, 'outputs': [(输出路径, 下载文件名), ...], 'error': 失败原因或None}
+    """
+    try:
+        return _translate_video(
+            video_path, output_dir, target_lang, api_choice, api_key, secret_key, merge_below,
+            auto_subtitle, subtitle_style, asr_deadline, subtitle_mode, extra_languages,
+            render_profile, video_future, stage or _no_stage, asr_slots
+        )
+    finally:
+        # 在等待后台下载之前结束（未提取到字幕、翻译出错）时取消下载，不再占用网络和进程名额
+        if video_future is not None and not video_future.done():
+            cancel_background(video_future)
+
+def _translate_video(video_path, output_dir, target_lang, api_choice, api_key, secret_key, merge_below,
+                     auto_subtitle, subtitle_style, asr_deadline, subtitle_mode, extra_languages,
+                     render_profile, video_future, stage, asr_slots):
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = load_manifest(output_dir)
+
+    asr_stats = {}
+
+    def extract():
+        subtitles = extract_subtitles(video_path)
+        if not subtitles and auto_subtitle:
+            with _acquire(asr_slots):
+                subtitle_path = auto_generate_subtitles(video_path, output_dir, deadline_seconds=asr_deadline, stats=asr_stats)
+            if asr_stats.get('placeholder'):
+                # 没有可用的识别方式时只有提示安装 Whisper 的占位字幕，不能当作原文翻译和渲染
+                return None
+            if subtitle_path and os.path.exists(subtitle_path):
+                subtitles = pysrt.open(subtitle_path)
+        if not subtitles:
+            return None
+        source_path = os.path.join(output_dir, "source_subtitles.srt")
+        subtitles.save(source_path, encoding='utf-8')
+        return [source_path]
+
+    # 识别方式变化（例如安装了 Whisper）时重新生成字幕；有完成时限时模型按本机测得的速度自动选择，
+    # 以时限作为参数，避免每次测速后都重新识别
+    asr_params = {
+        'auto_subtitle': auto_subtitle,
+        'asr_deadline': asr_deadline,
+        'asr_engine': resolve_subtitle_asr_engine() if auto_subtitle else None,
+        'asr_model': SUBTITLE_ASR_MODEL if auto_subtitle and not asr_deadline else None
+    }
+    with stage('subtitles', auto_subtitle=auto_subtitle):
+        source_outputs = run_stage(
+            manifest, output_dir, 'subtitles', _subtitle_inputs(video_path), asr_params, extract
+        )
+    if asr_stats.get('placeholder'):
+        return {'success': False, 'outputs': [], 'error': "视频没有字幕，且没有可用的语音识别引擎（请安装 Whisper）"}
+    if not source_outputs:
+        return {'success': False, 'outputs': [], 'error': "未能从视频中提取到字幕，请确保视频包含嵌入式字幕或上传带有同名SRT文件"}
+    source_path = source_outputs[0]
+    subtitles = pysrt.open(source_path, encoding='utf-8')
+
+    # 翻译字幕（目标语言在前）
+    languages = [target_lang] + [lang for lang in (extra_languages or []) if lang != target_lang]
+    translated_paths = {}
+    translations = {}
+    credentials = has_translation_credentials(api_choice, api_key, secret_key)
+    with stage('translate', languages=languages):
+        for lang in languages:
+            stats = {}
+
+            def translate(lang=lang, stats=stats):
+                translated_path = os.path.join(output_dir, f"translated_subtitles_{lang}.srt")
+                translate_subtitles(
+                    subtitles,
+                    target_lang=lang,
+                    api_choice=api_choice,
+                    api_key=api_key,
+                    secret_key=secret_key,
+                    stats=stats
+                ).save(translated_path, encoding='utf-8')
+                return [translated_path]
+
+            # 没有密钥时翻译会退回备用方法，之后提供密钥应重新翻译
+            translated_paths[lang] = run_stage(
+                manifest, output_dir, f"translate:{lang}", [source_path],
+                {'target_lang': lang, 'api_choice': api_choice, 'credentials': credentials}, translate
+            )[0]
+            if stats.get('fallbacks'):
+                # 翻译接口出错时部分字幕退回了备用翻译：本次仍使用该结果，但不作为已完成的阶段复用
+                print(f"{stats['fallbacks']} 条字幕未能通过翻译接口翻译（{lang}），下次运行时重新翻译")
+                forget_stage(manifest, output_dir, f"translate:{lang}")
+            translations[lang] = pysrt.open(translated_paths[lang], encoding='utf-8')
+
+    if video_future is not None:
+        with stage('download'):
+            video_path = video_future.result()
+        if not video_path:
+            return {'success': False, 'outputs': [], 'error': "视频下载失败，请检查URL或尝试其他视频"}
+
+    output_filename = f"translated_{os.path.basename(video_path)}"
+    if subtitle_mode == "soft":
+        output_filename = os.path.basename(soft_subtitle_output_path(output_filename))
+    output_path = os.path.join(output_dir, output_filename)
+    # 每个输出文件：(路径, 下载文件名)
+    outputs = [(output_path, output_filename)]
+
+    def merge(lang, ass_header=None):
+        return run_stage(
+            manifest, output_dir, f"merge:{lang}", [source_path, translated_paths[lang]],
+            {'merge_below': merge_below, 'ass_header': ass_header},
+            lambda: [merge_subtitles(
+                subtitles,
+                translations[lang],
+                output_dir,
+                merge_below,
+                f"merged_subtitles_{lang}.srt",
+                ass_header=ass_header
+            )]
+        )[0]
+
+    if subtitle_mode == "soft":
+        # 软字幕：所有语言作为独立轨道封装到同一个文件，目标语言为默认轨道
+        with stage('merge'):
+            tracks = []
+            for lang in languages:
+                track_path = merge(lang) if merge_below else translated_paths[lang]
+                tracks.append({'path': track_path, 'language': lang, 'title': f"译文 ({lang})"})
+
+            if not merge_below:
+                # 单独轨道：原文也作为一条轨道
+                tracks.append({'path': source_path, 'language': None, 'title': "原文"})
+
+        def render():
+            success = process_video(video_path, output_path, None, mode="soft", subtitle_tracks=tracks)
+            return [output_path] if success else None
+
+        render_inputs = [video_path] + [track['path'] for track in tracks]
+        render_params = {'mode': subtitle_mode, 'outputs': [name for _, name in outputs],
+                         'tracks': [(track['language'], track['title']) for track in tracks]}
+        with stage('render', mode=subtitle_mode, estimate=None):
+            rendered = run_stage(manifest, output_dir, 'render', render_inputs, render_params, render)
+    else:
+        with stage('merge'):
+            # 样式只编译一次，各语言直接生成带原文/译文样式的 ASS 字幕
+            ass_header = compile_subtitle_styles(subtitle_style)
+            merged_paths = {lang: merge(lang, ass_header) for lang in languages}
+
+        mode = subtitle_mode if len(languages) == 1 else 'multi'
+        render_outputs = [{'output_path': output_path, 'subtitle_path': merged_paths[target_lang]}]
+        for lang in languages[1:]:
+            lang_filename = f"translated_{lang}_{os.path.basename(video_path)}"
+            lang_output_path = os.path.join(output_dir, lang_filename)
+            render_outputs.append({'output_path': lang_output_path, 'subtitle_path': merged_paths[lang]})
+            outputs.append((lang_output_path, lang_filename))
+
+        def render():
+            if len(languages) == 1:
+                success = process_video(
+                    video_path, output_path, merged_paths[target_lang], subtitle_style,
+                    mode=subtitle_mode, subtitle_language=target_lang, render_profile=render_profile
+                )
+            else:
+                # 多个语言版本：一次解码同时输出
+                success = render_multi_output(video_path, render_outputs, subtitle_style, render_profile)
+            return [path for path, _ in outputs] if success else None
+
+        # 字幕样式已编译进 ASS 字幕（渲染的输入），修改样式时只重新合并和渲染
+        render_inputs = [video_path] + [merged_paths[lang] for lang in languages]
+        render_params = {'mode': subtitle_mode, 'outputs': [name for _, name in outputs], 'render_profile': render_profile}
+        estimate = estimate_render_time(video_path, merged_paths[target_lang], mode, render_profile, len(languages))
+        with stage('render', mode=mode, estimate=estimate):
+            rendered = run_stage(manifest, output_dir, 'render', render_inputs, render_params, render)
+
+    if not rendered:
+        return {'success': False, 'outputs': [], 'error': "视频处理失败，请检查日志或尝试其他视频"}
+    return {'success': True, 'outputs': outputs, 'error': None}
+
+def stage_timer(timings, stage=None):
+    """
+    返回记录各阶段耗时的阶段钩子（秒，按阶段名累加到 timings），可包装另一个阶段钩子
+    """
+    @contextmanager
+    def timed(name, **info):
+        started = time.monotonic()
+        try:
+            with (stage or _no_stage)(name, **info):
+                yield
+        finally:
+            timings[name] = timings.get(name, 0.0) + time.monotonic() - started
+    return timed
+
+def is_url(source):
+    """输入是否为视频URL（而不是本地文件）"""
+    return source.startswith(('http://', 'https://'))
+
+def run_jobs(jobs, download_workers=DOWNLOAD_WORKERS, process_workers=PROCESS_WORKERS,
+             asr_workers=ASR_WORKERS, on_item=None):
+    """
+    批量处理视频，下载、识别和渲染按视频流水线进行：每个视频下载完成后立即开始处理，
+    同时继续下载后面的视频，网络、识别和编码在不同视频之间相互重叠，而不是逐个视频串行
+
+    Args:
+        jobs: 任务列表，每项为 {'source': 本地路径或URL, 'output_dir': 该视频的独立目录,
+              'options': translate_video 的参数, 'title': 显示名称（可选）}
+        download_workers: 同时下载的视频数
+        process_workers: 同时处理（识别、翻译、渲染）的视频数
+        asr_workers: 同时进行语音识别的视频数
+        on_item: 每个视频完成（或失败）时在调用线程中调用 on_item(结果)，可用于更新界面
+
+    Returns:
+        按任务顺序的结果列表，每项为 translate_video 的结果加上 index、source、title、
+        timings（各阶段耗时，秒）和 wall_seconds（从开始处理到完成的总耗时）
+    """
+    results = [None] * len(jobs)
+    if not jobs:
+        return results
+
+    asr_slots = threading.BoundedSemaphore(max(1, asr_workers))
+    timings = [{} for _ in jobs]
+    started = time.monotonic()
+
+    def finish(index, result):
+        job = jobs[index]
+        result.update(
+            index=index,
+            source=job['source'],
+            title=job.get('title') or job['source'],
+            timings=timings[index],
+            wall_seconds=time.monotonic() - started
+        )
+        results[index] = result
+        if on_item:
+            on_item(result)
+
+    def download_item(index):
+        # 排队期间任务已被取消（例如 Ctrl-C）时不再开始
+        if is_cancelled():
+            return None
+        try:
+            with stage_timer(timings[index])('download'):
+                return download_video_from_url(jobs[index]['source'], jobs[index]['output_dir'])
+        except Exception:
+            # 单个视频的意外错误不影响其他视频，按下载失败处理
+            print(f"下载 {jobs[index]['source']} 时出错:")
+            traceback.print_exc()
+            return None
+
+    def process_item(index, video_path):
+        job = jobs[index]
+        if is_cancelled():
+            return {'success': False, 'outputs': [], 'error': "任务已取消"}
+        options = dict(job.get('options') or {})
+        options['stage'] = stage_timer(timings[index], options.get('stage'))
+        try:
+            return translate_video(video_path, job['output_dir'], asr_slots=asr_slots, **options)
+        except (subprocess.SubprocessError, RuntimeError, OSError, ValueError) as e:
+            print(f"处理 {job['source']} 失败: {e}")
+            return {'success': False, 'outputs': [], 'error': str(e)}
+        except Exception as e:
+            # 其他意外错误（例如清单中格式错误的字幕样式）同样只让这一个视频失败；
+            # 只有中断（KeyboardInterrupt 等）才结束整批任务
+            print(f"处理 {job['source']} 时出错:")
+            traceback.print_exc()
+            return {'success': False, 'outputs': [], 'error': f"{type(e).__name__}: {e}"}
+
+    with ThreadPoolExecutor(max_workers=max(1, download_workers), thread_name_prefix='pipeline-download') as downloads, \
+            ThreadPoolExecutor(max_workers=max(1, process_workers), thread_name_prefix='pipeline-process') as processing:
+        # 每个 Future 对应 (阶段, 序号)
+        pending = {}
+        for index, job in enumerate(jobs):
+            if is_url(job['source']):
+                pending[downloads.submit(bind_job_context(download_item), index)] = ('download', index)
+            else:
+                pending[processing.submit(bind_job_context(process_item), index, job['source'])] = ('process', index)
+
+        try:
+            while pending:
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for future in done:
+                    kind, index = pending.pop(future)
+                    if kind == 'download':
+                        video_path = future.result()
+                        if video_path:
+                            next_future = processing.submit(bind_job_context(process_item), index, video_path)
+                            pending[next_future] = ('process', index)
+                        else:
+                            finish(index, {'success': False, 'outputs': [], 'error': "视频下载失败，请检查URL或尝试其他视频"})
+                    else:
+                        finish(index, future.result())
+        except BaseException:
+            # 被中断（Ctrl-C）或出错时不再启动排队中的任务，退出 with 时只等待正在运行的任务
+            for future in pending:
+                future.cancel()
+            raise
+    return results
+
+def process_playlist(url, output_dir, download_workers=DOWNLOAD_WORKERS,
+                     process_workers=PROCESS_WORKERS, limit=None, on_item=None, **options):
+    """
+    处理播放列表或频道中的所有视频（流水线方式见 run_jobs）
+
+    Args:
+        url: 播放列表或频道URL
+        output_dir: 输出目录，每个视频使用其中的独立子目录
+        download_workers: 同时下载的视频数
+        process_workers: 同时处理的视频数
+        limit: 最多处理的视频数
+        on_item: 每个视频完成（或失败）时在调用线程中调用 on_item(结果)
+        options: 传给 translate_video 的参数（target_lang、api_choice、api_key 等）
+
+    Returns:
+        按播放列表顺序的结果列表（见 run_jobs）
+    """
+    jobs = [
+        {
+            'source': entry['url'],
+            'title': entry['title'],
+            'output_dir': os.path.join(output_dir, f"playlist_{index + 1:03d}"),
+            'options': options
+        }
+        for index, entry in enumerate(list_playlist_entries(url, limit))
+    ]
+    return run_jobs(jobs, download_workers, process_workers, on_item=on_item)
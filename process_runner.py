@@ -0,0 +1,520 @@
+import os
+import re
+import time
+import queue
+import signal
+import threading
+import subprocess
+import contextvars
+from contextlib import contextmanager
+
+# 同时运行的重负载进程（FFmpeg 编码、Whisper）上限；
+# Streamlit 的所有会话运行在同一进程中，因此该上限即为本机上限
+MAX_HEAVY_PROCESSES = int(os.environ.get('VIDEO_TRANSLATE_MAX_HEAVY_PROCS') or max(1, (os.cpu_count() or 2) // 2))
+# 默认超时时间（秒），未设置表示不限制
+DEFAULT_PROCESS_TIMEOUT = float(os.environ.get('VIDEO_TRANSLATE_PROCESS_TIMEOUT') or 0) or None
+# 轮询取消和超时状态的间隔（秒）
+POLL_INTERVAL = 0.2
+
+_HEAVY_SLOTS = threading.BoundedSemaphore(MAX_HEAVY_PROCESSES)
+
+# 当前任务的上下文：会话、进度回调、取消事件和超时
+_JOB_CONTEXT = contextvars.ContextVar('job_context', default={})
+
+# 按会话记录正在运行的进程和取消事件
+_SESSION_LOCK = threading.Lock()
+_SESSION_PROCESSES = {}
+_SESSION_CANCEL_EVENTS = {}
+
+class ProcessCancelled(subprocess.SubprocessError):
+    """进程因任务被取消而终止"""
+
+    def __init__(self, cmd):
+        super().__init__(f"进程已取消: {' '.join(map(str, cmd))}")
+        self.cmd = cmd
+
+def get_session_cancel_event(session_id):
+    """获取（或创建）会话的取消事件"""
+    with _SESSION_LOCK:
+        return _SESSION_CANCEL_EVENTS.setdefault(session_id, threading.Event())
+
+@contextmanager
+def job_context(session_id=None, on_progress=None, cancel_event=None, timeout=None):
+    """
+    设置当前任务的上下文，期间通过 run_process 启动的进程都会使用这些设置
+
+    Args:
+        session_id: 会话ID，会话结束时可通过 cancel_session 终止其全部进程
+        on_progress: 进度回调，参数为进度事件字典（见 run_process）
+        cancel_event: threading.Event，置位后终止进程；提供 session_id 时默认使用会话的取消事件
+        timeout: 每个进程的超时时间（秒）
+    """
+    if cancel_event is None and session_id is not None:
+        cancel_event = get_session_cancel_event(session_id)
+    token = _JOB_CONTEXT.set({
+        'session_id': session_id,
+        'on_progress': on_progress,
+        'cancel_event': cancel_event,
+        'timeout': timeout
+    })
+    try:
+        yield
+    finally:
+        _JOB_CONTEXT.reset(token)
+
+def _combined_progress(futures, latest, weights, label, started):
+    """按权重把各项最近的进度事件合并为整体进度事件"""
+    total = float(sum(weights)) or 1.0
+    finished = 0.0
+    for index, future in enumerate(futures):
+        if future.done():
+            fraction = 1.0
+        else:
+            fraction = ((latest.get(index) or {}).get('percent') or 0.0) / 100.0
+        finished += weights[index] * fraction
+    percent = min(100.0, finished / total * 100)
+    elapsed = time.monotonic() - started
+    done = all(future.done() for future in futures)
+    eta = None
+    if done:
+        eta = 0.0
+    elif percent > 0:
+        eta = elapsed * (100 - percent) / percent
+    return {'source': 'threads', 'label': label, 'percent': percent, 'eta': eta, 'elapsed': elapsed, 'done': done}
+
+def run_in_threads(fn, items, max_workers, weights=None, label=None):
+    """
+    在线程池中执行 fn(item)，返回结果列表（保持顺序）
+    子线程继承当前任务的会话、取消事件和超时设置（见 bind_job_context），但不直接调用进度回调：
+    各项的进度事件按 weights（默认等权）合并为整体进度，在调用线程中上报
+
+    Args:
+        fn: 处理函数
+        items: 待处理的项
+        max_workers: 线程数
+        weights: 各项在整体进度中的权重（例如分段时长）
+        label: 整体进度事件中的任务名称
+    """
+    from concurrent.futures import ThreadPoolExecutor, wait
+
+    items = list(items)
+    weights = list(weights) if weights else [1.0] * len(items)
+    on_progress = _JOB_CONTEXT.get().get('on_progress')
+    events = queue.Queue()
+    started = time.monotonic()
+
+    def forward_to(index):
+        return lambda event: events.put((index, event))
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = [
+            executor.submit(bind_job_context(fn, on_progress=forward_to(index)), item)
+            for index, item in enumerate(items)
+        ]
+        latest = {}
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=POLL_INTERVAL)
+            updated = not pending
+            while not events.empty():
+                index, event = events.get()
+                latest[index] = event
+                updated = True
+            if on_progress and updated:
+                try:
+                    on_progress(_combined_progress(futures, latest, weights, label, started))
+                except Exception as e:
+                    print(f"进度回调失败: {e}")
+        return [future.result() for future in futures]
+
+def bind_job_context(fn, report_progress=False, on_progress=None):
+    """
+    绑定当前任务上下文，返回可在其他线程中执行的函数：会话、取消事件和超时设置保持不变（cancel_session 同样会终止它）
+    report_progress=False 时不上报进度：进度回调通常会更新调用线程的界面，其他线程中不能调用
+    提供 on_progress 时在子线程中改用该回调（例如把事件转交给调用线程，见 run_in_threads）
+    """
+    context = dict(_JOB_CONTEXT.get())
+    if on_progress is not None:
+        context['on_progress'] = on_progress
+    elif not report_progress:
+        context['on_progress'] = None
+
+    def run(*args, **kwargs):
+        token = _JOB_CONTEXT.set(context)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _JOB_CONTEXT.reset(token)
+
+    return run
+
+# 后台任务（例如在识别和翻译的同时下载完整视频）的线程数上限
+MAX_BACKGROUND_TASKS = 4
+_BACKGROUND_EXECUTOR = None
+
+class _ChildCancelEvent(threading.Event):
+    """后台任务自己的取消事件：可以单独取消，所属任务（父事件）取消时同样视为已取消"""
+
+    def __init__(self, parent=None):
+        super().__init__()
+        self._parent = parent
+
+    def is_set(self):
+        return super().is_set() or (self._parent is not None and self._parent.is_set())
+
+def run_in_background(fn, *args, **kwargs):
+    """
+    在后台线程中执行 fn(*args, **kwargs)，返回 concurrent.futures.Future
+    后台任务继承当前任务的上下文（见 bind_job_context），但不上报进度；
+    它有自己的取消事件，不再需要结果时用 cancel_background 单独终止
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    global _BACKGROUND_EXECUTOR
+    with _SESSION_LOCK:
+        if _BACKGROUND_EXECUTOR is None:
+            _BACKGROUND_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_BACKGROUND_TASKS, thread_name_prefix='background')
+    cancel_event = _ChildCancelEvent(_JOB_CONTEXT.get().get('cancel_event'))
+    token = _JOB_CONTEXT.set(dict(_JOB_CONTEXT.get(), cancel_event=cancel_event))
+    try:
+        future = _BACKGROUND_EXECUTOR.submit(bind_job_context(fn), *args, **kwargs)
+    finally:
+        _JOB_CONTEXT.reset(token)
+    future.cancel_event = cancel_event
+    return future
+
+def cancel_background(future):
+    """取消 run_in_background 启动的后台任务：尚未开始时不再执行，正在运行时终止其进程"""
+    future.cancel()
+    cancel_event = getattr(future, 'cancel_event', None)
+    if cancel_event is not None:
+        cancel_event.set()
+
+@contextmanager
+def measure_slot_wait():
+    """
+    统计期间当前任务（包括 run_in_threads 的子线程）等待重负载名额的总时间，
+    用于从任务耗时中扣除排队时间
+
+    Yields:
+        {'seconds': 等待秒数}，随等待累加
+    """
+    wait = {'seconds': 0.0, 'lock': threading.Lock()}
+    token = _JOB_CONTEXT.set(dict(_JOB_CONTEXT.get(), slot_wait=wait))
+    try:
+        yield wait
+    finally:
+        _JOB_CONTEXT.reset(token)
+
+def _record_slot_wait(context, seconds):
+    wait = context.get('slot_wait')
+    if wait is not None:
+        with wait['lock']:
+            wait['seconds'] += seconds
+
+@contextmanager
+def heavy_slots(wanted):
+    """
+    为由多个进程组成的任务（例如分段并行渲染）一次占用多个重负载名额：
+    至少等待一个名额，其余名额只占用当前空闲的部分，不与其他任务争抢；
+    期间当前任务（包括 run_in_threads 的子线程）启动的进程不再单独占用名额
+
+    Args:
+        wanted: 希望占用的名额数
+
+    Yields:
+        实际占用的名额数，任务应按该数量决定并行度
+    """
+    context = _JOB_CONTEXT.get()
+    if context.get('holds_heavy_slots'):
+        # 已在占用名额的任务中，不再重复占用
+        yield 1
+        return
+
+    wait_started = time.monotonic()
+    while not _HEAVY_SLOTS.acquire(timeout=POLL_INTERVAL):
+        raise_if_cancelled()
+    _record_slot_wait(context, time.monotonic() - wait_started)
+    acquired = 1
+    while acquired < wanted and _HEAVY_SLOTS.acquire(blocking=False):
+        acquired += 1
+    token = _JOB_CONTEXT.set(dict(context, holds_heavy_slots=True))
+    try:
+        yield acquired
+    finally:
+        _JOB_CONTEXT.reset(token)
+        for _ in range(acquired):
+            _HEAVY_SLOTS.release()
+
+def popen_group_kwargs():
+    """
+    subprocess.Popen 的参数：在新的进程组中启动，kill_process_tree 可以终止整个进程树
+    （包括例如 yt-dlp 启动的 FFmpeg）；所有交给 track_process 登记的进程都应使用
+    """
+    if os.name == 'nt':
+        return {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {'start_new_session': True}
+
+def kill_process_tree(process):
+    """终止进程及其所有子进程"""
+    if process.poll() is not None:
+        return
+    try:
+        if os.name == 'nt':
+            subprocess.run(['taskkill', '/F', '/T', '/PID', str(process.pid)], capture_output=True)
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except (OSError, subprocess.SubprocessError):
+        process.kill()
+    process.wait()
+
+@contextmanager
+def track_process(process, session_id=None):
+    """登记进程，使 cancel_session 能够终止它"""
+    session_id = session_id if session_id is not None else _JOB_CONTEXT.get().get('session_id')
+    with _SESSION_LOCK:
+        _SESSION_PROCESSES.setdefault(session_id, set()).add(process)
+    try:
+        yield process
+    finally:
+        with _SESSION_LOCK:
+            _SESSION_PROCESSES.get(session_id, set()).discard(process)
+
+def cancel_session(session_id):
+    """取消会话的所有任务并终止其进程树"""
+    get_session_cancel_event(session_id).set()
+    with _SESSION_LOCK:
+        processes = list(_SESSION_PROCESSES.pop(session_id, set()))
+    for process in processes:
+        kill_process_tree(process)
+
+def reset_session(session_id):
+    """清除会话的取消状态，以便开始新任务"""
+    with _SESSION_LOCK:
+        event = _SESSION_CANCEL_EVENTS.get(session_id)
+    if event:
+        event.clear()
+
+def cancel_sessions_except(active_session_ids):
+    """终止已结束（不在活跃列表中）的会话遗留的进程"""
+    active = set(active_session_ids)
+    with _SESSION_LOCK:
+        stale = [sid for sid in _SESSION_PROCESSES if sid is not None and sid not in active]
+    for session_id in stale:
+        cancel_session(session_id)
+        with _SESSION_LOCK:
+            _SESSION_CANCEL_EVENTS.pop(session_id, None)
+    return stale
+
+def is_cancelled():
+    """当前任务是否已被取消"""
+    cancel_event = _JOB_CONTEXT.get().get('cancel_event')
+    return cancel_event is not None and cancel_event.is_set()
+
+def raise_if_cancelled(cmd=None):
+    """当前任务已被取消时抛出 ProcessCancelled，供长时间运行的循环在两步之间检查"""
+    if is_cancelled():
+        raise ProcessCancelled(cmd or [])
+
+def with_ffmpeg_progress(cmd):
+    """在FFmpeg命令中加入机器可读的进度输出（写到标准输出）"""
+    return [cmd[0], '-progress', 'pipe:1', '-nostats'] + list(cmd[1:])
+
+def _parse_clock(value):
+    """解析 HH:MM:SS(.ffffff) 或 MM:SS 格式的时间"""
+    seconds = 0.0
+    for part in value.split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+def ffmpeg_progress_parser(duration=None, label=None):
+    """
+    创建 ffmpeg -progress 输出的解析函数
+    每读到一个完整的进度块（以 progress=continue/end 结尾）返回一个进度事件，否则返回None
+    """
+    block = {}
+    started = time.monotonic()
+
+    def feed(line):
+        key, sep, value = line.strip().partition('=')
+        if not sep:
+            return None
+        block[key] = value.strip()
+        if key != 'progress':
+            return None
+
+        processed = None
+        if block.get('out_time_us', 'N/A') not in ('N/A', ''):
+            processed = int(block['out_time_us']) / 1000000.0
+        elif block.get('out_time', 'N/A') not in ('N/A', ''):
+            processed = _parse_clock(block['out_time'])
+
+        speed = None
+        match = re.match(r'([\d.]+)x', block.get('speed', ''))
+        if match and float(match.group(1)) > 0:
+            speed = float(match.group(1))
+
+        done = value == 'end'
+        percent = eta = None
+        if duration and processed is not None:
+            percent = 100.0 if done else min(100.0, max(0.0, processed / duration * 100))
+            if speed:
+                eta = max(0.0, (duration - processed) / speed)
+            elif processed > 0:
+                eta = max(0.0, (time.monotonic() - started) * (duration - processed) / processed)
+
+        event = {
+            'source': 'ffmpeg',
+            'label': label,
+            'processed_seconds': processed,
+            'percent': percent,
+            'speed': speed,
+            'fps': block.get('fps'),
+            'eta': 0.0 if done else eta,
+            'done': done
+        }
+        block.clear()
+        return event
+
+    return feed
+
+def ytdlp_progress_parser(label=None):
+    """创建 yt-dlp --newline 下载进度行的解析函数"""
+    pattern = re.compile(r'\[download\]\s+([\d.]+)%(?:.*?at\s+(\S+))?(?:.*?ETA\s+([\d:]+))?')
+
+    def feed(line):
+        match = pattern.search(line)
+        if not match:
+            return None
+        percent = float(match.group(1))
+        eta = None
+        if match.group(3):
+            try:
+                eta = _parse_clock(match.group(3))
+            except ValueError:
+                eta = None
+        return {
+            'source': 'yt-dlp',
+            'label': label,
+            'percent': percent,
+            'speed': match.group(2),
+            'eta': eta,
+            'done': percent >= 100
+        }
+
+    return feed
+
+def _read_stream(stream, sink, parser, events):
+    for line in iter(stream.readline, ''):
+        sink.append(line)
+        if parser:
+            event = parser(line)
+            if event:
+                events.put(event)
+    stream.close()
+
+def run_process(cmd, parser=None, timeout=None, cancel_event=None, on_progress=None, heavy=True):
+    """
+    运行外部命令，支持进度、超时和取消（可替代 subprocess.run(cmd, check=True, capture_output=True, text=True)）
+
+    Args:
+        cmd: 命令列表
+        parser: 进度解析函数（见 ffmpeg_progress_parser / ytdlp_progress_parser），逐行解析标准输出
+        timeout: 超时时间（秒），默认使用任务上下文或 DEFAULT_PROCESS_TIMEOUT
+        cancel_event: threading.Event，置位后终止进程树，默认使用任务上下文
+        on_progress: 进度回调，在调用线程中执行，默认使用任务上下文
+        heavy: 是否占用重负载进程名额（见 MAX_HEAVY_PROCESSES）；在 heavy_slots 中运行时使用已占用的名额
+
+    Returns:
+        subprocess.CompletedProcess
+
+    Raises:
+        subprocess.CalledProcessError: 返回码非0
+        subprocess.TimeoutExpired: 超时
+        ProcessCancelled: 任务被取消
+    """
+    context = _JOB_CONTEXT.get()
+    heavy = heavy and not context.get('holds_heavy_slots')
+    timeout = timeout or context.get('timeout') or DEFAULT_PROCESS_TIMEOUT
+    cancel_event = cancel_event or context.get('cancel_event')
+    on_progress = on_progress or context.get('on_progress')
+    # 超时从进程启动时开始计算，排队等待重负载名额的时间不计入
+    deadline = None
+
+    def check_interrupted(process=None):
+        if cancel_event is not None and cancel_event.is_set():
+            if process:
+                kill_process_tree(process)
+            raise ProcessCancelled(cmd)
+        if deadline and time.monotonic() > deadline:
+            if process:
+                kill_process_tree(process)
+            raise subprocess.TimeoutExpired(cmd, timeout)
+
+    # 等待重负载名额，等待期间响应取消
+    if heavy:
+        wait_started = time.monotonic()
+        while not _HEAVY_SLOTS.acquire(timeout=POLL_INTERVAL):
+            check_interrupted()
+        _record_slot_wait(context, time.monotonic() - wait_started)
+    started = time.monotonic()
+    deadline = started + timeout if timeout else None
+
+    try:
+        process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding='utf-8',
+            errors='replace',
+            **popen_group_kwargs()
+        )
+        stdout_lines = []
+        stderr_lines = []
+        events = queue.Queue()
+        readers = [
+            threading.Thread(target=_read_stream, args=(process.stdout, stdout_lines, parser, events), daemon=True),
+            threading.Thread(target=_read_stream, args=(process.stderr, stderr_lines, None, events), daemon=True)
+        ]
+
+        def dispatch_events():
+            # 在调用线程中派发进度事件
+            while not events.empty():
+                event = events.get()
+                event['elapsed'] = time.monotonic() - started
+                if on_progress:
+                    try:
+                        on_progress(event)
+                    except Exception as e:
+                        print(f"进度回调失败: {e}")
+
+        with track_process(process, context.get('session_id')):
+            for reader in readers:
+                reader.start()
+
+            try:
+                while process.poll() is None:
+                    dispatch_events()
+                    check_interrupted(process)
+                    time.sleep(POLL_INTERVAL)
+            except BaseException:
+                # 调用方被中断（例如页面重新运行）时不能留下孤儿进程
+                kill_process_tree(process)
+                raise
+
+            for reader in readers:
+                reader.join()
+            dispatch_events()
+
+        stdout = ''.join(stdout_lines)
+        stderr = ''.join(stderr_lines)
+        if process.returncode != 0:
+            # 进程可能是被 cancel_session 从其他线程终止的
+            if cancel_event is not None and cancel_event.is_set():
+                raise ProcessCancelled(cmd)
+            raise subprocess.CalledProcessError(process.returncode, cmd, output=stdout, stderr=stderr)
+        return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+    finally:
+        if heavy:
+            _HEAVY_SLOTS.release()
@@ -0,0 +1,170 @@
+import os
+import time
+import platform
+import subprocess
+from cache_utils import get_cache_dir, atomic_write_json, read_json
+from process_runner import run_process, heavy_slots
+from toolchain import pick_video_encoder
+
+# 渲染配置：在编码速度和画质之间取舍
+#   preset/crf/tune: 仅 libx264 使用，其他编码器只使用 threads
+#   threads: 编码线程数，None 表示由编码器决定
+#   max_height: 输出最大高度，超过时按比例缩小，None 表示保持原分辨率
+#   audio: 'copy' 直接复制，'none' 去掉音频，或 {'codec': 编码器, 'bitrate': 码率}
+RENDER_PROFILES = {
+    'preview': {
+        'label': '预览（最快）',
+        'preset': 'ultrafast',
+        'crf': 30,
+        'tune': 'fastdecode',
+        'threads': None,
+        'max_height': 360,
+        'audio': 'none'
+    },
+    'draft': {
+        'label': '草稿',
+        'preset': 'veryfast',
+        'crf': 28,
+        'tune': None,
+        'threads': None,
+        'max_height': 720,
+        'audio': {'codec': 'aac', 'bitrate': '128k'}
+    },
+    'standard': {
+        'label': '标准',
+        'preset': 'fast',
+        'crf': 23,
+        'tune': None,
+        'threads': None,
+        'max_height': None,
+        'audio': 'copy'
+    },
+    'archive': {
+        'label': '存档（最高画质）',
+        'preset': 'slow',
+        'crf': 18,
+        'tune': None,
+        'threads': None,
+        'max_height': None,
+        'audio': 'copy'
+    },
+}
+DEFAULT_RENDER_PROFILE = 'standard'
+
+# 校准使用的合成视频：1080p 测试图案，接近实际视频的编码复杂度
+CALIBRATION_SOURCE = 'testsrc2=size=1920x1080:rate=30'
+CALIBRATION_SECONDS = 4
+CALIBRATION_FPS = 30
+
+def get_render_profile(name=None):
+    """按名称获取渲染配置（副本），名称未知时抛出 ValueError"""
+    name = name or DEFAULT_RENDER_PROFILE
+    if name not in RENDER_PROFILES:
+        raise ValueError(f"未知的渲染配置: {name}")
+    return dict(RENDER_PROFILES[name], name=name)
+
+def profile_encoder_args(profile=None, threads=None, video_encoder=None):
+    """
+    渲染配置对应的视频编码参数
+
+    Args:
+        profile: 配置名称
+        threads: 编码线程数，覆盖配置中的值（分段并行渲染时使用）
+        video_encoder: 编码器，默认选择本机可用的编码器
+
+    Returns:
+        FFmpeg 参数列表
+    """
+    profile = get_render_profile(profile)
+    video_encoder = video_encoder or pick_video_encoder()
+    args = ['-c:v', video_encoder]
+    if video_encoder == 'libx264':
+        args += ['-preset', profile['preset'], '-crf', str(profile['crf'])]
+        if profile['tune']:
+            args += ['-tune', profile['tune']]
+    threads = threads or profile['threads']
+    if threads:
+        args += ['-threads', str(threads)]
+    return args
+
+def profile_scale_filter(profile=None):
+    """渲染配置的缩放滤镜（只缩小不放大），不需要缩放时返回None"""
+    max_height = get_render_profile(profile)['max_height']
+    if not max_height:
+        return None
+    return f"scale=-2:'min(ih,{max_height})'"
+
+def profile_audio_args(profile=None):
+    """渲染配置对应的音频参数"""
+    audio = get_render_profile(profile)['audio']
+    if audio == 'none':
+        return ['-an']
+    if audio == 'copy':
+        return ['-c:a', 'copy']
+    return ['-c:a', audio['codec'], '-b:a', audio['bitrate']]
+
+def _calibration_path():
+    return os.path.join(get_cache_dir('render_stats'), 'calibration.json')
+
+def load_profile_calibration():
+    """读取本机各渲染配置的实测编码速度，格式为 {编码器: {配置: {'fps': 值, 'measured_at': 时间}}}"""
+    calibration = read_json(_calibration_path()) or {}
+    return calibration.get(platform.node(), {})
+
+def calibrate_render_profile(profile=None, seconds=CALIBRATION_SECONDS):
+    """
+    编码一段 lavfi 合成视频，测量渲染配置在本机的编码速度（帧/秒）
+
+    Args:
+        profile: 配置名称
+        seconds: 合成视频时长（秒）
+
+    Returns:
+        每秒编码帧数
+    """
+    frames = int(seconds * CALIBRATION_FPS)
+    filters = [f for f in [profile_scale_filter(profile), 'format=yuv420p'] if f]
+    cmd = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+        '-f', 'lavfi', '-i', CALIBRATION_SOURCE,
+        '-frames:v', str(frames),
+        '-vf', ','.join(filters),
+        *profile_encoder_args(profile),
+        '-f', 'null', '-'
+    ]
+    # 先占用重负载名额再计时：等待名额的时间不能计入编码速度
+    with heavy_slots(1):
+        started = time.monotonic()
+        run_process(cmd)
+        return frames / max(time.monotonic() - started, 1e-3)
+
+def calibrate_render_profiles(profiles=None, seconds=CALIBRATION_SECONDS):
+    """
+    校准所有（或指定的）渲染配置，结果按主机和编码器保存
+
+    Returns:
+        {配置: 每秒编码帧数}
+    """
+    video_encoder = pick_video_encoder()
+    results = {}
+    for name in profiles or RENDER_PROFILES:
+        try:
+            results[name] = calibrate_render_profile(name, seconds)
+        except (subprocess.SubprocessError, OSError) as e:
+            print(f"渲染配置 {name} 校准失败: {e}")
+
+    path = _calibration_path()
+    calibration = read_json(path) or {}
+    host = calibration.setdefault(platform.node(), {}).setdefault(video_encoder, {})
+    for name, fps in results.items():
+        host[name] = {'fps': fps, 'measured_at': time.time()}
+    try:
+        atomic_write_json(path, calibration)
+    except OSError as e:
+        print(f"保存渲染校准结果失败: {e}")
+    return results
+
+def get_profile_fps(profile=None):
+    """本机当前编码器下渲染配置的实测编码速度（帧/秒），尚未校准时返回None"""
+    entry = load_profile_calibration().get(pick_video_encoder(), {}).get(get_render_profile(profile)['name'])
+    return entry['fps'] if entry else None
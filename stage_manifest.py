@@ -0,0 +1,87 @@
+import os
+import time
+from cache_utils import file_fingerprint, hash_key, atomic_write_json, read_json
+
+# 清单文件名，位于每个任务的输出目录中
+STAGE_MANIFEST_NAME = 'pipeline_manifest.json'
+# 清单格式或阶段语义变化时递增，旧清单中的所有阶段都会重新执行
+STAGE_MANIFEST_VERSION = 1
+
+def _manifest_path(output_dir):
+    return os.path.join(output_dir, STAGE_MANIFEST_NAME)
+
+def load_manifest(output_dir):
+    """
+    读取任务目录中的阶段清单，不存在、已损坏或版本不符时返回空清单
+
+    Returns:
+        {'version': 版本, 'stages': {阶段名: {'key', 'outputs', 'fingerprints', 'finished_at'}}}
+    """
+    manifest = read_json(_manifest_path(output_dir))
+    if not manifest or manifest.get('version') != STAGE_MANIFEST_VERSION:
+        return {'version': STAGE_MANIFEST_VERSION, 'stages': {}}
+    return manifest
+
+def stage_key(inputs, params):
+    """阶段的内容键：输入文件的内容指纹 + 影响输出的参数"""
+    return hash_key([file_fingerprint(path) for path in inputs], params)
+
+def _outputs_intact(entry):
+    """上次记录的输出文件是否都还在且内容未变"""
+    try:
+        return all(
+            file_fingerprint(path) == fingerprint
+            for path, fingerprint in zip(entry['outputs'], entry['fingerprints'])
+        )
+    except OSError:
+        return False
+
+def run_stage(manifest, output_dir, name, inputs, params, run):
+    """
+    执行一个阶段；输入内容和参数与上次相同且输出文件完好时直接复用上次的输出
+    每个阶段完成后立即写回清单，任务中途失败或进程崩溃后重新运行会从未完成的阶段继续
+
+    Args:
+        manifest: load_manifest 读取的清单（会被更新）
+        output_dir: 任务目录
+        name: 阶段名，同一阶段的多个实例用后缀区分（如 'translate:en'）
+        inputs: 输入文件路径列表
+        params: 影响输出的参数（可 JSON 序列化）
+        run: 执行阶段的函数，返回输出文件路径列表，失败时返回None
+
+    Returns:
+        输出文件路径列表，失败时返回None
+    """
+    key = stage_key(inputs, params)
+    entry = manifest['stages'].get(name)
+    if entry and entry['key'] == key and _outputs_intact(entry):
+        print(f"阶段 {name} 的输入未变化，复用上次的结果")
+        return entry['outputs']
+
+    outputs = run()
+    if not outputs:
+        # 失败时同时删除磁盘上的旧记录，避免之后按旧记录复用
+        forget_stage(manifest, output_dir, name)
+        return None
+    manifest['stages'][name] = {
+        'key': key,
+        'outputs': list(outputs),
+        'fingerprints': [file_fingerprint(path) for path in outputs],
+        'finished_at': time.time()
+    }
+    _save_manifest(manifest, output_dir)
+    return list(outputs)
+
+def forget_stage(manifest, output_dir, name):
+    """
+    从清单中删除阶段记录，下次运行时重新执行该阶段
+    用于输出可以使用但不应复用的情况（例如翻译接口出错时退回了备用翻译）
+    """
+    if manifest['stages'].pop(name, None) is not None:
+        _save_manifest(manifest, output_dir)
+
+def _save_manifest(manifest, output_dir):
+    try:
+        atomic_write_json(_manifest_path(output_dir), manifest)
+    except OSError as e:
+        print(f"保存阶段清单失败: {e}")
@@ -8,9 +8,82 @@ import hashlib
 import random
 from datetime import timedelta
 import re
+import contextvars
+from ass_subtitles import srt_text_to_ass, write_ass
+from process_runner import run_process
+
+# 百度翻译在界面和 translate_subtitles 中的名称
+BAIDU_API_CHOICE = '百度翻译 (免费)'
+# 当前 translate_subtitles 调用中未能使用翻译接口（退回备用翻译或保留原文）的字幕数
+_TRANSLATION_FALLBACKS = contextvars.ContextVar('translation_fallbacks', default=None)
+
+# 平台字幕语言的默认优先级（yt-dlp 语言代码），也作为下载时请求的语言列表
+PLATFORM_SUBTITLE_LANGUAGES = ['zh-CN', 'zh-Hans', 'zh', 'zh-Hant', 'zh-TW', 'en', 'ja', 'ko']
+
+def _language_matches(language, video_language):
+    if not video_language:
+        return False
+    # YouTube 自动字幕的原始语言轨道以 -orig 结尾
+    base = language[:-len('-orig')] if language.endswith('-orig') else language
+    return base.split('-')[0].lower() == video_language.split('-')[0].lower()
+
+def find_platform_subtitles(video_path, preferred_languages=None):
+    """
+    查找 yt-dlp 随视频下载的字幕文件（<视频名>.<语言>.srt）并按可用性排序：
+    人工字幕优先于自动字幕，与视频原始语言一致的优先，其余按 preferred_languages 的顺序
+    
+    Args:
+        video_path: 视频路径（同目录下的 <视频名>.info.json 用于区分人工/自动字幕和视频语言）
+        preferred_languages: 语言优先级，默认 PLATFORM_SUBTITLE_LANGUAGES
+    
+    Returns:
+        [{'path', 'language', 'automatic', 'cue_count'}, ...]，只包含能解析且有内容的字幕
+    """
+    preferred_languages = preferred_languages or PLATFORM_SUBTITLE_LANGUAGES
+    root = os.path.splitext(video_path)[0]
+    directory = os.path.dirname(video_path) or '.'
+    prefix = os.path.basename(root) + '.'
+    
+    info = {}
+    try:
+        with open(root + '.info.json', 'r', encoding='utf-8') as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        pass
+    manual_languages = set(info.get('subtitles') or {})
+    video_language = info.get('language')
+    
+    candidates = []
+    for name in os.listdir(directory):
+        if not (name.startswith(prefix) and name.lower().endswith('.srt')):
+            continue
+        language = name[len(prefix):-len('.srt')]
+        if not language or language == 'live_chat':
+            continue
+        path = os.path.join(directory, name)
+        try:
+            cue_count = sum(1 for sub in pysrt.open(path, encoding='utf-8') if sub.text.strip())
+        except Exception as e:
+            print(f"读取平台字幕失败 {name}: {e}")
+            continue
+        if cue_count == 0:
+            continue
+        candidates.append({
+            'path': path,
+            'language': language,
+            'automatic': language not in manual_languages,
+            'cue_count': cue_count
+        })
+    
+    def rank(candidate):
+        language = candidate['language']
+        preference = preferred_languages.index(language) if language in preferred_languages else len(preferred_languages)
+        return (candidate['automatic'], not _language_matches(language, video_language), preference, language)
+    
+    return sorted(candidates, key=rank)
 
 def extract_subtitles(video_path):
-    """从视频文件中提取字幕或尝试读取同名SRT文件"""
+    """从视频文件中提取字幕，或读取同名SRT文件、yt-dlp 下载的平台字幕"""
     # 尝试读取同名SRT文件
     srt_path = os.path.splitext(video_path)[0] + '.srt'
     if os.path.exists(srt_path):
@@ -19,6 +92,13 @@ def extract_subtitles(video_path):
         except Exception as e:
             print(f"读取SRT文件失败: {e}")
     
+    # 使用平台提供的字幕（URL下载时由 yt-dlp 一并获取），无需语音识别
+    platform_subtitles = find_platform_subtitles(video_path)
+    if platform_subtitles:
+        best = platform_subtitles[0]
+        print(f"使用平台字幕: {best['language']}（{'自动' if best['automatic'] else '人工'}）")
+        return pysrt.open(best['path'], encoding='utf-8')
+    
     # 尝试从视频中提取字幕
     temp_srt = os.path.join(os.path.dirname(video_path), 'extracted_subs.srt')
     try:
@@ -30,7 +110,7 @@ def extract_subtitles(video_path):
             '-of', 'csv=p=0', 
             video_path
         ]
-        result = subprocess.run(cmd_check, capture_output=True, text=True)
+        result = run_process(cmd_check, heavy=False)
         
         if result.stdout.strip():
             # 使用FFmpeg提取字幕
@@ -39,7 +119,7 @@ def extract_subtitles(video_path):
                 '-map', '0:s:0', temp_srt, 
                 '-y'
             ]
-            subprocess.run(cmd, check=True, capture_output=True)
+            run_process(cmd, heavy=False)
             
             if os.path.exists(temp_srt):
                 return pysrt.open(temp_srt)
@@ -205,9 +285,15 @@ def translate_text_deepl(text, target_lang, api_key=None):
         # 使用备用翻译方法
         return translate_text_fallback(text, target_lang)
 
+def _note_translation_fallback():
+    fallbacks = _TRANSLATION_FALLBACKS.get()
+    if fallbacks is not None:
+        fallbacks.append(1)
+
 def translate_text_fallback(text, target_lang):
     """备用翻译方法，不依赖外部API"""
     print("使用备用翻译方法...")
+    _note_translation_fallback()
     
     # 这里实现一个简单的备用翻译
     # 实际可能需要使用更复杂的本地翻译库
@@ -225,6 +311,7 @@ def translate_text_fallback(text, target_lang):
 def translate_text_openai(text, api_key):
     """使用OpenAI API翻译文本"""
     if not api_key:
+        _note_translation_fallback()
         return text
     
     try:
@@ -239,10 +326,31 @@ def translate_text_openai(text, api_key):
         return response.choices[0].message['content'].strip()
     except Exception as e:
         print(f"OpenAI API错误: {e}")
+        _note_translation_fallback()
         return text
 
-def translate_subtitles(subtitles, target_lang='en', api_choice='百度翻译 (免费)', api_key=None, secret_key=None):
-    """翻译字幕"""
+def has_translation_credentials(api_choice, api_key, secret_key=None):
+    """是否提供了所选翻译接口需要的全部密钥（百度翻译还需要 secret_key）"""
+    return bool(api_key) and (api_choice != BAIDU_API_CHOICE or bool(secret_key))
+
+def translate_subtitles(subtitles, target_lang='en', api_choice=BAIDU_API_CHOICE, api_key=None, secret_key=None, stats=None):
+    """
+    翻译字幕
+
+    Args:
+        stats: 提供字典时写入 'fallbacks'：未能使用翻译接口（退回备用翻译或保留原文）的字幕数
+    """
+    fallbacks = []
+    token = _TRANSLATION_FALLBACKS.set(fallbacks)
+    try:
+        translated_subs = _translate_subtitles(subtitles, target_lang, api_choice, api_key, secret_key)
+    finally:
+        _TRANSLATION_FALLBACKS.reset(token)
+    if stats is not None:
+        stats['fallbacks'] = len(fallbacks)
+    return translated_subs
+
+def _translate_subtitles(subtitles, target_lang, api_choice, api_key, secret_key):
     translated_subs = pysrt.SubRipFile()
     
     for i, sub in enumerate(subtitles):
@@ -253,7 +361,7 @@ def translate_subtitles(subtitles, target_lang='en', api_choice='百度翻译 (
         new_sub.end = sub.end
         
         # 翻译文本
-        if api_choice == '百度翻译 (免费)':
+        if api_choice == BAIDU_API_CHOICE:
             new_sub.text = translate_text_baidu(sub.text, target_lang, api_key, secret_key)
         else:  # ChatGPT
             new_sub.text = translate_text_openai(sub.text, api_key)
@@ -262,7 +370,7 @@ def translate_subtitles(subtitles, target_lang='en', api_choice='百度翻译 (
     
     return translated_subs
 
-def translate_text_content(text_content, target_lang='en', api_choice='百度翻译 (免费)', api_key=None, secret_key=None):
+def translate_text_content(text_content, target_lang='en', api_choice=BAIDU_API_CHOICE, api_key=None, secret_key=None):
     """翻译纯文本内容"""
     # 将文本分成较小的段落进行翻译，以避免API限制
     max_length = 500  # 每段最大字符数
@@ -294,7 +402,7 @@ def translate_text_content(text_content, target_lang='en', api_choice='百度翻
     # 翻译每个段落
     translated_paragraphs = []
     for paragraph in paragraphs:
-        if api_choice == '百度翻译 (免费)':
+        if api_choice == BAIDU_API_CHOICE:
             translated = translate_text_baidu(paragraph, target_lang, api_key, secret_key)
         else:  # ChatGPT
             translated = translate_text_openai(paragraph, api_key)
@@ -411,8 +519,16 @@ def create_subtitles_from_text(text_content, output_dir, duration_per_char=0.2):
     subtitles.save(output_path, encoding='utf-8')
     return output_path, subtitles
 
-def merge_subtitles(original_subs, translated_subs, output_dir, below_original=True):
-    """合并原始字幕和翻译后的字幕"""
+def merge_subtitles(original_subs, translated_subs, output_dir, below_original=True, filename='merged_subtitles.srt', ass_header=None, translated_style='Translated'):
+    """
+    合并原始字幕和翻译后的字幕
+    
+    提供 ass_header（见 video_processor.compile_subtitle_styles）时直接生成 ASS 文件，
+    原文行使用 Default 样式、译文行使用 translated_style 样式，扩展名改为 .ass
+    """
+    if ass_header is not None:
+        return _merge_subtitles_ass(original_subs, translated_subs, output_dir, below_original, filename, ass_header, translated_style)
+    
     merged_subs = pysrt.SubRipFile()
     
     if below_original:
@@ -436,7 +552,27 @@ def merge_subtitles(original_subs, translated_subs, output_dir, below_original=T
             sub.index = i + 1
     
     # 保存合并后的字幕文件
-    output_path = os.path.join(output_dir, 'merged_subtitles.srt')
+    output_path = os.path.join(output_dir, filename)
     merged_subs.save(output_path, encoding='utf-8')
     
-    return output_path 
\ No newline at end of file
+    return output_path 
+
+def _merge_subtitles_ass(original_subs, translated_subs, output_dir, below_original, filename, ass_header, translated_style):
+    """生成原文和译文分别使用不同样式的 ASS 字幕"""
+    def seconds(t):
+        return t.ordinal / 1000.0
+    
+    events = []
+    if below_original:
+        # 同一条事件中原文在上、译文在下，\r 切换到译文样式
+        for orig_sub, trans_sub in zip(original_subs, translated_subs):
+            text = f"{srt_text_to_ass(orig_sub.text)}\\N{{\\r{translated_style}}}{srt_text_to_ass(trans_sub.text)}"
+            events.append((seconds(orig_sub.start), seconds(orig_sub.end), 'Default', text))
+    else:
+        events += [(seconds(sub.start), seconds(sub.end), 'Default', srt_text_to_ass(sub.text)) for sub in original_subs]
+        events += [(seconds(sub.start), seconds(sub.end), translated_style, srt_text_to_ass(sub.text)) for sub in translated_subs]
+    
+    output_path = os.path.join(output_dir, os.path.splitext(filename)[0] + '.ass')
+    write_ass(output_path, ass_header, events)
+    
+    return output_path
@@ -0,0 +1,70 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cache_utils
+import asr_processor
+from asr_processor import get_asr_engine, resolve_asr_engine, record_asr_rtf, estimate_asr_seconds, select_asr_model
+
+# 16kHz s16le 单声道的一秒静音
+ONE_SECOND_PCM = b'\0\0' * 16000
+
+
+class StubEngineTest(unittest.TestCase):
+
+    def test_stub_engine_is_only_used_when_requested(self):
+        self.assertEqual(resolve_asr_engine('stub'), 'stub')
+        self.assertNotIn('stub', asr_processor.DEFAULT_ASR_ENGINE_ORDER)
+
+    def test_stub_segments_cover_audio(self):
+        segments = get_asr_engine('stub')['transcribe'](ONE_SECOND_PCM * 12, {'stub_segment_seconds': 5})
+        self.assertEqual([(s['start'], s['end']) for s in segments], [(0.0, 5.0), (5.0, 10.0), (10.0, 12.0)])
+
+    def test_chunked_transcription_shifts_segments_by_offset(self):
+        try:
+            from video_processor import _transcribe_pcm_chunks
+        except ImportError:
+            self.skipTest('需要 video_processor 的依赖')
+        chunks = [(0.0, ONE_SECOND_PCM * 3), (3.0, ONE_SECOND_PCM * 2)]
+        segments, audio_seconds = _transcribe_pcm_chunks(iter(chunks), get_asr_engine('stub'), 'tiny')
+        self.assertEqual(audio_seconds, 5.0)
+        self.assertEqual([(s['start'], s['end']) for s in segments], [(0.0, 3.0), (3.0, 5.0)])
+
+
+class ModelSelectionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_root = tempfile.mkdtemp()
+        self.old_cache_root = cache_utils.CACHE_ROOT
+        cache_utils.CACHE_ROOT = self.cache_root
+
+    def tearDown(self):
+        cache_utils.CACHE_ROOT = self.old_cache_root
+        shutil.rmtree(self.cache_root, ignore_errors=True)
+
+    def test_unmeasured_model_scaled_by_slowest_measured_ratio(self):
+        # tiny 实测比默认慢 3 倍，未实测的 base 按同样倍数放大
+        record_asr_rtf('stub', 'tiny', 100, 30)
+        self.assertAlmostEqual(estimate_asr_seconds('stub', 'tiny', 100), 30.0)
+        self.assertAlmostEqual(estimate_asr_seconds('stub', 'base', 100), 0.2 * 3 * 100)
+
+    def test_selection_climbs_one_unmeasured_model_at_a_time(self):
+        # 没有实测数据时只选择最快的模型，之后每次最多比已实测的模型高一级
+        self.assertEqual(select_asr_model(100, 1000, 'stub'), 'tiny')
+        record_asr_rtf('stub', 'tiny', 100, 10)
+        self.assertEqual(select_asr_model(100, 1000, 'stub'), 'base')
+        record_asr_rtf('stub', 'base', 100, 20)
+        self.assertEqual(select_asr_model(100, 1000, 'stub'), 'small')
+
+    def test_tight_deadline_falls_back_to_fastest_model(self):
+        record_asr_rtf('stub', 'tiny', 100, 10)
+        record_asr_rtf('stub', 'base', 100, 20)
+        self.assertEqual(select_asr_model(100, 1, 'stub'), 'tiny')
+
+
+if __name__ == '__main__':
+    unittest.main()
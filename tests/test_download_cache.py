@@ -0,0 +1,135 @@
+import os
+import sys
+import json
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+import urllib.request
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cache_utils
+import download_cache
+
+# 测试服务器提供的文件内容
+PAYLOAD = bytes(range(256)) * 4096
+
+
+class _RangeHandler(BaseHTTPRequestHandler):
+    """支持 Range 请求的本地文件服务器，记录每次请求的 Range 头"""
+
+    def do_GET(self):
+        self.server.requests.append(self.headers.get('Range'))
+        start = 0
+        if self.headers.get('Range'):
+            start = int(self.headers['Range'].split('=')[1].split('-')[0])
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}")
+        else:
+            self.send_response(200)
+        body = PAYLOAD[start:]
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _fetch(url, path, limit=None):
+    """从已下载的字节处续传到 path；limit 模拟下载中断"""
+    done = os.path.getsize(path) if os.path.exists(path) else 0
+    request = urllib.request.Request(url, headers={'Range': f"bytes={done}-"} if done else {})
+    with urllib.request.urlopen(request) as response, open(path, 'ab') as f:
+        while True:
+            block = response.read(65536)
+            if not block:
+                break
+            f.write(block)
+            done += len(block)
+            if limit is not None and done >= limit:
+                raise IOError('模拟下载中断')
+
+
+class DownloadCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_root = tempfile.mkdtemp()
+        self.old_cache_root = cache_utils.CACHE_ROOT
+        cache_utils.CACHE_ROOT = self.cache_root
+
+        self.server = HTTPServer(('127.0.0.1', 0), _RangeHandler)
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/video.mp4"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        cache_utils.CACHE_ROOT = self.old_cache_root
+        shutil.rmtree(self.cache_root, ignore_errors=True)
+
+    def _download(self, limit=None):
+        def download(partial_dir, file_prefix):
+            _fetch(self.url, os.path.join(partial_dir, file_prefix + '.mp4'), limit)
+        return download
+
+    def _read(self, complete_dir):
+        with open(os.path.join(complete_dir, download_cache.CACHE_FILE_PREFIX + '.mp4'), 'rb') as f:
+            return f.read()
+
+    def test_cache_hit_skips_download(self):
+        key = download_cache.url_cache_key(self.url)
+        complete_dir = download_cache.download_to_cache(key, self._download())
+        self.assertEqual(self._read(complete_dir), PAYLOAD)
+        self.assertEqual(len(self.server.requests), 1)
+
+        self.assertEqual(download_cache.download_to_cache(key, self._download()), complete_dir)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertFalse(os.path.exists(os.path.join(os.path.dirname(complete_dir), 'lock')))
+
+    def test_interrupted_download_resumes(self):
+        key = download_cache.url_cache_key(self.url)
+        with self.assertRaises(IOError):
+            download_cache.download_to_cache(key, self._download(limit=len(PAYLOAD) // 2))
+        self.assertIsNone(download_cache.lookup_download(key))
+
+        complete_dir = download_cache.download_to_cache(key, self._download())
+        self.assertEqual(self._read(complete_dir), PAYLOAD)
+        self.assertIsNone(self.server.requests[0])
+        self.assertTrue(self.server.requests[1].startswith('bytes='))
+        self.assertNotEqual(self.server.requests[1], 'bytes=0-')
+
+    def test_alias_reused_for_equivalent_url(self):
+        key = download_cache.video_cache_key('Local:video')
+        complete_dir = download_cache.download_to_cache(key, self._download())
+        download_cache.register_url(self.url, key)
+
+        shared_url = self.url.replace('http://', 'HTTP://') + '?utm_source=share#t=10'
+        self.assertEqual(download_cache.lookup_download_by_url(shared_url), complete_dir)
+        self.assertIsNone(download_cache.lookup_download_by_url(self.url, 'audio'))
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_lock_of_exited_process_is_stale(self):
+        key = download_cache.url_cache_key(self.url)
+        entry_dir = os.path.join(cache_utils.get_cache_dir('downloads'), key)
+        os.makedirs(entry_dir)
+        # 本机上已退出的进程留下的锁
+        process_id = os.fork() if hasattr(os, 'fork') else None
+        if process_id == 0:
+            os._exit(0)
+        if process_id is None:
+            self.skipTest('无法创建子进程')
+        os.waitpid(process_id, 0)
+        with open(os.path.join(entry_dir, 'lock'), 'w') as f:
+            json.dump({'host': socket.gethostname(), 'pid': process_id, 'token': 'old'}, f)
+
+        complete_dir = download_cache.download_to_cache(key, self._download())
+        self.assertEqual(self._read(complete_dir), PAYLOAD)
+
+
+if __name__ == '__main__':
+    unittest.main()
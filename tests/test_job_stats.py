@@ -0,0 +1,54 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cache_utils
+from job_stats import record_job, fit_throughput_model, estimate_seconds, blend_eta
+
+
+class ThroughputModelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_root = tempfile.mkdtemp()
+        self.old_cache_root = cache_utils.CACHE_ROOT
+        cache_utils.CACHE_ROOT = self.cache_root
+
+    def tearDown(self):
+        cache_utils.CACHE_ROOT = self.old_cache_root
+        shutil.rmtree(self.cache_root, ignore_errors=True)
+
+    def _record(self, work, wall_seconds, mode='burn', success=1):
+        record_job(mode=mode, profile='balanced', encoder='libx264', work=work, wall_seconds=wall_seconds, success=success)
+
+    def test_least_squares_fit(self):
+        for work, wall_seconds in [(100, 15), (200, 25), (400, 45)]:
+            self._record(work, wall_seconds)
+        self._record(1000, 1, success=0)
+        model = fit_throughput_model('burn', 'balanced', 'libx264')
+        self.assertAlmostEqual(model['overhead'], 5.0)
+        self.assertAlmostEqual(model['seconds_per_work'], 0.1)
+        self.assertEqual(model['samples'], 3)
+
+    def test_estimate_falls_back_to_burn_then_calibration(self):
+        self.assertIsNone(estimate_seconds(100, 'smart', 'balanced', 'libx264'))
+        self.assertAlmostEqual(estimate_seconds(2.0736, 'smart', 'balanced', 'libx264', calibrated_fps=1), 1.0)
+        self._record(100, 10)
+        self.assertAlmostEqual(estimate_seconds(50, 'smart', 'balanced', 'libx264'), 5.0)
+
+
+class BlendEtaTest(unittest.TestCase):
+
+    def test_blends_from_estimate_to_progress(self):
+        self.assertEqual(blend_eta(100, 30), 70)
+        self.assertEqual(blend_eta(None, 30, 50, 20), 20)
+        self.assertAlmostEqual(blend_eta(100, 10, 5, 40), 0.5 * 40 + 0.5 * 90)
+        self.assertEqual(blend_eta(100, 10, 50, 40), 40)
+        self.assertIsNone(blend_eta(None, 10))
+
+
+if __name__ == '__main__':
+    unittest.main()
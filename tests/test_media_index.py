@@ -0,0 +1,50 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from media_index import save_index, load_index, keyframe_at_or_before, keyframe_at_or_after
+from media_index import nearest_keyframe, keyframes_between
+
+KEYFRAMES = [0.0, 2.002, 4.004, 6.006]
+
+
+class KeyframeLookupTest(unittest.TestCase):
+
+    def test_bisect_lookups(self):
+        self.assertEqual(keyframe_at_or_before(KEYFRAMES, 4.004), 4.004)
+        self.assertEqual(keyframe_at_or_before(KEYFRAMES, 3.9), 2.002)
+        self.assertIsNone(keyframe_at_or_before(KEYFRAMES, -1))
+        self.assertEqual(keyframe_at_or_after(KEYFRAMES, 2.1), 4.004)
+        self.assertIsNone(keyframe_at_or_after(KEYFRAMES, 7))
+        self.assertEqual(nearest_keyframe(KEYFRAMES, 3.1), 4.004)
+        self.assertIsNone(nearest_keyframe([], 1))
+        self.assertEqual(keyframes_between(KEYFRAMES, 2.002, 6.006), [2.002, 4.004])
+
+
+class IndexFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'index.bin')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_round_trip(self):
+        save_index(self.path, KEYFRAMES, [3.5])
+        self.assertEqual(load_index(self.path), {'keyframes': KEYFRAMES, 'scenes': [3.5]})
+        self.assertEqual([name for name in os.listdir(self.directory)], ['index.bin'])
+
+    def test_corrupt_or_missing_file_returns_none(self):
+        self.assertIsNone(load_index(self.path))
+        with open(self.path, 'wb') as f:
+            f.write(b'not an index')
+        self.assertIsNone(load_index(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import Future
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import stage_manifest
+from stage_manifest import load_manifest, run_stage, forget_stage
+
+try:
+    import pysrt
+    import pipeline
+except ImportError:
+    pipeline = None
+
+SOURCE_SRT = "1\n00:00:00,000 --> 00:00:01,000\nhello\n\n"
+
+
+def _write(path, text):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return path
+
+
+class RunStageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.input_path = _write(os.path.join(self.output_dir, 'input.txt'), 'input')
+        self.output_path = os.path.join(self.output_dir, 'output.txt')
+        self.runs = []
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def _run(self, params=None, result='output'):
+        def run():
+            self.runs.append(1)
+            if result is None:
+                return None
+            return [_write(self.output_path, result)]
+        manifest = load_manifest(self.output_dir)
+        return run_stage(manifest, self.output_dir, 'stage', [self.input_path], params or {'a': 1}, run)
+
+    def test_unchanged_stage_is_reused_across_runs(self):
+        self.assertEqual(self._run(), [self.output_path])
+        self.assertEqual(self._run(), [self.output_path])
+        self.assertEqual(len(self.runs), 1)
+
+    def test_changed_params_input_or_output_rerun_stage(self):
+        self._run()
+        self._run(params={'a': 2})
+        _write(self.input_path, 'changed input')
+        self._run(params={'a': 2})
+        _write(self.output_path, 'edited output')
+        self._run(params={'a': 2})
+        self.assertEqual(len(self.runs), 4)
+
+    def test_failed_stage_removes_previous_record(self):
+        self._run()
+        self.assertIsNone(self._run(params={'a': 2}, result=None))
+        self.assertNotIn('stage', load_manifest(self.output_dir)['stages'])
+        self._run()
+        self.assertEqual(len(self.runs), 3)
+
+    def test_forget_stage_forces_rerun(self):
+        self._run()
+        manifest = load_manifest(self.output_dir)
+        forget_stage(manifest, self.output_dir, 'stage')
+        self.assertNotIn('stage', load_manifest(self.output_dir)['stages'])
+        self._run()
+        self.assertEqual(len(self.runs), 2)
+
+    def test_manifest_of_other_version_is_ignored(self):
+        self._run()
+        old_version = stage_manifest.STAGE_MANIFEST_VERSION
+        stage_manifest.STAGE_MANIFEST_VERSION = old_version + 1
+        try:
+            self._run()
+        finally:
+            stage_manifest.STAGE_MANIFEST_VERSION = old_version
+        self.assertEqual(len(self.runs), 2)
+
+
+@unittest.skipIf(pipeline is None, "需要 pysrt 等依赖")
+class PipelineCheckpointTest(unittest.TestCase):
+    """识别或翻译退回占位/备用结果时不应记录为已完成的阶段"""
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.video_path = _write(os.path.join(self.output_dir, 'video.mp4'), 'not really a video')
+        self.patched = {}
+        self._patch('find_platform_subtitles', lambda video_path: [])
+        self._patch('resolve_subtitle_asr_engine', lambda: 'stub')
+        self.fallbacks = 0
+
+        def translate_subtitles(subtitles, stats=None, **kwargs):
+            if stats is not None:
+                stats['fallbacks'] = self.fallbacks
+            return subtitles
+        self._patch('translate_subtitles', translate_subtitles)
+
+    def tearDown(self):
+        for name, value in self.patched.items():
+            setattr(pipeline, name, value)
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def _patch(self, name, value):
+        self.patched.setdefault(name, getattr(pipeline, name))
+        setattr(pipeline, name, value)
+
+    def _translate(self):
+        # 后台下载失败时流水线在翻译之后、合并和渲染之前结束
+        video_future = Future()
+        video_future.set_result(None)
+        result = pipeline.translate_video(
+            self.video_path, self.output_dir, 'en', '百度翻译 (免费)', 'appid', 'secret',
+            video_future=video_future
+        )
+        return result, load_manifest(self.output_dir)['stages']
+
+    def test_placeholder_subtitles_are_not_checkpointed(self):
+        def auto_generate_subtitles(video_path, output_dir, deadline_seconds=None, stats=None):
+            stats['placeholder'] = True
+            return _write(os.path.join(output_dir, 'auto_generated.srt'), SOURCE_SRT)
+        self._patch('extract_subtitles', lambda video_path: None)
+        self._patch('auto_generate_subtitles', auto_generate_subtitles)
+
+        result, stages = self._translate()
+        self.assertFalse(result['success'])
+        self.assertIn('语音识别', result['error'])
+        self.assertNotIn('subtitles', stages)
+
+    def test_subtitles_stage_keyed_on_asr_engine(self):
+        calls = []
+
+        def auto_generate_subtitles(video_path, output_dir, deadline_seconds=None, stats=None):
+            calls.append(1)
+            return _write(os.path.join(output_dir, 'auto_generated.srt'), SOURCE_SRT)
+        self._patch('extract_subtitles', lambda video_path: None)
+        self._patch('auto_generate_subtitles', auto_generate_subtitles)
+
+        self._translate()
+        self._translate()
+        self._patch('resolve_subtitle_asr_engine', lambda: 'whisper')
+        self._translate()
+        self.assertEqual(len(calls), 2)
+
+    def test_translation_fallback_is_not_checkpointed(self):
+        self._patch('extract_subtitles', lambda video_path: pysrt.from_string(SOURCE_SRT))
+
+        self.fallbacks = 1
+        _, stages = self._translate()
+        self.assertIn('subtitles', stages)
+        self.assertNotIn('translate:en', stages)
+
+        self.fallbacks = 0
+        _, stages = self._translate()
+        self.assertIn('translate:en', stages)
+
+
+if __name__ == '__main__':
+    unittest.main()
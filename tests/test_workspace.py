@@ -0,0 +1,98 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import workspace
+
+HOUR = 3600
+
+
+class _StopLoop(Exception):
+    pass
+
+
+class CleanWorkspacesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.old_root = workspace.WORKSPACE_ROOT
+        workspace.WORKSPACE_ROOT = self.root
+
+    def tearDown(self):
+        workspace.WORKSPACE_ROOT = self.old_root
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def _workspace(self, session_id, idle_seconds):
+        workspace_dir = workspace.session_workspace(session_id)
+        self._age(os.path.join(workspace_dir, workspace.LAST_USED_NAME), idle_seconds)
+        return workspace_dir
+
+    def _file(self, workspace_dir, name, size, age_seconds=0):
+        path = os.path.join(workspace_dir, name)
+        with open(path, 'wb') as f:
+            f.write(b'\0' * size)
+        self._age(path, age_seconds)
+        return path
+
+    def _age(self, path, seconds):
+        then = time.time() - seconds
+        os.utime(path, (then, then))
+
+    def test_expired_workspace_removed_unless_active(self):
+        expired = self._workspace('expired', 2 * HOUR)
+        active = self._workspace('active', 2 * HOUR)
+        recent = self._workspace('recent', 60)
+
+        removed, _ = workspace.clean_workspaces(max_bytes=1 << 30, ttl_seconds=HOUR, active_session_ids=['active'])
+        self.assertEqual(removed, 1)
+        self.assertFalse(os.path.exists(expired))
+        self.assertTrue(os.path.exists(active))
+        self.assertTrue(os.path.exists(recent))
+
+    def test_quota_evicts_oldest_media_of_idle_sessions_when_active_unknown(self):
+        idle = self._workspace('idle', 2 * HOUR)
+        oldest = self._file(idle, 'old.mp4', 1000, age_seconds=3 * HOUR)
+        newer = self._file(idle, 'new.wav', 1000, age_seconds=2 * HOUR)
+        subtitles = self._file(idle, 'subs.srt', 1000, age_seconds=4 * HOUR)
+        busy = self._workspace('busy', 60)
+        in_use = self._file(busy, 'render.mp4', 1000, age_seconds=4 * HOUR)
+
+        _, evicted = workspace.clean_workspaces(max_bytes=3000, ttl_seconds=24 * HOUR, active_session_ids=None)
+        self.assertEqual(evicted, 1)
+        self.assertFalse(os.path.exists(oldest))
+        for path in (newer, subtitles, in_use):
+            self.assertTrue(os.path.exists(path))
+
+    def test_running_job_keeps_workspace_in_use(self):
+        workspace_dir = self._workspace('long-job', 2 * HOUR)
+        media = self._file(workspace_dir, 'video.mp4', 1000, age_seconds=2 * HOUR)
+        with workspace.workspace_in_use(workspace_dir, interval=0.05):
+            self._age(os.path.join(workspace_dir, workspace.LAST_USED_NAME), 2 * HOUR)
+            time.sleep(0.2)
+            _, evicted = workspace.clean_workspaces(max_bytes=0, ttl_seconds=24 * HOUR, active_session_ids=None)
+        self.assertEqual(evicted, 0)
+        self.assertTrue(os.path.exists(media))
+
+    def test_janitor_survives_unexpected_errors(self):
+        def broken_active_ids():
+            raise RuntimeError('内部接口已变化')
+
+        def stop(seconds):
+            raise _StopLoop()
+
+        old_sleep = workspace.time.sleep
+        workspace.time.sleep = stop
+        try:
+            with self.assertRaises(_StopLoop):
+                workspace._janitor_loop(broken_active_ids, 0)
+        finally:
+            workspace.time.sleep = old_sleep
+
+
+if __name__ == '__main__':
+    unittest.main()
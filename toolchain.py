@@ -0,0 +1,157 @@
+import os
+import re
+import shutil
+import subprocess
+import importlib.util
+from cache_utils import get_cache_dir, atomic_write_json, read_json
+
+# 缓存格式版本，探测内容变化时递增
+TOOLCHAIN_CACHE_VERSION = 1
+# 需要探测的外部命令
+TOOLCHAIN_BINARIES = ['ffmpeg', 'ffprobe', 'yt-dlp', 'whisper']
+
+# 当前进程内的探测结果，只探测一次
+_CAPABILITIES = None
+
+def _run(cmd):
+    """执行探测命令，失败时返回空字符串"""
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='replace', timeout=30)
+        return result.stdout
+    except (subprocess.SubprocessError, OSError):
+        return ""
+
+def _binary_signature(name):
+    """返回命令的路径和修改时间，用于判断磁盘缓存是否失效"""
+    path = shutil.which(name)
+    if not path:
+        return {'path': None, 'mtime': None}
+    try:
+        mtime = os.path.getmtime(os.path.realpath(path))
+    except OSError:
+        mtime = None
+    return {'path': path, 'mtime': mtime}
+
+def _parse_ffmpeg_list(output):
+    """解析 ffmpeg -encoders / -filters 的输出，返回名称列表"""
+    names = []
+    for line in output.splitlines():
+        # 编码器行形如 " V....D libx264   ..."，滤镜行形如 " ... subtitles  V->V  ..."
+        match = re.match(r'^\s*[A-Z.|]{3,6}\s+(\S+)\s', line)
+        if match and match.group(1) != '=':
+            names.append(match.group(1))
+    return sorted(set(names))
+
+def _probe_ffmpeg(path):
+    version_output = _run([path, '-hide_banner', '-version'])
+    first_line = version_output.splitlines()[0] if version_output else ''
+    version_match = re.search(r'version\s+(\S+)', first_line)
+    configuration = re.findall(r'--enable-(\S+)', version_output)
+    return {
+        'version': version_match.group(1) if version_match else None,
+        'configuration': sorted(set(configuration)),
+        'encoders': _parse_ffmpeg_list(_run([path, '-hide_banner', '-encoders'])),
+        'filters': _parse_ffmpeg_list(_run([path, '-hide_banner', '-filters']))
+    }
+
+def _probe_binaries(signatures):
+    """实际探测各命令的版本和能力（只在缓存失效时执行）"""
+    capabilities = {}
+    for name in TOOLCHAIN_BINARIES:
+        path = signatures[name]['path']
+        info = {'available': bool(path), 'path': path, 'version': None}
+        if path:
+            if name in ('ffmpeg', 'ffprobe'):
+                version_output = _run([path, '-hide_banner', '-version'])
+                match = re.search(r'version\s+(\S+)', version_output)
+                info['version'] = match.group(1) if match else None
+                if name == 'ffmpeg':
+                    info.update(_probe_ffmpeg(path))
+            elif name == 'yt-dlp':
+                info['version'] = _run([path, '--version']).strip() or None
+            # whisper 命令行启动需要加载 PyTorch，只记录路径，不实际执行
+        capabilities[name] = info
+    return capabilities
+
+def _probe_whisper_module():
+    """进程内 whisper 模块检查（find_spec 不会真正导入，开销很小）"""
+    available = importlib.util.find_spec('whisper') is not None
+    version = None
+    if available:
+        try:
+            from importlib.metadata import version as package_version
+            version = package_version('openai-whisper')
+        except Exception:
+            pass
+    return {'module': available, 'module_version': version}
+
+def get_toolchain_capabilities(refresh=False):
+    """
+    获取外部工具链的能力信息
+    每个进程只探测一次；结果缓存在磁盘上，任一命令的路径或修改时间变化时重新探测
+
+    Args:
+        refresh: 是否强制重新探测
+
+    Returns:
+        {'ffmpeg': {...}, 'ffprobe': {...}, 'yt-dlp': {...}, 'whisper': {...}}
+    """
+    global _CAPABILITIES
+    if _CAPABILITIES is not None and not refresh:
+        return _CAPABILITIES
+
+    signatures = {name: _binary_signature(name) for name in TOOLCHAIN_BINARIES}
+    cache_path = os.path.join(get_cache_dir('toolchain'), 'capabilities.json')
+    cached = None if refresh else read_json(cache_path)
+
+    if cached and cached.get('version') == TOOLCHAIN_CACHE_VERSION and cached.get('signatures') == signatures:
+        capabilities = cached['capabilities']
+    else:
+        capabilities = _probe_binaries(signatures)
+        try:
+            atomic_write_json(cache_path, {
+                'version': TOOLCHAIN_CACHE_VERSION,
+                'signatures': signatures,
+                'capabilities': capabilities
+            })
+        except OSError as e:
+            print(f"保存工具链探测结果失败: {e}")
+
+    capabilities['whisper'].update(_probe_whisper_module())
+    _CAPABILITIES = capabilities
+    return capabilities
+
+def is_tool_available(name):
+    """检查外部命令是否可用"""
+    return get_toolchain_capabilities().get(name, {}).get('available', False)
+
+def has_ffmpeg_encoder(name):
+    """检查ffmpeg是否支持指定编码器"""
+    return name in get_toolchain_capabilities()['ffmpeg'].get('encoders', [])
+
+def has_ffmpeg_filter(name):
+    """检查ffmpeg是否支持指定滤镜"""
+    return name in get_toolchain_capabilities()['ffmpeg'].get('filters', [])
+
+def is_whisper_available():
+    """检查whisper模块或命令行是否可用"""
+    whisper = get_toolchain_capabilities()['whisper']
+    return whisper.get('module', False) or whisper.get('available', False)
+
+# H.264 编码器优先级：软件 x264 质量最好，其次是其他可用实现
+H264_ENCODER_PREFERENCE = ['libx264', 'libopenh264', 'h264_videotoolbox', 'h264_nvenc', 'h264_qsv']
+
+def pick_video_encoder(preference=None):
+    """
+    选择本机ffmpeg支持的视频编码器
+
+    Returns:
+        编码器名称；探测结果为空时（例如探测失败）返回 libx264
+    """
+    encoders = get_toolchain_capabilities()['ffmpeg'].get('encoders', [])
+    if not encoders:
+        return 'libx264'
+    for name in preference or H264_ENCODER_PREFERENCE:
+        if name in encoders:
+            return name
+    return 'mpeg4'
@@ -4,6 +4,28 @@ import tempfile
 import shutil
 import json
 import re
+import sys
+import time
+import array
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from cache_utils import file_fingerprint, hash_key
+from ass_subtitles import compile_ass_header, srt_to_ass, read_ass, write_segment_ass
+from fonts import FONTS_DIR, has_managed_fonts, resolve_font, font_index_generation
+from render_profiles import get_render_profile, get_profile_fps, profile_encoder_args, profile_scale_filter, profile_audio_args
+from job_stats import render_work, record_job, estimate_seconds
+from media_index import get_keyframe_index, keyframe_at_or_after
+from process_runner import run_process, run_in_threads, run_in_background, track_process, raise_if_cancelled
+from process_runner import heavy_slots, measure_slot_wait, popen_group_kwargs, MAX_HEAVY_PROCESSES
+from process_runner import with_ffmpeg_progress, ffmpeg_progress_parser, ytdlp_progress_parser
+from toolchain import is_tool_available, has_ffmpeg_filter, pick_video_encoder, get_toolchain_capabilities
+from asr_processor import asr_cache_key, load_cached_segments, save_cached_segments
+from asr_processor import get_asr_engine, get_default_asr_engine, resolve_asr_engine, record_asr_rtf, select_asr_model
+from subtitle_processor import PLATFORM_SUBTITLE_LANGUAGES
+from download_cache import lookup_download_by_url, download_to_cache, register_url, link_into_job
+from download_cache import url_cache_key, video_cache_key
 
 def convert_color_to_ass(color):
     """
@@ -49,87 +71,840 @@ def convert_color_to_ass(color):
     return '&HFFFFFF&'
 
 def check_ffmpeg_available():
+    # 使用进程内缓存的工具链探测结果，不再每次启动ffmpeg
+    return is_tool_available('ffmpeg')
+
+# 默认字幕样式
+DEFAULT_SUBTITLE_STYLE = {
+    'font': 'Arial',
+    'fontsize': 22,
+    'primary_color': '&HFFFFFF&',  # 白色，ASS格式
+    'outline_color': '&H000000&',  # 黑色，ASS格式
+    'outline_width': 1,
+    'position': 'bottom',  # 'bottom' 或 'top'
+    'margin_v': 30,        # 垂直边距
+    'margin_h': 20,        # 水平边距
+    'alignment': 2,        # 2=居中, 1=左对齐, 3=右对齐
+    'bold': 0,             # 0=关闭, 1=开启
+    'italic': 0,           # 0=关闭, 1=开启
+}
+
+def resolve_subtitle_style(subtitle_style=None):
+    """
+    将用户样式与默认样式合并，颜色统一转换为ASS格式
+    返回新字典，不修改传入的样式（避免重复调用时把已转换的颜色再次转换）
+    """
+    style = dict(DEFAULT_SUBTITLE_STYLE)
+    if subtitle_style:
+        style.update(subtitle_style)
+        # 特殊处理颜色值，确保使用ASS格式
+        if 'primary_color' in subtitle_style:
+            style['primary_color'] = _to_ass_color(subtitle_style['primary_color'])
+        if 'outline_color' in subtitle_style:
+            style['outline_color'] = _to_ass_color(subtitle_style['outline_color'])
+    return style
+
+def _to_ass_color(color):
+    # 已经是ASS格式的颜色直接使用
+    if re.match(r'^&H[0-9A-Fa-f]{6,8}&$', color):
+        return color
+    return convert_color_to_ass(color)
+
+# 译文行使用的样式名（merge_subtitles 生成的 ASS 中，原文行使用 Default）
+TRANSLATED_STYLE_NAME = 'Translated'
+
+# 进程内最多保留的已编译样式数
+COMPILED_STYLES_MAX = 32
+
+# 已编译的 ASS 文件头（按最近使用排序），键为样式内容和字体索引版本的哈希；
+# 安装新字体后字体索引重新建立，旧的字体解析结果随之失效
+_COMPILED_STYLES = OrderedDict()
+_COMPILED_STYLES_LOCK = threading.Lock()
+
+def compile_subtitle_styles(subtitle_style=None):
+    """
+    将字幕样式编译为 ASS 文件头（见 ass_subtitles.compile_ass_header）
+    样式中的 'translated_style' 为译文行相对主样式的覆盖项，未提供时与原文行相同
+    
+    Args:
+        subtitle_style: 字幕样式
+    
+    Returns:
+        ASS 文件头字符串
+    """
+    key = hash_key(subtitle_style or {}, font_index_generation())
+    with _COMPILED_STYLES_LOCK:
+        if key in _COMPILED_STYLES:
+            _COMPILED_STYLES.move_to_end(key)
+            return _COMPILED_STYLES[key]
+    
+    style = resolve_subtitle_style(subtitle_style)
+    translated_style = resolve_subtitle_style(dict(subtitle_style or {}, **style.get('translated_style', {})))
+    # 字体不存在时使用确定的后备字体，而不是交给 libass 随意回退
+    style['font'] = resolve_font(style['font'])
+    translated_style['font'] = resolve_font(translated_style['font'])
+    header = compile_ass_header({
+        'Default': style,
+        TRANSLATED_STYLE_NAME: translated_style
+    })
+    with _COMPILED_STYLES_LOCK:
+        _COMPILED_STYLES[key] = header
+        while len(_COMPILED_STYLES) > COMPILED_STYLES_MAX:
+            _COMPILED_STYLES.popitem(last=False)
+    return header
+
+def prepare_ass_subtitles(subtitle_path, subtitle_style=None):
+    """
+    返回可直接交给 ass 滤镜的字幕文件：ASS 文件原样使用（样式已在文件中），
+    SRT 按编译好的样式转换（按内容缓存，见 ass_subtitles.srt_to_ass）
+    """
+    if os.path.splitext(subtitle_path)[1].lower() == '.ass':
+        return subtitle_path
+    return srt_to_ass(subtitle_path, compile_subtitle_styles(subtitle_style))
+
+def escape_filter_path(path):
+    """统一使用正斜杠，并转义滤镜参数中的冒号"""
+    return path.replace('\\', '/').replace(':', '\\:')
+
+def build_ass_filter(ass_path):
+    """构建烧录 ASS 字幕使用的 ass 滤镜参数，项目字体目录中有字体时通过 fontsdir 提供给 libass"""
+    ass_filter = f"ass='{escape_filter_path(ass_path)}'"
+    if has_managed_fonts():
+        ass_filter += f":fontsdir='{escape_filter_path(FONTS_DIR)}'"
+    return ass_filter
+
+def build_subtitle_filter(subtitle_path, subtitle_style=None):
+    """构建烧录字幕使用的滤镜参数（统一转换为 ASS 后使用 ass 滤镜）"""
+    return build_ass_filter(prepare_ass_subtitles(subtitle_path, subtitle_style))
+
+# 软字幕支持的容器及对应的字幕编码
+SOFT_SUBTITLE_CODECS = {
+    '.mp4': 'mov_text',
+    '.m4v': 'mov_text',
+    '.mov': 'mov_text',
+    '.mkv': 'srt',
+    '.webm': 'webvtt',
+}
+
+# 界面语言代码到 ISO 639-2 语言标签的映射（容器元数据使用）
+SUBTITLE_LANGUAGE_TAGS = {
+    'zh': 'chi',
+    'en': 'eng',
+    'ja': 'jpn',
+    'ko': 'kor',
+    'fr': 'fre',
+    'de': 'ger',
+    'es': 'spa',
+}
+
+def soft_subtitle_output_path(output_path):
+    """软字幕模式下，如果输出容器不支持字幕轨道，改用 .mkv"""
+    root, ext = os.path.splitext(output_path)
+    if ext.lower() in SOFT_SUBTITLE_CODECS:
+        return output_path
+    return root + '.mkv'
+
+def mux_soft_subtitles(video_path, output_path, subtitle_tracks):
+    """
+    以软字幕轨道的形式封装字幕，视频和音频直接复制，不重新编码
+    
+    Args:
+        video_path: 视频路径
+        output_path: 输出路径，容器由扩展名决定（MP4 使用 mov_text，MKV 使用 SRT/ASS）
+        subtitle_tracks: 字幕轨道列表，每项为 {'path': 字幕路径, 'language': 语言代码, 'title': 轨道名称}，
+            第一条轨道设为默认轨道
+    
+    Returns:
+        成功返回True
+    """
+    ext = os.path.splitext(output_path)[1].lower()
+    if ext not in SOFT_SUBTITLE_CODECS:
+        raise ValueError(f"容器 {ext} 不支持软字幕，请使用 {', '.join(SOFT_SUBTITLE_CODECS)}")
+    
+    cmd = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', '-i', video_path]
+    for track in subtitle_tracks:
+        cmd += ['-i', track['path']]
+    
+    # 映射原视频的视频和音频（音频可选），以及所有字幕输入
+    cmd += ['-map', '0:v', '-map', '0:a?']
+    for i in range(len(subtitle_tracks)):
+        cmd += ['-map', f'{i + 1}:0']
+    
+    cmd += ['-c:v', 'copy', '-c:a', 'copy']
+    for i, track in enumerate(subtitle_tracks):
+        codec = SOFT_SUBTITLE_CODECS[ext]
+        # MKV 可以原样保存 ASS 字幕的样式
+        if ext == '.mkv' and track['path'].lower().endswith('.ass'):
+            codec = 'ass'
+        cmd += [f'-c:s:{i}', codec]
+        
+        language = track.get('language')
+        cmd += [f'-metadata:s:s:{i}', f"language={SUBTITLE_LANGUAGE_TAGS.get(language, language or 'und')}"]
+        if track.get('title'):
+            cmd += [f'-metadata:s:s:{i}', f"title={track['title']}"]
+        cmd += [f'-disposition:s:{i}', 'default' if i == 0 else '0']
+    
+    cmd += _container_args(output_path)
+    cmd.append(output_path)
+    _run_ffmpeg(cmd, "FFmpeg封装字幕失败！")
+    return True
+
+# 支持 moov 前置和分片输出的容器
+FASTSTART_CONTAINERS = ('.mp4', '.m4v', '.mov')
+# 渐进输出时每个分片的最长时长（微秒）
+PROGRESSIVE_FRAGMENT_US = 2000000
+
+def _container_args(output_path, fragmented=False):
+    """
+    MP4/MOV 输出的封装参数
+    默认将 moov 前置（+faststart），网页可立即播放；
+    fragmented=True 时输出分片MP4，文件在写入过程中即可播放
+    """
+    if os.path.splitext(output_path)[1].lower() not in FASTSTART_CONTAINERS:
+        return []
+    if fragmented:
+        return [
+            '-movflags', 'frag_keyframe+empty_moov+default_base_moof',
+            '-frag_duration', str(PROGRESSIVE_FRAGMENT_US)
+        ]
+    return ['-movflags', '+faststart']
+
+def progressive_preview_path(output_path):
+    """渐进渲染过程中可边写边播放的分片文件路径"""
+    root, ext = os.path.splitext(output_path)
+    return f"{root}.part{ext}"
+
+def _video_encoder_args(threads=None, render_profile=None):
+    """选择本机可用的编码器并按渲染配置返回编码参数（见 render_profiles），仅x264支持preset/crf参数"""
+    return profile_encoder_args(render_profile, threads)
+
+def _burn_filter(ass_path, render_profile=None):
+    """渲染配置的缩放滤镜 + ass 字幕滤镜；先缩放再渲染字幕，字幕按输出分辨率清晰渲染"""
+    return ','.join(f for f in [profile_scale_filter(render_profile), build_ass_filter(ass_path)] if f)
+
+def _check_subtitle_filter():
+    # 提前确认ffmpeg支持字幕滤镜，避免编码到一半才失败
+    if get_toolchain_capabilities()['ffmpeg'].get('filters') and not has_ffmpeg_filter('ass'):
+        raise RuntimeError("当前ffmpeg不支持ass滤镜，请安装启用了libass的ffmpeg")
+
+def _run_ffmpeg(cmd, error_title="FFmpeg执行失败！", duration=None, label=None):
+    """
+    执行FFmpeg命令并上报进度（见 process_runner），失败时抛出包含完整命令和错误输出的 RuntimeError
+    
+    Args:
+        cmd: FFmpeg命令列表
+        error_title: 失败时的错误标题
+        duration: 预计输出时长（秒），用于计算进度百分比和剩余时间
+        label: 进度事件中的任务名称
+    """
+    print("完整执行命令:", ' '.join(cmd))
+    try:
+        return run_process(with_ffmpeg_progress(cmd), parser=ffmpeg_progress_parser(duration, label))
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"""
+        {error_title}
+        完整命令: {' '.join(cmd)}
+        错误代码: {e.returncode}
+        错误输出: {e.stderr}
+        """)
+    except subprocess.TimeoutExpired as e:
+        raise RuntimeError(f"{error_title}执行超过 {e.timeout:.0f} 秒，已终止")
+
+def _slot_threads(slots, jobs):
+    """占用 slots 个重负载名额、同时运行 jobs 个进程时每个进程的线程数"""
+    cpu_count = os.cpu_count() or 1
+    return max(1, cpu_count * slots // MAX_HEAVY_PROCESSES // max(1, jobs))
+
+def probe_keyframes(video_path):
+    """
+    获取视频关键帧时间戳（使用按文件指纹缓存的关键帧索引，见 media_index）
+    
+    Args:
+        video_path: 视频路径
+    
+    Returns:
+        相对于视频开始时间的关键帧时间戳列表（秒，升序）
+    """
+    return get_keyframe_index(video_path)['keyframes']
+
+def plan_render_segments(duration, keyframes, segment_count, min_segment_seconds=10):
+    """
+    将视频按关键帧切分为若干段
+    
+    Args:
+        duration: 视频时长（秒）
+        keyframes: 关键帧时间戳列表（秒，升序）
+        segment_count: 期望的段数
+        min_segment_seconds: 每段最短时长，过短的段会与相邻段合并
+    
+    Returns:
+        [(start, end), ...] 列表，所有切分点都位于关键帧上
+    """
+    cuts = []
+    for i in range(1, segment_count):
+        cut = keyframe_at_or_after(keyframes, duration * i / segment_count)
+        if cut is None:
+            break
+        previous = cuts[-1] if cuts else 0.0
+        if cut - previous >= min_segment_seconds and duration - cut >= min_segment_seconds:
+            cuts.append(cut)
+    
+    boundaries = [0.0] + cuts + [duration]
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+def _burn_segment(video_path, ass_path, start, end, segment_output, threads=None, extra_args=None, render_profile=None):
+    """
+    烧录 [start, end) 区间的字幕，只输出视频（音频最后统一复制）
+    start 必须位于关键帧上，输入端定位即可精确截取
+    """
+    segment_ass = os.path.splitext(segment_output)[0] + '.ass'
+    write_segment_ass(ass_path, segment_ass, start, end)
+    
+    cmd = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+        '-ss', f"{start:.6f}",
+        '-t', f"{end - start:.6f}",
+        '-i', video_path,
+        '-an',
+        '-vf', _burn_filter(segment_ass, render_profile),
+        *_video_encoder_args(threads, render_profile),
+        *(extra_args or []),
+        segment_output
+    ]
+    _run_ffmpeg(cmd, f"片段 {start:.2f}-{end:.2f} 秒渲染失败！", end - start, f"渲染 {start:.0f}-{end:.0f} 秒")
+    return segment_output
+
+def _concat_segments(segment_videos, video_path, output_path, work_dir, render_profile=None):
+    """使用 concat 分离器拼接各段视频，原始音频按渲染配置复制或编码"""
+    list_path = os.path.join(work_dir, 'segments.txt')
+    with open(list_path, 'w', encoding='utf-8') as f:
+        for segment_video in segment_videos:
+            f.write(f"file '{segment_video.replace(os.sep, '/')}'\n")
+    
+    cmd = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+        '-f', 'concat', '-safe', '0', '-i', list_path,
+        '-i', video_path,
+        '-map', '0:v', '-map', '1:a?',
+        '-c:v', 'copy',
+        *profile_audio_args(render_profile),
+        *_container_args(output_path),
+        output_path
+    ]
+    _run_ffmpeg(cmd, "分段拼接失败！", label="拼接分段")
+
+def render_parallel(video_path, output_path, subtitle_path, subtitle_style=None, segment_count=None, render_profile=None):
+    """
+    分段并行烧录字幕：在关键帧处切分视频，各段由独立的FFmpeg进程编码，
+    最后使用 concat 分离器无损拼接，并一次性复制原始音频，避免音画不同步
+    
+    Args:
+        video_path: 视频路径
+        output_path: 输出视频路径
+        subtitle_path: 字幕路径
+        subtitle_style: 字幕样式
+        segment_count: 最多并行的段数，默认为重负载名额上限（MAX_HEAVY_PROCESSES）
+        render_profile: 渲染配置名称，见 render_profiles.RENDER_PROFILES
+    
+    Returns:
+        成功返回True
+    """
+    duration = get_media_duration(video_path)
+    keyframes = probe_keyframes(video_path) if duration else []
+    
+    # 整个并行渲染一次占用若干重负载名额，段数和每段线程数按实际拿到的名额决定，
+    # 各段进程在这些名额内运行，合计使用的CPU与同样名额的普通渲染相同
+    with heavy_slots(segment_count or MAX_HEAVY_PROCESSES) as slots:
+        segments = plan_render_segments(duration, keyframes, slots) if duration else []
+        if len(segments) >= 2:
+            _check_subtitle_filter()
+            ass_path = prepare_ass_subtitles(subtitle_path, subtitle_style)
+            threads_per_segment = _slot_threads(slots, len(segments))
+            work_dir = tempfile.mkdtemp(prefix='render_', dir=os.path.dirname(output_path))
+            
+            def render_segment(index):
+                start, end = segments[index]
+                segment_video = os.path.join(work_dir, f"segment_{index:03d}.mp4")
+                return _burn_segment(video_path, ass_path, start, end, segment_video, threads_per_segment, render_profile=render_profile)
+            
+            try:
+                segment_videos = run_in_threads(
+                    render_segment, range(len(segments)), len(segments),
+                    weights=[end - start for start, end in segments], label="分段渲染"
+                )
+                _concat_segments(segment_videos, video_path, output_path, work_dir, render_profile)
+                return True
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+    
+    # 视频太短、关键帧太少或只拿到一个名额，无法切分时退回单进程烧录
+    return process_video(video_path, output_path, subtitle_path, subtitle_style, render_profile=render_profile)
+
+def probe_video_stream(video_path):
+    """获取第一条视频流的编码信息（codec_name、profile、level、pix_fmt、width、height 等），失败时返回空字典"""
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'stream=codec_name,profile,level,pix_fmt,width,height,field_order,r_frame_rate',
+        '-of', 'json',
+        video_path
+    ]
+    try:
+        result = run_process(cmd, heavy=False)
+        streams = json.loads(result.stdout).get('streams', []) if result.stdout else []
+        return streams[0] if streams else {}
+    except (subprocess.SubprocessError, FileNotFoundError, ValueError):
+        return {}
+
+def load_cue_intervals(subtitle_path):
+    """读取字幕文件（SRT 或 ASS）中每条字幕的时间区间 [(start, end), ...]（秒）"""
+    import pysrt
+    
+    if os.path.splitext(subtitle_path)[1].lower() == '.ass':
+        return sorted((start, end) for start, end, _, _ in read_ass(subtitle_path)[1])
+    return [(sub.start.ordinal / 1000.0, sub.end.ordinal / 1000.0) for sub in pysrt.open(subtitle_path, encoding='utf-8')]
+
+def plan_smart_render(duration, keyframes, cues):
+    """
+    按GOP规划智能渲染：与字幕时间重叠的GOP需要重新编码，其余GOP直接复制
+    
+    Args:
+        duration: 视频时长（秒）
+        keyframes: 关键帧时间戳列表（秒，升序）
+        cues: 字幕时间区间列表 [(start, end), ...]
+    
+    Returns:
+        [(start, end, needs_encode), ...]，相邻且处理方式相同的GOP已合并
+    """
+    import bisect
+    
+    boundaries = sorted(set(t for t in keyframes if 0 < t < duration))
+    boundaries = [0.0] + boundaries + [duration]
+    gop_count = len(boundaries) - 1
+    
+    # 标记与任一字幕重叠的GOP
+    needs_encode = [False] * gop_count
+    for cue_start, cue_end in cues:
+        if cue_end <= 0 or cue_start >= duration:
+            continue
+        first = max(0, bisect.bisect_right(boundaries, cue_start) - 1)
+        last = min(gop_count - 1, bisect.bisect_left(boundaries, cue_end) - 1)
+        for i in range(first, last + 1):
+            needs_encode[i] = True
+    
+    ranges = []
+    for i in range(gop_count):
+        start, end = boundaries[i], boundaries[i + 1]
+        if ranges and ranges[-1][2] == needs_encode[i]:
+            ranges[-1] = (ranges[-1][0], end, needs_encode[i])
+        else:
+            ranges.append((start, end, needs_encode[i]))
+    return ranges
+
+# ffprobe 的 H.264 profile 名称到 x264 -profile:v 参数的映射
+X264_PROFILES = {
+    'baseline': 'baseline',
+    'constrainedbaseline': 'baseline',
+    'main': 'main',
+    'high': 'high',
+    'high10': 'high10',
+    'high4:2:2': 'high422',
+    'high4:4:4predictive': 'high444',
+}
+# 重新编码的片段必须与源视频一致的码流参数；不一致时解码器会按源视频的 SPS/PPS 解码新片段
+SMART_RENDER_MATCH_FIELDS = ('codec_name', 'profile', 'level', 'pix_fmt', 'width', 'height', 'field_order')
+
+def _copy_video(video_path, output_path, render_profile=None, duration=None):
+    """不重新编码视频，直接复制视频流（音频按渲染配置复制或编码）"""
+    cmd = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+        '-i', video_path,
+        '-map', '0:v', '-map', '0:a?',
+        '-c:v', 'copy',
+        *profile_audio_args(render_profile),
+        *_container_args(output_path),
+        output_path
+    ]
+    with recorded_render(video_path, mode='copy', render_profile=render_profile):
+        _run_ffmpeg(cmd, "复制视频失败！", duration, "复制视频")
+    return True
+
+def render_smart(video_path, output_path, subtitle_path, subtitle_style=None, max_encode_ratio=0.8, render_profile=None):
+    """
+    智能渲染：只重新编码包含字幕的GOP，没有字幕的GOP直接复制原始码流
+    对白稀疏的视频渲染更快，且未改动区域没有任何画质损失
+    
+    仅当源视频为 H.264 且本机有 libx264 时可用：重新编码的片段使用与源视频相同的
+    profile、level 和像素格式，并以 MPEG-TS 作为中间格式（每段携带 SPS/PPS）。
+    拼接前检查编码出的片段与源视频的码流参数（SMART_RENDER_MATCH_FIELDS）一致，不一致时
+    整体重新编码；其他情况、需要缩放画面的渲染配置以及字幕覆盖比例过高时同样退回普通烧录。
+    字幕不覆盖任何画面时直接复制视频流。
+    
+    Args:
+        video_path: 视频路径
+        output_path: 输出视频路径
+        subtitle_path: 字幕路径
+        subtitle_style: 字幕样式
+        max_encode_ratio: 需要重新编码的时长占比超过该值时直接整体烧录
+        render_profile: 渲染配置名称，见 render_profiles.RENDER_PROFILES
+    
+    Returns:
+        成功返回True
+    """
+    stream = probe_video_stream(video_path)
+    duration = get_media_duration(video_path)
+    cues = load_cue_intervals(subtitle_path)
+    if duration and not any(end > 0 and start < duration for start, end in cues):
+        print("字幕不覆盖任何画面，直接复制视频流")
+        return _copy_video(video_path, output_path, render_profile, duration)
+    if stream.get('codec_name') != 'h264' or pick_video_encoder() != 'libx264' or not duration:
+        print("源视频不是H.264或缺少libx264，智能渲染退回普通烧录")
+        return process_video(video_path, output_path, subtitle_path, subtitle_style, render_profile=render_profile)
+    if profile_scale_filter(render_profile):
+        # 复制的GOP保持原分辨率，无法与缩放后的片段拼接
+        print("渲染配置需要缩放画面，智能渲染退回普通烧录")
+        return process_video(video_path, output_path, subtitle_path, subtitle_style, render_profile=render_profile)
+    
+    ranges = plan_smart_render(duration, probe_keyframes(video_path), cues)
+    encode_seconds = sum(end - start for start, end, encode in ranges if encode)
+    if encode_seconds > duration * max_encode_ratio or len(ranges) < 2:
+        return process_video(video_path, output_path, subtitle_path, subtitle_style, render_profile=render_profile)
+    print(f"智能渲染: 共 {len(ranges)} 段，需要重新编码 {encode_seconds:.1f}/{duration:.1f} 秒")
+    
+    _check_subtitle_filter()
+    ass_path = prepare_ass_subtitles(subtitle_path, subtitle_style)
+    profile = X264_PROFILES.get((stream.get('profile') or '').lower().replace(' ', ''))
+    match_args = ['-pix_fmt', stream.get('pix_fmt') or 'yuv420p']
+    if profile:
+        match_args += ['-profile:v', profile]
+    if isinstance(stream.get('level'), int) and stream['level'] > 9:
+        # ffprobe 的 level 为 10 倍整数（如 40 表示 4.0）
+        match_args += ['-level:v', f"{stream['level'] / 10.0:.1f}"]
+    match_args += ['-bsf:v', 'h264_mp4toannexb', '-f', 'mpegts']
+    
+    encode_jobs = sum(1 for _, _, encode in ranges if encode)
+    work_dir = tempfile.mkdtemp(prefix='smart_', dir=os.path.dirname(output_path))
+    
+    def render_range(index):
+        start, end, encode = ranges[index]
+        segment_video = os.path.join(work_dir, f"segment_{index:04d}.ts")
+        if encode:
+            return _burn_segment(video_path, ass_path, start, end, segment_video, threads_per_segment, match_args, render_profile)
+        
+        # 没有字幕的GOP：从关键帧开始直接复制码流
+        cmd = [
+            'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+            '-ss', f"{start:.6f}",
+            '-t', f"{end - start:.6f}",
+            '-i', video_path,
+            '-an',
+            '-c:v', 'copy',
+            '-bsf:v', 'h264_mp4toannexb',
+            '-f', 'mpegts',
+            segment_video
+        ]
+        _run_ffmpeg(cmd, f"片段 {start:.2f}-{end:.2f} 秒复制失败！", end - start, f"复制 {start:.0f}-{end:.0f} 秒")
+        return segment_video
+    
     try:
-        result = subprocess.run(
-            ['ffmpeg', '-version'],
-            capture_output=True,
-            text=True,
-            check=True
+        # 与 render_parallel 相同：按实际拿到的重负载名额决定并行数和线程数
+        with heavy_slots(MAX_HEAVY_PROCESSES) as slots:
+            threads_per_segment = _slot_threads(slots, min(encode_jobs, slots))
+            segment_videos = run_in_threads(
+                render_range, range(len(ranges)), slots,
+                weights=[end - start for start, end, _ in ranges], label="智能渲染"
+            )
+        for (_, _, encode), segment_video in zip(ranges, segment_videos):
+            if not encode:
+                continue
+            encoded = probe_video_stream(segment_video)
+            mismatched = [f for f in SMART_RENDER_MATCH_FIELDS if encoded.get(f) != stream.get(f)]
+            if mismatched:
+                print(f"重新编码的片段与源视频的 {', '.join(mismatched)} 不一致，智能渲染退回普通烧录")
+                return process_video(video_path, output_path, subtitle_path, subtitle_style, render_profile=render_profile)
+        _concat_segments(segment_videos, video_path, output_path, work_dir, render_profile)
+        return True
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def render_multi_output(video_path, outputs, subtitle_style=None, render_profile=None):
+    """
+    一次解码、多路输出：用 split 将解码后的画面分给多条字幕滤镜分支，
+    同时编码出多个语言版本，音频直接复制，解码和读取开销由所有版本共享
+    
+    Args:
+        video_path: 视频路径
+        outputs: 输出列表，每项为 {'output_path': 输出路径, 'subtitle_path': 字幕路径,
+            'subtitle_style': 该版本的样式（可选，默认使用 subtitle_style）}
+        subtitle_style: 默认字幕样式
+        render_profile: 渲染配置名称，缩放在 split 之前执行，所有版本共享
+    
+    Returns:
+        成功返回True
+    """
+    if len(outputs) == 1:
+        output = outputs[0]
+        return process_video(
+            video_path, output['output_path'], output['subtitle_path'],
+            output.get('subtitle_style', subtitle_style), render_profile=render_profile
         )
-        return "ffmpeg version" in result.stdout
-    except Exception:
-        return False
+    
+    if not os.path.exists(video_path) or not all(os.path.exists(o['subtitle_path']) for o in outputs):
+        raise FileNotFoundError("输入文件不存在")
+    for output in outputs:
+        os.makedirs(os.path.dirname(output['output_path']) or '.', exist_ok=True)
+    
+    _check_subtitle_filter()
+    
+    # [0:v]split=N[v0][v1]...; [v0]ass=...[out0]; ...
+    branch_labels = ''.join(f"[v{i}]" for i in range(len(outputs)))
+    scale_filter = profile_scale_filter(render_profile)
+    graph = [f"[0:v]{scale_filter + ',' if scale_filter else ''}split={len(outputs)}{branch_labels}"]
+    for i, output in enumerate(outputs):
+        subtitle_filter = build_subtitle_filter(output['subtitle_path'], output.get('subtitle_style', subtitle_style))
+        graph.append(f"[v{i}]{subtitle_filter}[out{i}]")
+    
+    cmd = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+        '-i', video_path,
+        '-filter_complex', ';'.join(graph)
+    ]
+    for i, output in enumerate(outputs):
+        cmd += [
+            '-map', f"[out{i}]",
+            '-map', '0:a?',
+            *_video_encoder_args(render_profile=render_profile),
+            *profile_audio_args(render_profile),
+            *_container_args(output['output_path']),
+            output['output_path']
+        ]
+    
+    with recorded_render(video_path, outputs[0]['subtitle_path'], 'multi', render_profile, len(outputs)):
+        _run_ffmpeg(cmd, "多语言渲染失败！", get_media_duration(video_path), f"渲染 {len(outputs)} 个语言版本")
+    return True
+
+# 样式预览的输出高度（像素）
+PREVIEW_HEIGHT = 360
 
-def process_video(video_path, output_path, subtitle_path, subtitle_style=None):
+def render_style_preview(video_path, subtitle_path, output_path, subtitle_style=None, cue_index=0, clip_seconds=6, height=PREVIEW_HEIGHT):
+    """
+    快速渲染字幕样式预览：在指定字幕附近截取几秒低分辨率片段，或只渲染一帧图片
+    使用与 process_video 完全相同的 ASS 样式，由 libass 实际渲染，所见即所得
+    
+    Args:
+        video_path: 视频路径
+        subtitle_path: 字幕路径
+        output_path: 输出路径，扩展名为 .png/.jpg 时只渲染字幕中间时刻的一帧，否则输出 MP4 片段
+        subtitle_style: 字幕样式
+        cue_index: 预览第几条字幕（从0开始）
+        clip_seconds: 片段时长（秒）
+        height: 输出高度（像素）
+    
+    Returns:
+        输出路径
+    """
+    cues = load_cue_intervals(subtitle_path)
+    if cues:
+        cue_start, cue_end = cues[max(0, min(cue_index, len(cues) - 1))]
+    else:
+        cue_start, cue_end = 0.0, float(clip_seconds)
+    
+    still = os.path.splitext(output_path)[1].lower() in ('.png', '.jpg', '.jpeg')
+    if still:
+        start = (cue_start + cue_end) / 2
+        end = start + 1
+    else:
+        # 从字幕出现前1秒开始，便于观察字幕出现的效果
+        start = max(0.0, cue_start - 1)
+        end = start + clip_seconds
+    
+    preview_ass = os.path.splitext(output_path)[0] + '.ass'
+    write_segment_ass(prepare_ass_subtitles(subtitle_path, subtitle_style), preview_ass, start, end)
+    # 先缩小再渲染字幕：libass 按画面高度缩放字幕，相对效果与原分辨率一致
+    video_filter = f"scale=-2:{height},{build_ass_filter(preview_ass)}"
+    
+    cmd = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+        '-ss', f"{start:.3f}",  # 输入端定位，只解码所需的几秒
+        '-i', video_path,
+        '-vf', video_filter,
+    ]
+    if still:
+        cmd += ['-frames:v', '1']
+    else:
+        cmd += ['-t', f"{clip_seconds:.3f}", *_video_encoder_args(render_profile='preview'), *profile_audio_args('preview')]
+        cmd += ['-movflags', '+faststart']
+    cmd.append(output_path)
+    
+    try:
+        # 预览不占用重负载名额，避免排在完整渲染之后
+        run_process(cmd, heavy=False)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"样式预览渲染失败: {e.stderr}")
+    finally:
+        if os.path.exists(preview_ass):
+            os.remove(preview_ass)
+    return output_path
+
+def _parse_frame_rate(rate):
+    """解析 ffprobe 的帧率（如 30000/1001），失败时返回None"""
+    try:
+        numerator, _, denominator = str(rate).partition('/')
+        value = float(numerator) / float(denominator or 1)
+        return value if value > 0 else None
+    except (ValueError, ZeroDivisionError):
+        return None
+
+# 不重新编码视频的渲染方式
+COPY_RENDER_MODES = ('soft', 'copy')
+
+def render_job_info(video_path, subtitle_path=None, mode='burn', render_profile=None, output_count=1):
+    """
+    收集渲染任务的统计信息（源视频参数、输出分辨率、字幕条数、工作量），用于记录和耗时估算
+    """
+    profile = get_render_profile(render_profile)
+    stream = probe_video_stream(video_path)
+    width, height = stream.get('width'), stream.get('height')
+    # 按渲染配置换算输出分辨率（只缩小不放大）
+    if width and height and profile['max_height'] and height > profile['max_height']:
+        width = int(round(width * profile['max_height'] / float(height) / 2)) * 2
+        height = profile['max_height']
+    
+    cue_count = None
+    if subtitle_path and os.path.exists(subtitle_path):
+        try:
+            cue_count = len(load_cue_intervals(subtitle_path))
+        except Exception:
+            cue_count = None
+    
+    info = {
+        'mode': mode,
+        'profile': profile['name'],
+        'encoder': 'copy' if mode in COPY_RENDER_MODES else pick_video_encoder(),
+        'codec': stream.get('codec_name'),
+        'width': width,
+        'height': height,
+        'fps': _parse_frame_rate(stream.get('r_frame_rate')),
+        'duration': get_media_duration(video_path),
+        'cue_count': cue_count,
+        'output_count': output_count
+    }
+    info['work'] = render_work(info['duration'], info['fps'], width, height, output_count)
+    return info
+
+def estimate_render_time(video_path, subtitle_path=None, mode='burn', render_profile=None, output_count=1):
+    """
+    根据本机历史任务估算渲染耗时（见 job_stats），没有历史任务时使用渲染配置的校准速度
+    
+    Returns:
+        预计秒数，无法估算时返回None
+    """
+    info = render_job_info(video_path, subtitle_path, mode, render_profile, output_count)
+    return estimate_seconds(info['work'], mode, info['profile'], info['encoder'], get_profile_fps(render_profile))
+
+# 正在记录的渲染任务信息，避免退回其他渲染方式时重复记录同一个任务
+_RENDER_RECORDING = contextvars.ContextVar('render_recording', default=None)
+
+@contextmanager
+def recorded_render(video_path, subtitle_path=None, mode='burn', render_profile=None, output_count=1):
+    """
+    记录渲染耗时、结果和任务参数到本机统计库（见 job_stats）
+    嵌套调用（例如智能渲染退回普通烧录）时只记录最外层，但记录的是实际执行的渲染方式；
+    耗时不包括等待重负载名额的排队时间
+    """
+    recording = _RENDER_RECORDING.get()
+    if recording is not None:
+        recording['mode'] = mode
+        if mode in COPY_RENDER_MODES:
+            recording['encoder'] = 'copy'
+        yield
+        return
+    
+    try:
+        info = render_job_info(video_path, subtitle_path, mode, render_profile, output_count)
+    except Exception as e:
+        print(f"获取渲染统计信息失败: {e}")
+        info = {'mode': mode, 'profile': render_profile, 'output_count': output_count}
+    token = _RENDER_RECORDING.set(info)
+    error = None
+    with measure_slot_wait() as slot_wait:
+        started = time.monotonic()
+        try:
+            yield
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"[:500]
+            raise
+        finally:
+            _RENDER_RECORDING.reset(token)
+            wall_seconds = max(0.0, time.monotonic() - started - slot_wait['seconds'])
+            record_job(wall_seconds=wall_seconds, success=int(error is None), error=error, **info)
+
+def process_video(video_path, output_path, subtitle_path, subtitle_style=None, mode='burn', subtitle_tracks=None, subtitle_language=None, progressive=False, render_profile=None):
+    """
+    为视频添加字幕
+    
+    Args:
+        video_path: 视频路径
+        output_path: 输出视频路径
+        subtitle_path: 字幕路径
+        subtitle_style: 字幕样式（仅烧录模式使用）
+        mode: 'burn' 将字幕烧录到画面（重新编码视频）；
+            'parallel' 分段并行烧录，见 render_parallel；
+            'smart' 只重新编码包含字幕的GOP，见 render_smart；
+            'soft' 以字幕轨道封装，视频和音频直接复制
+        subtitle_tracks: 软字幕模式下的多条字幕轨道，见 mux_soft_subtitles；
+            未提供时使用 subtitle_path 作为唯一轨道
+        subtitle_language: 软字幕模式下 subtitle_path 的语言代码
+        progressive: 烧录模式下先输出分片MP4（见 progressive_preview_path），渲染开始几秒后即可播放，
+            完成后再转封装为 moov 前置的最终文件
+        render_profile: 渲染配置名称（preset、CRF、线程、缩放和音频处理），见 render_profiles.RENDER_PROFILES，
+            默认 'standard'
+    
+    Returns:
+        成功返回True
+    """
+    with recorded_render(video_path, subtitle_path, mode, render_profile):
+        return _process_video(
+            video_path, output_path, subtitle_path, subtitle_style, mode,
+            subtitle_tracks, subtitle_language, progressive, render_profile
+        )
+
+def _process_video(video_path, output_path, subtitle_path, subtitle_style, mode, subtitle_tracks, subtitle_language, progressive, render_profile):
     # 确保输出目录存在
     output_dir = os.path.dirname(output_path)
     os.makedirs(output_dir, exist_ok=True)
 
+    if mode == 'soft':
+        tracks = subtitle_tracks or [{'path': subtitle_path, 'language': subtitle_language}]
+        if not os.path.exists(video_path) or not all(os.path.exists(t['path']) for t in tracks):
+            raise FileNotFoundError("输入文件不存在")
+        return mux_soft_subtitles(video_path, output_path, tracks)
+
     # 验证文件存在
     if not all(os.path.exists(f) for f in [video_path, subtitle_path]):
         raise FileNotFoundError("输入文件不存在")
 
+    if mode == 'parallel':
+        return render_parallel(video_path, output_path, subtitle_path, subtitle_style, render_profile=render_profile)
+    if mode == 'smart':
+        return render_smart(video_path, output_path, subtitle_path, subtitle_style, render_profile=render_profile)
+
+    render_path = None
     try:
         # 统一使用正斜杠并正确转义路径
         safe_video_path = video_path.replace('\\', '/')
-        safe_subtitle_path = subtitle_path.replace('\\', '/').replace(':', '\\:')
         safe_output_path = output_path.replace('\\', '/')
+        
+        # 渐进模式先写分片文件，完成后再生成最终文件
+        progressive = progressive and os.path.splitext(output_path)[1].lower() in FASTSTART_CONTAINERS
+        render_path = progressive_preview_path(safe_output_path) if progressive else safe_output_path
 
-        # 默认字幕样式
-        default_style = {
-            'font': 'Arial',
-            'fontsize': 22,
-            'primary_color': '&HFFFFFF&',  # 白色，ASS格式
-            'outline_color': '&H000000&',  # 黑色，ASS格式
-            'outline_width': 1,
-            'position': 'bottom',  # 'bottom' 或 'top'
-            'margin_v': 30,        # 垂直边距
-            'margin_h': 20,        # 水平边距
-            'alignment': 2,        # 2=居中, 1=左对齐, 3=右对齐
-            'bold': 0,             # 0=关闭, 1=开启
-            'italic': 0,           # 0=关闭, 1=开启
-        }
-
-        # 如果提供了自定义样式，则更新默认样式
-        if subtitle_style:
-            # 特殊处理颜色值，确保使用ASS格式
-            if 'primary_color' in subtitle_style:
-                subtitle_style['primary_color'] = convert_color_to_ass(subtitle_style['primary_color'])
-            if 'outline_color' in subtitle_style:
-                subtitle_style['outline_color'] = convert_color_to_ass(subtitle_style['outline_color'])
-                
-            default_style.update(subtitle_style)
-
-        # 构建ASS样式字符串
-        style = default_style
-        subtitle_filter = f"subtitles='{safe_subtitle_path}'"
-        
-        # 如果使用ASS字幕格式，可以添加更多样式选项
-        subtitle_filter += f":force_style='"
-        subtitle_filter += f"FontName={style['font']},"
-        subtitle_filter += f"FontSize={style['fontsize']},"
-        subtitle_filter += f"PrimaryColour={style['primary_color']},"
-        subtitle_filter += f"OutlineColour={style['outline_color']},"
-        subtitle_filter += f"BorderStyle=1,"  # 1=边框+阴影
-        subtitle_filter += f"Outline={style['outline_width']},"
-        subtitle_filter += f"Alignment={style['alignment']},"
-        subtitle_filter += f"Bold={style['bold']},"
-        subtitle_filter += f"Italic={style['italic']}"
-        
-        # 添加位置调整到 force_style 参数中
-        if style['position'] == 'top':
-            subtitle_filter += f",MarginV={style['margin_v']}"
-        else:  # 默认底部
-            subtitle_filter += f",MarginV={style['margin_v']}"
-            
-        # 水平位置调整
-        if style['alignment'] == 1:  # 左对齐
-            subtitle_filter += f",MarginL={style['margin_h']}"
-        elif style['alignment'] == 3:  # 右对齐
-            subtitle_filter += f",MarginR={style['margin_h']}"
-        # 居中对齐不需要额外调整
+        # 字幕按样式转换为 ASS（按内容缓存），使用 ass 滤镜烧录
+        subtitle_filter = _burn_filter(prepare_ass_subtitles(subtitle_path, subtitle_style), render_profile)
         
-        subtitle_filter += f"'"
+        _check_subtitle_filter()
+        encoder_args = _video_encoder_args(render_profile=render_profile)
         
         # 构建FFmpeg命令
         cmd = [
@@ -139,23 +914,30 @@ def process_video(video_path, output_path, subtitle_path, subtitle_style=None):
             '-y',
             '-i', safe_video_path,
             '-vf', subtitle_filter,
-            '-c:v', 'libx264',
-            '-preset', 'fast',
-            '-c:a', 'copy',
-            safe_output_path
+            *encoder_args,
+            *profile_audio_args(render_profile),
+            *_container_args(render_path, fragmented=progressive),
+            render_path
         ]
 
         # 打印完整命令用于调试
         print("完整执行命令:", ' '.join(cmd))
 
-        # 执行命令
-        result = subprocess.run(
-            cmd,
-            check=True,
-            capture_output=True,
-            text=True,
-            encoding='utf-8'
+        # 执行命令，上报进度并支持超时和取消
+        result = run_process(
+            with_ffmpeg_progress(cmd),
+            parser=ffmpeg_progress_parser(get_media_duration(video_path), "烧录字幕")
         )
+        
+        if progressive:
+            # 转封装为 moov 前置的普通MP4（只复制数据，几秒即可完成）
+            _run_ffmpeg([
+                'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+                '-i', render_path,
+                '-c', 'copy',
+                *_container_args(safe_output_path),
+                safe_output_path
+            ], "生成最终文件失败！", label="生成最终文件")
 
         return True
     except subprocess.CalledProcessError as e:
@@ -166,10 +948,182 @@ def process_video(video_path, output_path, subtitle_path, subtitle_style=None):
         错误输出: {e.stderr}
         """
         raise RuntimeError(error_msg)
+    except subprocess.TimeoutExpired as e:
+        raise RuntimeError(f"FFmpeg执行超过 {e.timeout:.0f} 秒，已终止")
+    finally:
+        # 无论成功、失败还是取消都删除分片文件，下次渲染的预览不会显示上次残留的部分
+        if progressive and render_path and os.path.exists(render_path):
+            os.remove(render_path)
+
+def _probe_video_id(url):
+    """获取视频的站点和ID（如 'Youtube:abc123'），只读取元数据；失败时返回None"""
+    cmd = ['yt-dlp', '--no-playlist', '--skip-download', '--print', '%(extractor_key)s:%(id)s', url]
+    try:
+        result = run_process(cmd, heavy=False)
+    except subprocess.SubprocessError as e:
+        print(f"获取视频ID失败: {e}")
+        return None
+    lines = [line.strip() for line in result.stdout.splitlines() if line.strip()]
+    return lines[-1] if lines else None
+
+# 仅音频下载的格式选择：优先纯音频流，站点不提供时退回到带音频的最低分辨率视频
+AUDIO_ONLY_FORMAT = 'bestaudio/worst[acodec!=none]/worst'
+# 下载内容（缓存变体） -> 任务目录中的文件名前缀
+DOWNLOAD_VARIANTS = {
+    'video': 'downloaded_video',
+    'audio': 'downloaded_audio',
+}
+
+def _find_downloaded_media(directory, file_prefix):
+    """查找 <file_prefix>.<扩展名> 形式的媒体文件（不含字幕、元数据和未完成的文件），未找到时返回None"""
+    for name in sorted(os.listdir(directory)):
+        if (name.startswith(file_prefix + '.') and name.count('.') == file_prefix.count('.') + 1
+                and not name.endswith(('.part', '.ytdl', '.json', '.srt', '.vtt'))):
+            path = os.path.join(directory, name)
+            if os.path.getsize(path) > 0:
+                return path
+    return None
+
+def list_playlist_entries(url, limit=None):
+    """
+    列出播放列表或频道中的视频（只读取列表，不下载）
+    
+    Args:
+        url: 播放列表、频道或单个视频的URL
+        limit: 最多列出的视频数，None 表示全部
+    
+    Returns:
+        [{'url': 视频URL, 'title': 标题}, ...]，单个视频返回只包含它自己的列表；失败时返回空列表
+    """
+    cmd = ['yt-dlp', '--flat-playlist', '--print', '%(webpage_url,url)s\t%(title)s', url]
+    if limit:
+        cmd[1:1] = ['--playlist-end', str(int(limit))]
+    try:
+        result = run_process(cmd, heavy=False)
+    except subprocess.SubprocessError as e:
+        print(f"读取播放列表失败: {e}")
+        return []
+    
+    entries = []
+    for line in result.stdout.splitlines():
+        entry_url, _, title = line.strip().partition('\t')
+        if entry_url and entry_url != 'NA':
+            entries.append({'url': entry_url, 'title': title if title and title != 'NA' else entry_url})
+    return entries
+
+def _platform_metadata_args():
+    """下载平台字幕和视频元数据的 yt-dlp 参数"""
+    return [
+        '--write-subs',  # 人工字幕
+        '--write-auto-subs',  # 自动字幕
+        '--sub-langs', ','.join(PLATFORM_SUBTITLE_LANGUAGES),
+        '--sub-format', 'srt/vtt/best',
+        '--convert-subs', 'srt',  # 转换字幕为SRT格式
+        '--write-info-json'  # 用于区分人工/自动字幕和视频语言，见 find_platform_subtitles
+    ]
+
+def _ytdlp_fetch_metadata(url, target_dir, file_prefix):
+    """只下载平台字幕和元数据到 target_dir/<file_prefix>.*（不下载媒体），失败时只打印错误"""
+    cmd = ['yt-dlp', url, '-o', os.path.join(target_dir, f"{file_prefix}.%(ext)s"), '--no-playlist', '--skip-download']
+    try:
+        run_process(cmd + _platform_metadata_args(), heavy=False)
+    except subprocess.SubprocessError as e:
+        print(f"下载平台字幕失败: {e}")
+
+def _ytdlp_download(url, target_dir, file_prefix, audio_only=False):
+    """
+    使用yt-dlp下载视频和平台字幕到 target_dir/<file_prefix>.mp4
+    audio_only=True 时只下载音频（见 AUDIO_ONLY_FORMAT），保留站点提供的容器格式
+    目录中保留的 .part 文件会被续传
+    """
+    if audio_only:
+        output_template = os.path.join(target_dir, f"{file_prefix}.%(ext)s")
+    else:
+        output_template = os.path.join(target_dir, f"{file_prefix}.mp4")
+    
+    # 检测是否是B站链接
+    is_bilibili = "bilibili.com" in url or "b23.tv" in url
+    
+    # 使用yt-dlp下载视频（比youtube-dl更新更快）
+    cmd = [
+        'yt-dlp',
+        url,
+        '-o', output_template,
+        '--no-playlist',
+        '--continue'  # 续传未完成的下载
+    ] + _platform_metadata_args()
+    if audio_only:
+        cmd.extend(['-f', AUDIO_ONLY_FORMAT])
+    
+    # 对于B站视频，添加额外的参数
+    if is_bilibili:
+        cmd.extend([
+            '--extractor-args', 'BiliBili:stream_types=["flv720","flv480","flv360"]',  # 指定可用的流类型
+            '--ignore-errors',  # 忽略错误继续下载
+        ])
+    
+    # 执行下载命令（逐行输出进度，支持超时和取消）；
+    # 下载受网络限制，不占用重负载名额，否则后台下载会让编码和识别排队
+    run_process(cmd + ['--newline'], parser=ytdlp_progress_parser("下载音频" if audio_only else "下载视频"), heavy=False)
+    
+    if audio_only:
+        if _find_downloaded_media(target_dir, file_prefix) is None:
+            raise subprocess.SubprocessError(f"下载的音频文件不存在或为空: {output_template}")
+        return
+    
+    video_filename = output_template
+    # 检查下载的文件是否存在
+    if not os.path.exists(video_filename):
+        # 尝试查找可能的其他文件名（yt-dlp有时会添加格式ID）
+        possible_files = [f for f in os.listdir(target_dir) if f.startswith(file_prefix) and f.endswith(".mp4")]
+        if possible_files:
+            shutil.move(os.path.join(target_dir, possible_files[0]), video_filename)
+    
+    if not os.path.exists(video_filename) or os.path.getsize(video_filename) == 0:
+        raise subprocess.SubprocessError(f"下载的视频文件不存在或为空: {video_filename}")
+
+def _download_url(url, output_dir, variant='video'):
+    """
+    下载 URL 到缓存并放入新建的任务目录
+    
+    Returns:
+        任务目录中的媒体文件路径，失败时返回None
+    """
+    # 确保输出目录存在
+    os.makedirs(output_dir, exist_ok=True)
+    
+    try:
+        # 同一链接：不访问网络直接命中
+        complete_dir = lookup_download_by_url(url, variant)
+        if complete_dir is None:
+            # 不同链接形式的同一视频按站点和视频ID共享缓存
+            video_id = _probe_video_id(url)
+            key = video_cache_key(video_id, variant) if video_id else url_cache_key(url, variant)
+            complete_dir = download_to_cache(
+                key,
+                lambda target_dir, file_prefix: _ytdlp_download(url, target_dir, file_prefix, variant == 'audio'),
+                {'url': url, 'video_id': video_id, 'variant': variant}
+            )
+            register_url(url, key, variant)
+        else:
+            print(f"使用已缓存的下载: {url}")
+        
+        job_prefix = DOWNLOAD_VARIANTS[variant]
+        job_dir = link_into_job(complete_dir, output_dir, job_prefix)
+        media_path = _find_downloaded_media(job_dir, job_prefix)
+        if media_path:
+            return media_path
+        print(f"下载的文件不存在或为空: {job_dir}")
+        return None
+    except (subprocess.SubprocessError, OSError) as e:
+        print(f"下载失败: {e}")
+        return None
 
 def download_video_from_url(url, output_dir):
     """
     从URL下载视频
+    下载结果按视频缓存（见 download_cache）：重复提交的链接立即返回，中断的下载可以续传；
+    每次调用都返回任务专属目录中的文件，并发会话之间互不覆盖
     
     Args:
         url: 视频URL
@@ -178,62 +1132,309 @@ def download_video_from_url(url, output_dir):
     Returns:
         下载的视频路径
     """
-    # 确保输出目录存在
-    os.makedirs(output_dir, exist_ok=True)
+    return _download_url(url, output_dir, 'video')
+
+def download_audio_from_url(url, output_dir):
+    """
+    从URL只下载音频（和平台字幕），用于只需要文本或翻译字幕的场景，数据量通常只有完整视频的几十分之一
+    需要生成视频时再调用 prefetch_video_from_url 下载完整视频
     
+    Args:
+        url: 视频URL
+        output_dir: 输出目录
+    
+    Returns:
+        下载的音频路径（保留站点提供的格式，如 .m4a/.webm）
+    """
+    return _download_url(url, output_dir, 'audio')
+
+def prefetch_video_from_url(url, output_dir):
+    """
+    在后台下载完整视频，调用方可以同时进行语音识别和翻译
+    后台下载属于当前任务的会话，取消任务时一并终止
+    
+    Returns:
+        concurrent.futures.Future，结果为视频路径（失败时为None）
+    """
+    return run_in_background(download_video_from_url, url, output_dir)
+
+# Whisper 期望的输入格式：16kHz 单声道
+AUDIO_SAMPLE_RATE = 16000
+# s16le 每个采样占 2 字节
+PCM_BYTES_PER_SAMPLE = 2
+# 分块识别时在每块末尾多长范围内寻找静音切分点（秒），避免把一个词切到两块中
+SILENCE_SEARCH_SECONDS = 5
+# 寻找静音时计算音量的窗口长度（秒）
+SILENCE_WINDOW_SECONDS = 0.02
+
+def has_audio_stream(video_path):
+    """检查视频文件是否包含音频流"""
+    cmd_check = [
+        'ffprobe', 
+        '-v', 'error',
+        '-select_streams', 'a', 
+        '-show_entries', 'stream=index', 
+        '-of', 'csv=p=0', 
+        video_path
+    ]
+    
+    try:
+        result = run_process(cmd_check, heavy=False)
+    except (subprocess.SubprocessError, FileNotFoundError) as e:
+        print(f"检查音频流失败: {e}")
+        return False
+    return bool(result.stdout.strip())
+
+def _build_pcm_command(video_path, sample_rate=AUDIO_SAMPLE_RATE):
+    """构建将音频以 s16le PCM 写到标准输出的 FFmpeg 命令"""
+    return [
+        'ffmpeg',
+        '-hide_banner',
+        '-loglevel', 'error',
+        '-i', video_path,
+        '-vn',  # 禁用视频
+        '-acodec', 'pcm_s16le',
+        '-ar', str(sample_rate),
+        '-ac', '1',
+        '-f', 's16le',
+        'pipe:1'
+    ]
+
+def stream_audio_pcm(video_path, chunk_seconds=30, sample_rate=AUDIO_SAMPLE_RATE):
+    """
+    以流的方式从视频中读取 PCM 音频，不写入中间 WAV 文件
+    FFmpeg 仍在解码时即可逐块产出数据，供分块语音识别边提取边消费
+    
+    Args:
+        video_path: 视频路径
+        chunk_seconds: 每块的时长（秒）
+        sample_rate: 采样率
+    
+    Yields:
+        (offset_seconds, pcm_bytes) 元组，pcm_bytes 为 s16le 单声道数据
+    """
+    chunk_bytes = int(chunk_seconds * sample_rate) * PCM_BYTES_PER_SAMPLE
+    process = subprocess.Popen(
+        _build_pcm_command(video_path, sample_rate),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        **popen_group_kwargs()
+    )
     try:
-        # 创建临时文件名
-        video_filename = os.path.join(output_dir, "downloaded_video.mp4")
+        with track_process(process):
+            yield from _read_pcm_chunks(process, chunk_bytes, sample_rate)
         
-        # 检测是否是B站链接
-        is_bilibili = "bilibili.com" in url or "b23.tv" in url
+        process.wait()
+        if process.returncode != 0:
+            raise_if_cancelled(process.args)
+            stderr = process.stderr.read().decode('utf-8', errors='replace')
+            raise subprocess.CalledProcessError(process.returncode, process.args, stderr=stderr)
+    finally:
+        # 消费方提前退出时终止 FFmpeg，避免残留进程
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+
+def _silence_cut(pcm, sample_rate):
+    """在块末尾 SILENCE_SEARCH_SECONDS 内找到音量最低的窗口，返回其中点的字节位置"""
+    window = max(1, int(sample_rate * SILENCE_WINDOW_SECONDS))
+    total = len(pcm) // PCM_BYTES_PER_SAMPLE
+    search_start = max(0, total - int(sample_rate * SILENCE_SEARCH_SECONDS))
+    samples = array.array('h')
+    samples.frombytes(bytes(pcm[search_start * PCM_BYTES_PER_SAMPLE:total * PCM_BYTES_PER_SAMPLE]))
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    
+    best, best_energy = total, None
+    for start in range(0, len(samples) - window + 1, window):
+        energy = sum(abs(value) for value in samples[start:start + window])
+        if best_energy is None or energy < best_energy:
+            best, best_energy = search_start + start + window // 2, energy
+    return best * PCM_BYTES_PER_SAMPLE
+
+def _read_pcm_chunks(process, chunk_bytes, sample_rate):
+    """
+    读取 PCM 块；除最后一块外都在块末尾的静音处切分，切点之后的音频并入下一块，
+    块边界不会落在词语中间
+    """
+    samples_read = 0
+    carry = b''
+    eof = False
+    while not eof:
+        # 每块之间检查任务是否已被取消
+        raise_if_cancelled(process.args)
         
-        # 使用yt-dlp下载视频（比youtube-dl更新更快）
-        cmd = [
-            'yt-dlp',
-            url,
-            '-o', video_filename,
-            '--no-playlist',
-            '--write-auto-sub',  # 自动写入字幕
-            '--sub-format', 'srt',  # 字幕格式为SRT
-            '--sub-lang', 'zh-CN',  # 优先选择中文字幕
-            '--convert-subs', 'srt'  # 转换字幕为SRT格式
-        ]
+        # 读满一个块或直到 EOF
+        buffer = bytearray(carry)
+        while len(buffer) < chunk_bytes:
+            data = process.stdout.read(chunk_bytes - len(buffer))
+            if not data:
+                eof = True
+                break
+            buffer += data
         
-        # 对于B站视频，添加额外的参数
-        if is_bilibili:
-            cmd.extend([
-                '--extractor-args', 'BiliBili:stream_types=["flv720","flv480","flv360"]',  # 指定可用的流类型
-                '--ignore-errors',  # 忽略错误继续下载
-            ])
-        
-        # 执行下载命令
-        subprocess.run(cmd, check=True)
-        
-        # 检查下载的文件是否存在
-        if not os.path.exists(video_filename):
-            # 尝试查找可能的其他文件名（yt-dlp有时会添加格式ID）
-            possible_files = [f for f in os.listdir(output_dir) if f.startswith("downloaded_video") and f.endswith(".mp4")]
-            if possible_files:
-                # 使用找到的第一个文件
-                actual_filename = os.path.join(output_dir, possible_files[0])
-                # 重命名为预期的文件名
-                if actual_filename != video_filename:
-                    shutil.move(actual_filename, video_filename)
-        
-        # 再次检查文件是否存在
-        if os.path.exists(video_filename) and os.path.getsize(video_filename) > 0:
-            return video_filename
-        else:
-            print(f"下载的视频文件不存在或为空: {video_filename}")
-            return None
+        # 丢弃可能不完整的最后一个采样
+        usable = len(buffer) - len(buffer) % PCM_BYTES_PER_SAMPLE
+        if not usable:
+            break
+        
+        cut = usable if eof else _silence_cut(buffer, sample_rate)
+        yield samples_read / sample_rate, bytes(buffer[:cut])
+        samples_read += cut // PCM_BYTES_PER_SAMPLE
+        carry = bytes(buffer[cut:usable])
+
+# 边下载边解码时每次从 yt-dlp 读取并转发的字节数
+STREAM_BLOCK_BYTES = 64 * 1024
+
+def _probe_stream_info(url, format_selector=AUDIO_ONLY_FORMAT):
+    """
+    获取视频的站点和ID（见 _probe_video_id）以及所选格式的文件扩展名（只读取元数据）
+
+    Returns:
+        (视频ID, 扩展名) 元组，获取失败的项为None
+    """
+    cmd = ['yt-dlp', '--no-playlist', '--skip-download', '-f', format_selector,
+           '--print', '%(extractor_key)s:%(id)s\t%(ext)s', url]
+    try:
+        result = run_process(cmd, heavy=False)
     except subprocess.SubprocessError as e:
-        print(f"下载视频失败: {e}")
+        print(f"获取音频格式失败: {e}")
+        return None, None
+    lines = [line.strip() for line in result.stdout.splitlines() if line.strip()]
+    if not lines:
+        return None, None
+    video_id, _, extension = lines[-1].partition('\t')
+    return video_id or None, extension or None
+
+def _tee_stream(source, sink_file, decoder, errors):
+    """将 yt-dlp 的输出同时写入文件和 FFmpeg 的标准输入"""
+    try:
+        while True:
+            block = source.read(STREAM_BLOCK_BYTES)
+            if not block:
+                break
+            sink_file.write(block)
+            decoder.stdin.write(block)
+    except (BrokenPipeError, OSError, ValueError) as e:
+        # FFmpeg 提前退出（出错或被取消）时停止转发，错误由解码端报告
+        errors.append(e)
+    finally:
+        try:
+            decoder.stdin.close()
+        except OSError:
+            pass
+
+def stream_url_audio_pcm(url, output_path, chunk_seconds=30, sample_rate=AUDIO_SAMPLE_RATE):
+    """
+    边下载边解码：yt-dlp 下载的音频流一边写入 output_path，一边送入 FFmpeg 解码为 PCM 块，
+    不必等待下载完成即可开始语音识别
+    
+    Args:
+        url: 视频URL
+        output_path: 保存下载音频的路径
+        chunk_seconds: 每块的时长（秒）
+        sample_rate: 采样率
+    
+    Yields:
+        (offset_seconds, pcm_bytes) 元组，与 stream_audio_pcm 相同
+    """
+    chunk_bytes = int(chunk_seconds * sample_rate) * PCM_BYTES_PER_SAMPLE
+    downloader = subprocess.Popen(
+        ['yt-dlp', url, '--no-playlist', '-f', AUDIO_ONLY_FORMAT, '-o', '-', '--quiet', '--no-progress'],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        **popen_group_kwargs()
+    )
+    decoder = subprocess.Popen(
+        _build_pcm_command('pipe:0', sample_rate),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        **popen_group_kwargs()
+    )
+    downloader_stderr = []
+    tee_errors = []
+    stderr_reader = threading.Thread(target=lambda: downloader_stderr.append(downloader.stderr.read()), daemon=True)
+    try:
+        with open(output_path, 'wb') as sink_file, track_process(downloader), track_process(decoder):
+            tee = threading.Thread(target=_tee_stream, args=(downloader.stdout, sink_file, decoder, tee_errors), daemon=True)
+            stderr_reader.start()
+            tee.start()
+            yield from _read_pcm_chunks(decoder, chunk_bytes, sample_rate)
+            
+            decoder.wait()
+            if decoder.returncode != 0 and downloader.poll() is None:
+                # 解码失败后不再有进程读取下载数据，终止下载避免阻塞
+                downloader.kill()
+            tee.join()
+            downloader.wait()
+            stderr_reader.join()
+        
+        for process in (decoder, downloader):
+            if process.returncode != 0:
+                raise_if_cancelled(process.args)
+                if process is decoder:
+                    stderr = decoder.stderr.read()
+                else:
+                    stderr = b''.join(downloader_stderr)
+                raise subprocess.CalledProcessError(
+                    process.returncode, process.args, stderr=stderr.decode('utf-8', errors='replace')
+                )
+    finally:
+        # 消费方提前退出时终止两个进程，避免残留
+        for process in (decoder, downloader):
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+        for stream in (downloader.stdout, decoder.stdout, decoder.stderr):
+            stream.close()
+
+def extract_audio_pcm(video_path, sample_rate=AUDIO_SAMPLE_RATE):
+    """
+    一次性将视频音频解码为内存中的 PCM 数组（不落盘）
+    
+    Args:
+        video_path: 视频路径
+        sample_rate: 采样率
+    
+    Returns:
+        int16 的 NumPy 数组（直接引用 FFmpeg 输出缓冲区，无额外拷贝），
+        如果视频没有音频或提取失败则返回None
+    """
+    import numpy as np
+    
+    if not has_audio_stream(video_path):
+        print(f"警告: 视频 {video_path} 不包含音频流")
         return None
+    
+    try:
+        # 使用二进制管道读取，不能经过 run_process 的文本解码
+        with track_process(subprocess.Popen(
+            _build_pcm_command(video_path, sample_rate),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            **popen_group_kwargs()
+        )) as process:
+            stdout, stderr = process.communicate()
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, process.args, stderr=stderr)
+    except subprocess.SubprocessError as e:
+        print(f"提取音频失败: {e}")
+        return None
+    
+    data = stdout
+    usable = len(data) - len(data) % PCM_BYTES_PER_SAMPLE
+    if usable == 0:
+        print(f"警告: 视频 {video_path} 解码出的音频为空")
+        return None
+    return np.frombuffer(data, dtype=np.int16, count=usable // PCM_BYTES_PER_SAMPLE)
 
 def extract_audio(video_path, output_dir):
     """
-    从视频中提取音频
+    从视频中提取音频为 WAV 文件
+    仅用于页面上的音频预览；语音识别可直接使用 stream_audio_pcm，无需此文件
     
     Args:
         video_path: 视频路径
@@ -244,19 +1445,7 @@ def extract_audio(video_path, output_dir):
     """
     try:
         # 首先检查视频文件是否包含音频流
-        cmd_check = [
-            'ffprobe', 
-            '-v', 'error',
-            '-select_streams', 'a', 
-            '-show_entries', 'stream=index', 
-            '-of', 'csv=p=0', 
-            video_path
-        ]
-        
-        result = subprocess.run(cmd_check, capture_output=True, text=True)
-        
-        # 如果没有音频流，返回None
-        if not result.stdout.strip():
+        if not has_audio_stream(video_path):
             print(f"警告: 视频 {video_path} 不包含音频流")
             return None
         
@@ -268,13 +1457,13 @@ def extract_audio(video_path, output_dir):
             '-i', video_path,
             '-vn',  # 禁用视频
             '-acodec', 'pcm_s16le',  # 音频编码
-            '-ar', '16000',  # 采样率
+            '-ar', str(AUDIO_SAMPLE_RATE),  # 采样率
             '-ac', '1',  # 单声道
             '-y',
             audio_path
         ]
         
-        subprocess.run(cmd, check=True)
+        run_process(with_ffmpeg_progress(cmd), parser=ffmpeg_progress_parser(get_media_duration(video_path), "提取音频"))
         
         # 检查生成的音频文件是否存在且大小大于0
         if os.path.exists(audio_path) and os.path.getsize(audio_path) > 0:
@@ -287,55 +1476,330 @@ def extract_audio(video_path, output_dir):
         print(f"提取音频失败: {e}")
         return None
 
-def auto_generate_subtitles(video_path, output_dir):
+def get_media_duration(media_path):
+    """使用ffprobe获取音视频时长（秒），失败时返回None"""
+    cmd_info = [
+        'ffprobe',
+        '-v', 'error',
+        '-show_entries', 'format=duration',
+        '-of', 'json',
+        media_path
+    ]
+    try:
+        result = run_process(cmd_info, heavy=False)
+        info = json.loads(result.stdout) if result.stdout else {}
+        return float(info.get('format', {}).get('duration'))
+    except (subprocess.SubprocessError, FileNotFoundError, ValueError, TypeError):
+        return None
+
+def choose_asr_model(media_path, deadline_seconds, engine=None, default_model=None):
+    """
+    根据音频时长和完成时限选择识别模型
+    
+    Args:
+        media_path: 视频或音频路径
+        deadline_seconds: 完成时限（秒）
+        engine: 引擎名称，None表示使用默认引擎
+        default_model: 无法获取时长时使用的模型
+    
+    Returns:
+        模型名称；无法获取时长或没有可用的识别引擎时返回 default_model
+    """
+    duration = get_media_duration(media_path)
+    engine = engine or get_default_asr_engine()
+    if not duration or not engine:
+        return default_model or TEXT_ASR_MODEL
+    
+    model_name = select_asr_model(duration, deadline_seconds, engine)
+    print(f"音频时长 {duration:.0f} 秒，完成时限 {deadline_seconds:.0f} 秒，选择模型: {model_name}")
+    return model_name
+
+# 自动生成字幕使用较快的模型，生成可编辑文本使用更准确的模型
+SUBTITLE_ASR_MODEL = 'tiny'
+TEXT_ASR_MODEL = 'base'
+
+def transcribe_audio_stream(media_path, model_name=TEXT_ASR_MODEL, chunk_seconds=30, engine=None, options=None):
+    """
+    边解码边识别：FFmpeg 产出的每个 PCM 块立即交给语音识别引擎
+    
+    Args:
+        media_path: 视频或音频路径
+        model_name: 模型名称
+        chunk_seconds: 每块的时长（秒）
+        engine: 引擎名称，None表示使用默认引擎
+        options: 传给引擎的其他参数（language、threads、word_timestamps 等）
+    
+    Returns:
+        字幕片段列表，每项为 {'start': 秒, 'end': 秒, 'text': 文本}
+    
+    Raises:
+        ValueError: 没有可用的识别引擎
+    """
+    asr_engine = get_asr_engine(resolve_asr_engine(engine))
+    # 先加载模型（首次使用时可能还要下载），加载时间不计入实时率
+    asr_engine['load'](dict(options or {}, model=model_name))
+    started = time.time()
+    segments, audio_seconds = _transcribe_pcm_chunks(
+        stream_audio_pcm(media_path, chunk_seconds=chunk_seconds), asr_engine, model_name, options
+    )
+    
+    # 记录本机实时率，供按完成时限选择模型使用
+    record_asr_rtf(asr_engine['name'], model_name, audio_seconds, time.time() - started)
+    return segments
+
+# 作为下一块识别提示的已识别片段数
+ASR_PROMPT_SEGMENTS = 3
+
+def _transcribe_pcm_chunks(chunks, asr_engine, model_name, options=None, on_segments=None):
+    """
+    逐块识别 PCM 音频，片段时间加上块的偏移量
+    
+    Args:
+        chunks: (offset_seconds, pcm_bytes) 的迭代器
+        asr_engine: 识别引擎（见 get_asr_engine）
+        on_segments: 每块识别完成后调用 on_segments(本块片段, 已识别的音频秒数)
+    
+    Returns:
+        (segments, audio_seconds) 元组
+    """
+    engine_options = dict(options or {})
+    engine_options.update({'model': model_name, 'sample_rate': AUDIO_SAMPLE_RATE})
+    if engine_options.get('word_timestamps') and not asr_engine['capabilities'].get('word_timestamps'):
+        print(f"语音识别引擎 {asr_engine['name']} 不支持词级时间戳，已忽略")
+        engine_options.pop('word_timestamps')
+    
+    audio_seconds = 0.0
+    segments = []
+    for offset, pcm in chunks:
+        audio_seconds = offset + len(pcm) / float(PCM_BYTES_PER_SAMPLE * AUDIO_SAMPLE_RATE)
+        # 把上一块结尾的文本作为提示，保持各块之间的用词和标点风格连贯
+        engine_options['prompt'] = ' '.join(seg['text'] for seg in segments[-ASR_PROMPT_SEGMENTS:]) or None
+        chunk_segments = []
+        for seg in asr_engine['transcribe'](pcm, engine_options):
+            if not seg.get('text'):
+                continue
+            shifted = dict(seg, start=offset + seg['start'], end=offset + seg['end'])
+            if 'words' in seg:
+                shifted['words'] = [dict(w, start=offset + w['start'], end=offset + w['end']) for w in seg['words']]
+            chunk_segments.append(shifted)
+        segments.extend(chunk_segments)
+        if on_segments:
+            on_segments(chunk_segments, audio_seconds)
+    return segments, audio_seconds
+
+def _transcription_cache_key(media_path, model_name, chunk_seconds, engine, options=None):
+    cache_options = dict(options or {}, engine=engine, chunk_seconds=chunk_seconds)
+    return asr_cache_key(file_fingerprint(media_path), model_name, (options or {}).get('language'), cache_options)
+
+def transcribe_with_cache(media_path, model_name=TEXT_ASR_MODEL, chunk_seconds=30, engine=None, options=None):
+    """
+    带缓存的语音识别：相同内容、相同引擎、模型和参数的识别结果直接从缓存返回
+    
+    Args:
+        media_path: 视频或音频路径
+        model_name: 模型名称
+        chunk_seconds: 每块的时长（秒）
+        engine: 引擎名称，None表示使用默认引擎
+        options: 传给引擎的其他参数
+    
+    Returns:
+        (segments, cache_key) 元组
+    
+    Raises:
+        ValueError: 没有可用的识别引擎
+    """
+    engine = resolve_asr_engine(engine)
+    key = _transcription_cache_key(media_path, model_name, chunk_seconds, engine, options)
+    segments = load_cached_segments(key)
+    if segments is not None:
+        print(f"命中识别结果缓存: {key[:12]}")
+        return segments, key
+    
+    segments = transcribe_audio_stream(media_path, model_name, chunk_seconds, engine, options)
+    save_cached_segments(key, segments, {
+        'engine': engine,
+        'model': model_name,
+        'source': os.path.basename(media_path),
+        'chunk_seconds': chunk_seconds
+    })
+    return segments, key
+
+def transcribe_url_streaming(url, output_dir, model_name=TEXT_ASR_MODEL, chunk_seconds=30, engine=None, options=None, on_segments=None):
+    """
+    边下载边识别：下载音频的同时逐块识别，首批文本在下载完成前即可得到
+    音频与 download_audio_from_url 一样写入下载缓存（连同平台字幕和元数据），并放入任务专属目录；
+    识别结果按该文件写入识别缓存，之后对同一文件调用 transcribe_with_cache（例如生成文本）会直接命中。
+    音频已在下载缓存中时不再下载，直接识别缓存的文件
+    
+    Args:
+        url: 视频URL
+        output_dir: 输出目录
+        model_name: 模型名称
+        chunk_seconds: 每块的时长（秒）
+        engine: 引擎名称，None表示使用默认引擎
+        options: 传给引擎的其他参数
+        on_segments: 每块识别完成后调用 on_segments(本块片段, 已识别的音频秒数)
+    
+    Returns:
+        (音频路径, segments) 元组，失败时返回 (None, None)
+    """
+    engine = engine or get_default_asr_engine()
+    if engine is None:
+        print("没有可用的语音识别引擎，无法边下载边识别")
+        return None, None
+    os.makedirs(output_dir, exist_ok=True)
+    streamed = {}
+    
+    if lookup_download_by_url(url, 'audio') is None:
+        video_id, extension = _probe_stream_info(url)
+        key = video_cache_key(video_id, 'audio') if video_id else url_cache_key(url, 'audio')
+        
+        def download(target_dir, file_prefix):
+            stream_path = os.path.join(target_dir, f"{file_prefix}.{extension or 'audio'}")
+            try:
+                streamed['segments'], _ = _transcribe_pcm_chunks(
+                    stream_url_audio_pcm(url, stream_path, chunk_seconds=chunk_seconds),
+                    get_asr_engine(engine), model_name, options, on_segments
+                )
+            except BaseException:
+                # 不完整的文件不能留在缓存的 partial 目录中，否则之后的 yt-dlp 续传会把它当作已下载完成
+                if os.path.exists(stream_path):
+                    os.remove(stream_path)
+                raise
+            _ytdlp_fetch_metadata(url, target_dir, file_prefix)
+        
+        try:
+            download_to_cache(key, download, {'url': url, 'video_id': video_id, 'variant': 'audio'})
+        except (subprocess.SubprocessError, OSError) as e:
+            print(f"边下载边识别失败: {e}")
+            return None, None
+        register_url(url, key, 'audio')
+    
+    audio_path = _download_url(url, output_dir, 'audio')
+    if audio_path is None:
+        return None, None
+    if 'segments' not in streamed:
+        # 音频已由之前的下载（或同时进行的其他会话）缓存，直接识别缓存的文件
+        try:
+            segments, _ = transcribe_with_cache(audio_path, model_name, chunk_seconds, engine, options)
+        except (ValueError, subprocess.SubprocessError) as e:
+            print(f"识别缓存的音频失败: {e}")
+            return None, None
+        if on_segments and segments:
+            on_segments(segments, segments[-1]['end'])
+        return audio_path, segments
+    
+    # 识别耗时包含等待下载的时间，不记录实时率；结果按完整文件写入缓存
+    segments = streamed['segments']
+    save_cached_segments(_transcription_cache_key(audio_path, model_name, chunk_seconds, engine, options), segments, {
+        'engine': engine,
+        'model': model_name,
+        'source': url,
+        'chunk_seconds': chunk_seconds
+    })
+    return audio_path, segments
+
+def save_segments_as_srt(segments, subtitle_path):
+    """将识别出的片段保存为SRT文件"""
+    import pysrt
+    
+    subs = pysrt.SubRipFile()
+    for i, seg in enumerate(segments):
+        sub = pysrt.SubRipItem()
+        sub.index = i + 1
+        sub.start = pysrt.SubRipTime(seconds=seg['start'])
+        sub.end = pysrt.SubRipTime(seconds=seg['end'])
+        sub.text = seg['text']
+        subs.append(sub)
+    subs.save(subtitle_path, encoding='utf-8')
+    return subtitle_path
+
+def save_segments_as_text(segments, text_path):
+    """将识别出的片段保存为纯文本文件，每个片段一行"""
+    with open(text_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(seg['text'] for seg in segments))
+    return text_path
+
+# 没有进程内识别引擎时 auto_generate_subtitles 使用的 whisper 命令行
+WHISPER_CLI_ENGINE = 'whisper-cli'
+
+def resolve_subtitle_asr_engine(engine=None):
+    """
+    auto_generate_subtitles 实际使用的识别方式：指定或默认的引擎，否则为 whisper 命令行（WHISPER_CLI_ENGINE）
+
+    Returns:
+        引擎名称，都不可用时返回None（只能生成提示安装的占位字幕）
+    """
+    engine = engine or get_default_asr_engine()
+    if engine:
+        return engine
+    return WHISPER_CLI_ENGINE if is_tool_available('whisper') else None
+
+def auto_generate_subtitles(video_path, output_dir, model_name=SUBTITLE_ASR_MODEL, engine=None, deadline_seconds=None, stats=None):
     """
     为没有字幕的视频自动生成字幕
-    使用whisper模型或备用方法进行语音识别
+    使用已注册的语音识别引擎、whisper命令行或备用方法进行语音识别
     
     Args:
         video_path: 视频路径
         output_dir: 输出目录
+        model_name: 模型名称
+        engine: 引擎名称，None表示使用默认引擎
+        deadline_seconds: 识别完成时限（秒），提供时自动选择能按时完成的最准确模型
+        stats: 提供字典时写入 'engine'、'model'（实际使用的识别方式和模型）和
+               'placeholder'（是否只生成了提示安装 Whisper 的占位字幕）
     
     Returns:
         生成的字幕文件路径
     """
+    subtitle_path = os.path.join(output_dir, "auto_generated.srt")
+    stats = stats if stats is not None else {}
+    stats['placeholder'] = False
+    
+    if deadline_seconds:
+        model_name = choose_asr_model(video_path, deadline_seconds, engine, model_name)
+    stats['model'] = model_name
+    
+    # 优先在进程内识别：FFmpeg 直接把 PCM 送入识别引擎，不写中间 WAV 文件
+    engine = engine or get_default_asr_engine()
+    if engine:
+        stats['engine'] = engine
+        if not has_audio_stream(video_path):
+            print(f"警告: 视频 {video_path} 不包含音频流")
+            return None
+        try:
+            segments, key = transcribe_with_cache(video_path, model_name, engine=engine)
+            if segments:
+                # 按缓存键命名输出文件，避免并发会话相互覆盖
+                return save_segments_as_srt(segments, os.path.join(output_dir, f"auto_generated_{key[:12]}.srt"))
+            # 识别正常完成但没有任何语音，再用命令行识别同一段音频也不会有结果
+            print(f"视频 {video_path} 中没有识别到语音")
+            return None
+        except Exception as e:
+            print(f"使用{engine}流式生成字幕失败: {e}")
+            # 继续使用命令行方式
+    
     # 提取音频
     audio_path = extract_audio(video_path, output_dir)
     if not audio_path:
         return None
     
-    subtitle_path = os.path.join(output_dir, "auto_generated.srt")
-    
-    # 检查whisper是否已安装
-    whisper_installed = False
-    try:
-        # 尝试导入whisper模块
-        import importlib
-        importlib.import_module('whisper')
-        whisper_installed = True
-    except ImportError:
-        pass
-    
-    # 检查whisper命令行工具是否可用
-    if not whisper_installed:
-        try:
-            result = subprocess.run(['whisper', '--help'], capture_output=True, text=True)
-            whisper_installed = 'usage: whisper' in result.stdout
-        except (subprocess.SubprocessError, FileNotFoundError):
-            whisper_installed = False
+    # 检查whisper命令行工具是否可用（使用缓存的工具链探测结果）
+    whisper_installed = is_tool_available('whisper')
     
     if whisper_installed:
+        stats['engine'] = WHISPER_CLI_ENGINE
         try:
             # 使用whisper命令行工具生成字幕
             cmd = [
                 'whisper',
                 audio_path,
-                '--model', 'tiny',  # 使用tiny模型，速度快但准确度低
+                '--model', model_name,  # 默认使用tiny模型，速度快但准确度低
                 '--output_dir', output_dir,
                 '--output_format', 'srt'
             ]
             
-            subprocess.run(cmd, check=True)
+            run_process(cmd)
             
             # Whisper输出的文件名可能不是我们期望的
             expected_output = os.path.join(output_dir, os.path.basename(audio_path).replace('.wav', '.srt'))
@@ -360,7 +1824,7 @@ def auto_generate_subtitles(video_path, output_dir):
             video_path
         ]
         
-        result = subprocess.run(cmd_info, capture_output=True, text=True)
+        result = run_process(cmd_info, heavy=False)
         video_info = json.loads(result.stdout) if result.stdout else {}
         
         # 尝试获取视频时长
@@ -400,42 +1864,45 @@ def auto_generate_subtitles(video_path, output_dir):
         
         # 保存字幕文件
         subs.save(subtitle_path, encoding='utf-8')
+        stats['placeholder'] = True
         return subtitle_path
     except Exception as e:
         print(f"生成备用字幕失败: {e}")
         return None
 
-def generate_text_from_audio(audio_path, output_dir):
+def generate_text_from_audio(audio_path, output_dir, model_name=TEXT_ASR_MODEL, engine=None, deadline_seconds=None):
     """
     从音频生成纯文本（非字幕格式）
-    使用whisper进行音频识别，如果whisper未安装则使用简单的备用方法
+    使用已注册的语音识别引擎或whisper命令行进行音频识别，都不可用时使用简单的备用方法
     
     Args:
         audio_path: 音频文件路径
         output_dir: 输出目录
+        model_name: 模型名称
+        engine: 引擎名称，None表示使用默认引擎
+        deadline_seconds: 识别完成时限（秒），提供时自动选择能按时完成的最准确模型
     
     Returns:
         生成的文本文件路径
     """
     text_path = os.path.join(output_dir, "audio_text.txt")
     
-    # 检查whisper是否已安装
-    whisper_installed = False
-    try:
-        # 尝试导入whisper模块
-        import importlib
-        importlib.import_module('whisper')
-        whisper_installed = True
-    except ImportError:
-        pass
-    
-    # 检查whisper命令行工具是否可用
-    if not whisper_installed:
+    if deadline_seconds:
+        model_name = choose_asr_model(audio_path, deadline_seconds, engine, model_name)
+    
+    # 优先在进程内识别，避免再启动whisper命令行并重新加载模型
+    engine = engine or get_default_asr_engine()
+    if engine:
         try:
-            result = subprocess.run(['whisper', '--help'], capture_output=True, text=True)
-            whisper_installed = 'usage: whisper' in result.stdout
-        except (subprocess.SubprocessError, FileNotFoundError):
-            whisper_installed = False
+            segments, key = transcribe_with_cache(audio_path, model_name, engine=engine)
+            # 没有识别到语音时返回空文本，不再用命令行重复识别
+            return save_segments_as_text(segments, os.path.join(output_dir, f"audio_text_{key[:12]}.txt"))
+        except Exception as e:
+            print(f"使用{engine}流式生成文本失败: {e}")
+            # 继续使用命令行方式
+    
+    # 检查whisper命令行工具是否可用（使用缓存的工具链探测结果）
+    whisper_installed = is_tool_available('whisper')
     
     if whisper_installed:
         try:
@@ -443,12 +1910,12 @@ def generate_text_from_audio(audio_path, output_dir):
             cmd = [
                 'whisper',
                 audio_path,
-                '--model', 'base',  # 使用base模型，平衡速度和准确度
+                '--model', model_name,  # 默认使用base模型，平衡速度和准确度
                 '--output_dir', output_dir,
                 '--output_format', 'txt'
             ]
             
-            subprocess.run(cmd, check=True)
+            run_process(cmd)
             
             # Whisper输出的文件名可能不是我们期望的
             expected_output = os.path.join(output_dir, os.path.basename(audio_path).replace('.wav', '.txt'))
@@ -473,7 +1940,7 @@ def generate_text_from_audio(audio_path, output_dir):
             audio_path
         ]
         
-        result = subprocess.run(cmd_info, capture_output=True, text=True)
+        result = run_process(cmd_info, heavy=False)
         audio_info = json.loads(result.stdout) if result.stdout else {}
         
         # 生成简单的文本内容
@@ -0,0 +1,192 @@
+import os
+import re
+import time
+import shutil
+import tempfile
+import threading
+import traceback
+from contextlib import contextmanager
+from cache_utils import touch
+
+# 工作区根目录（各会话的临时文件和输出），可通过环境变量改为其他目录
+WORKSPACE_ROOT = os.environ.get('VIDEO_TRANSLATE_WORKSPACE_DIR') or os.path.join(tempfile.gettempdir(), 'video_translate_workspaces')
+# 所有会话工作区的磁盘配额（字节）
+WORKSPACE_MAX_BYTES = int(os.environ.get('VIDEO_TRANSLATE_WORKSPACE_BYTES') or 20 * 1024 * 1024 * 1024)
+# 会话工作区超过该时间未使用时整体删除（秒）
+WORKSPACE_TTL_SECONDS = float(os.environ.get('VIDEO_TRANSLATE_WORKSPACE_TTL') or 24 * 3600)
+# 最近该时间内使用过的会话视为仍在使用，超出配额时也不淘汰其中的文件（秒）
+WORKSPACE_IDLE_SECONDS = 30 * 60
+# 任务运行期间刷新会话工作区使用时间的间隔（秒），须远小于 WORKSPACE_IDLE_SECONDS
+WORKSPACE_HEARTBEAT_SECONDS = 60
+# 清理线程的执行间隔（秒）
+JANITOR_INTERVAL = 600
+# 超出配额时优先淘汰的大文件（音频和视频）
+LARGE_ARTIFACT_EXTENSIONS = (
+    '.mp4', '.mkv', '.mov', '.avi', '.flv', '.webm', '.m4v', '.ts',
+    '.wav', '.m4a', '.mp3', '.aac', '.opus', '.ogg', '.flac'
+)
+# 会话工作区中记录最后使用时间的文件
+LAST_USED_NAME = '.last_used'
+
+_JANITOR_LOCK = threading.Lock()
+_JANITOR_THREAD = None
+
+def _sessions_dir():
+    path = os.path.join(WORKSPACE_ROOT, 'sessions')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def _safe_name(name):
+    return re.sub(r'[^\w.-]+', '_', str(name))[:80] or 'default'
+
+def touch_workspace(workspace_dir):
+    """记录会话工作区的最后使用时间"""
+    marker = os.path.join(workspace_dir, LAST_USED_NAME)
+    if not os.path.exists(marker):
+        try:
+            open(marker, 'a').close()
+        except OSError:
+            return
+    touch(marker)
+
+@contextmanager
+def workspace_in_use(workspace_dir, interval=WORKSPACE_HEARTBEAT_SECONDS):
+    """
+    任务运行期间在后台线程中定期刷新会话工作区的使用时间，
+    长时间运行、期间没有页面交互的任务不会被当作空闲会话淘汰文件
+    """
+    stopped = threading.Event()
+
+    def beat():
+        while not stopped.wait(interval):
+            touch_workspace(workspace_dir)
+
+    touch_workspace(workspace_dir)
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+        touch_workspace(workspace_dir)
+
+def session_workspace(session_id=None):
+    """
+    获取（并创建）会话专属的工作区目录，同时记录使用时间
+    不同会话的中间文件互不覆盖；长时间未使用的工作区由 clean_workspaces 删除
+
+    Args:
+        session_id: 会话ID，None 表示不在 Streamlit 中运行
+
+    Returns:
+        工作区目录
+    """
+    workspace_dir = os.path.join(_sessions_dir(), _safe_name(session_id or 'local'))
+    os.makedirs(workspace_dir, exist_ok=True)
+    touch_workspace(workspace_dir)
+    return workspace_dir
+
+def job_workspace(workspace_dir, name):
+    """
+    获取（并创建）会话工作区中的任务目录
+    同名任务（例如对同一视频重新处理）使用同一目录，可以复用上次已完成的阶段（见 stage_manifest）
+    """
+    job_dir = os.path.join(workspace_dir, 'jobs', _safe_name(name))
+    os.makedirs(job_dir, exist_ok=True)
+    return job_dir
+
+def _last_used(workspace_dir):
+    try:
+        return os.path.getmtime(os.path.join(workspace_dir, LAST_USED_NAME))
+    except OSError:
+        try:
+            return os.path.getmtime(workspace_dir)
+        except OSError:
+            return 0.0
+
+def clean_workspaces(max_bytes=WORKSPACE_MAX_BYTES, ttl_seconds=WORKSPACE_TTL_SECONDS, active_session_ids=None):
+    """
+    清理会话工作区：
+    1. 删除超过 ttl_seconds 未使用且不在 active_session_ids 中的会话工作区
+    2. 总大小仍超过配额时，按最近使用时间淘汰空闲会话中的音频和视频文件
+
+    Args:
+        max_bytes: 磁盘配额（字节）
+        ttl_seconds: 未使用多久后删除整个工作区（秒）
+        active_session_ids: 仍在连接的会话ID，None 表示未知（只按使用时间判断，
+                            运行中的任务会定期刷新使用时间，见 workspace_in_use）
+
+    Returns:
+        (删除的工作区数, 淘汰的文件数)
+    """
+    now = time.time()
+    active = set(_safe_name(session_id) for session_id in (active_session_ids or []))
+    sessions_dir = _sessions_dir()
+
+    removed_workspaces = 0
+    total = 0
+    candidates = []
+    for name in os.listdir(sessions_dir):
+        workspace_dir = os.path.join(sessions_dir, name)
+        if not os.path.isdir(workspace_dir):
+            continue
+        idle = now - _last_used(workspace_dir)
+        if name not in active and idle > ttl_seconds:
+            shutil.rmtree(workspace_dir, ignore_errors=True)
+            removed_workspaces += 1
+            continue
+
+        in_use = name in active or idle < WORKSPACE_IDLE_SECONDS
+        for dirpath, _, filenames in os.walk(workspace_dir):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                total += stat.st_size
+                if not in_use and filename.lower().endswith(LARGE_ARTIFACT_EXTENSIONS):
+                    candidates.append((max(stat.st_atime, stat.st_mtime), stat.st_size, path))
+
+    removed_files = 0
+    for _, size, path in sorted(candidates):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            removed_files += 1
+        except OSError:
+            continue
+    return removed_workspaces, removed_files
+
+def _janitor_loop(get_active_session_ids, interval):
+    while True:
+        try:
+            active = get_active_session_ids() if get_active_session_ids else None
+            removed_workspaces, removed_files = clean_workspaces(active_session_ids=active)
+            if removed_workspaces or removed_files:
+                print(f"已清理 {removed_workspaces} 个过期工作区，淘汰 {removed_files} 个文件")
+        except Exception:
+            # 任何错误都不能结束清理线程，否则本进程此后不再执行配额淘汰
+            print("清理工作区失败:")
+            traceback.print_exc()
+        time.sleep(interval)
+
+def start_workspace_janitor(get_active_session_ids=None, interval=JANITOR_INTERVAL):
+    """
+    启动后台清理线程（每个进程只启动一次），定期执行 clean_workspaces
+
+    Args:
+        get_active_session_ids: 返回仍在连接的会话ID列表的函数，无法获取时返回None
+        interval: 执行间隔（秒）
+    """
+    global _JANITOR_THREAD
+    with _JANITOR_LOCK:
+        if _JANITOR_THREAD is None:
+            _JANITOR_THREAD = threading.Thread(
+                target=_janitor_loop, args=(get_active_session_ids, interval), daemon=True
+            )
+            _JANITOR_THREAD.start()
+        return _JANITOR_THREAD